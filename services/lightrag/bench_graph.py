@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Graph Benchmark для CORTEX
+Сравнение: NetworkX (как NetworkXStorage LightRAG) против CSR-массивов (csr_graph.py)
+
+Синтетический граф сущностей (предпочтительное присоединение, ~2 ребра на
+сущность, как relationships в индексе CORTEX). Для каждого бэкенда:
+
+- local   — степени top_k сущностей, их рёбра и степени этих рёбер
+            (_get_node_data + _find_most_related_edges_from_entities)
+- global  — степени концов top_k рёбер
+- expand  — окрестность 2 шага от top_k сущностей
+- popular — get_popular_labels(300): ранжирование всех узлов по степени
+
+Память — структура графа (узлы + смежность, без атрибутов): tracemalloc
+для NetworkX, размер массивов + таблица имён для CSR.
+
+Usage:
+    python bench_graph.py
+    python bench_graph.py --entities 10000 100000 --top-k 60 --runs 20
+"""
+
+import argparse
+import gc
+import random
+import statistics
+import time
+import tracemalloc
+
+import networkx as nx
+import numpy as np
+
+from csr_graph import CSRGraph
+
+
+def make_graph(entities: int, seed: int = 42) -> nx.Graph:
+    """Граф со степенным распределением: популярные сущности связаны с многими."""
+    rng = random.Random(seed)
+    graph = nx.Graph()
+    targets = []
+    for i in range(entities):
+        name = f"ENTITY {i}"
+        graph.add_node(name)
+        for _ in range(2 if i > 2 else 0):
+            other = rng.choice(targets) if rng.random() < 0.7 else f"ENTITY {rng.randrange(i)}"
+            if other != name:
+                graph.add_edge(name, other)
+                targets.extend((name, other))
+        targets.append(name)
+    return graph
+
+
+# ---------------- NetworkX: то же, что делает NetworkXStorage ----------------
+
+def nx_local(graph: nx.Graph, names: list[str]):
+    degrees = {name: graph.degree(name) if graph.has_node(name) else 0 for name in names}
+    edges, seen = [], set()
+    for name in names:
+        for edge in graph.edges(name):
+            key = tuple(sorted(edge))
+            if key not in seen:
+                seen.add(key)
+                edges.append(key)
+    edge_degrees = {(u, v): graph.degree(u) + graph.degree(v) for u, v in edges}
+    return degrees, edge_degrees
+
+
+def nx_global(graph: nx.Graph, pairs: list[tuple[str, str]]):
+    return {(u, v): graph.degree(u) + graph.degree(v) for u, v in pairs}
+
+
+def nx_expand(graph: nx.Graph, names: list[str], hops: int):
+    visited = set(names)
+    frontier = set(names)
+    for _ in range(hops):
+        frontier = {n for node in frontier for n in graph.neighbors(node)} - visited
+        visited |= frontier
+    return visited
+
+
+def nx_popular(graph: nx.Graph, limit: int):
+    return [node for node, _ in sorted(graph.degree(), key=lambda item: (-item[1], str(item[0])))[:limit]]
+
+
+# ---------------- CSR ----------------
+
+def csr_local(csr: CSRGraph, names: list[str]):
+    ids = csr.ids(names)
+    degrees = csr.degree_of(ids)
+    heads, tails, edge_ids = csr.neighbors(ids)
+    edge_ids = np.unique(edge_ids)
+    edge_degrees = csr.degrees[csr.edge_src[edge_ids]] + csr.degrees[csr.edge_dst[edge_ids]]
+    return degrees, edge_degrees
+
+
+def csr_global(csr: CSRGraph, pairs: list[tuple[str, str]]):
+    return csr.degree_of(csr.ids([u for u, _ in pairs])) + csr.degree_of(csr.ids([v for _, v in pairs]))
+
+
+def csr_expand(csr: CSRGraph, names: list[str], hops: int):
+    return csr.expand(csr.ids(names), hops=hops)
+
+
+def structure_bytes(build) -> tuple[object, int]:
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size
+
+
+def timed(fn, runs: int) -> float:
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CORTEX graph backend benchmark (NetworkX vs CSR)")
+    parser.add_argument("--entities", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--top-k", type=int, default=60, help="Entities/relations per query (QueryParam.top_k)")
+    parser.add_argument("--hops", type=int, default=2)
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    print("=" * 78)
+    print("CORTEX GRAPH BENCHMARK: NetworkX vs CSR")
+    print("=" * 78)
+
+    for entities in args.entities:
+        graph = make_graph(entities)
+        # Узлы + смежность без атрибутов: копия только структуры
+        _, nx_bytes = structure_bytes(lambda: nx.Graph(graph.edges))
+        _, csr_bytes = structure_bytes(lambda: CSRGraph.from_networkx(graph))
+        started = time.perf_counter()
+        csr = CSRGraph.from_networkx(graph)
+        build_seconds = time.perf_counter() - started
+
+        rng = random.Random(7)
+        node_names = list(graph.nodes)
+        edge_list = list(graph.edges)
+        queries = [
+            (rng.sample(node_names, args.top_k), rng.sample(edge_list, args.top_k))
+            for _ in range(args.runs)
+        ]
+
+        workloads = [
+            ("local", lambda q: nx_local(graph, q[0]), lambda q: csr_local(csr, q[0])),
+            ("global", lambda q: nx_global(graph, q[1]), lambda q: csr_global(csr, q[1])),
+            (f"expand {args.hops} hops",
+             lambda q: nx_expand(graph, q[0], args.hops), lambda q: csr_expand(csr, q[0], args.hops)),
+            ("popular 300", lambda q: nx_popular(graph, 300), lambda q: csr.top_by_degree(300)),
+        ]
+
+        print(f"\n📊 {entities} entities, {graph.number_of_edges()} relations "
+              f"(CSR build {build_seconds * 1000:.0f}ms)")
+        print("-" * 78)
+        print(f"{'workload':<20} {'networkx ms':>12} {'csr ms':>10} {'speedup':>8}")
+        for name, nx_fn, csr_fn in workloads:
+            # Проверка эквивалентности результатов на первом запросе
+            if name.startswith("expand"):
+                assert len(nx_fn(queries[0])) == len(csr_fn(queries[0]))
+            if name.startswith("popular"):
+                assert nx_fn(queries[0]) == [csr.names[i] for i in csr_fn(queries[0])]
+            query_iter = iter(queries * 2)
+            nx_seconds = timed(lambda: nx_fn(next(query_iter)), args.runs)
+            query_iter = iter(queries * 2)
+            csr_seconds = timed(lambda: csr_fn(next(query_iter)), args.runs)
+            print(f"{name:<20} {nx_seconds * 1000:>12.3f} {csr_seconds * 1000:>10.3f} "
+                  f"{nx_seconds / max(csr_seconds, 1e-9):>7.1f}x")
+        print(f"{'memory (structure)':<20} {nx_bytes / 2**20:>10.1f}MB {csr_bytes / 2**20:>8.1f}MB "
+              f"{nx_bytes / max(csr_bytes, 1):>7.1f}x")
+
+    print("=" * 78)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Lexical Index Benchmark для CORTEX
+BM25 (lexical_index.py) по чанкам: построение, холодная загрузка, досинхронизация, поиск
+
+Чанки — kv_store_text_chunks.json из WORKING_DIR или синтетические (--synthetic N):
+RU/EN словоформы из общего словаря с распределением Ципфа, ~250 слов на чанк.
+Запросы — 2-4 слова из случайного чанка; hit@k — доля запросов, для которых
+исходный чанк попал в top_k (для сравнения: режимы LightRAG тратят на запрос
+эмбеддинг, а local/global — ещё и вызов LLM).
+
+Usage:
+    python bench_lexical.py
+    python bench_lexical.py --synthetic 20000 --top-k 10
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from lexical_index import CHUNKS_FILE, LexicalIndex, load_chunks
+
+if "WORLD_OLLAMA_ROOT" in os.environ:
+    PROJECT_ROOT = Path(os.environ["WORLD_OLLAMA_ROOT"])
+else:
+    PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+
+WORKING_DIR = PROJECT_ROOT / "services" / "lightrag" / "data"
+
+RU_STEMS = ["драйвер", "видеокарт", "настройк", "установк", "разгон", "памят", "процессор", "систем", "обновлени", "ошибк"]
+RU_ENDINGS = ["", "а", "ы", "ов", "ами", "ах", "е", "ой", "и", "ом"]
+EN_STEMS = ["driver", "update", "install", "overclock", "memory", "setting", "library", "render", "shader", "kernel"]
+EN_ENDINGS = ["", "s", "ed", "ing", "er"]
+
+
+def word_codes(consonants: str) -> list[str]:
+    return [a + b for a in consonants for b in consonants]
+
+
+def make_synthetic(count: int, seed: int = 42) -> dict:
+    rng = random.Random(seed)
+    # Слово = основа + буквенный код + окончание: стеммер должен склеить словоформы
+    vocab = [f"{stem}{code}{ending}" for code in word_codes("бвгджзклмнпрстфхцчшщ")
+             for stem in RU_STEMS for ending in RU_ENDINGS]
+    vocab += [f"{stem}{code}{ending}" for code in word_codes("bcdfghjklmnpqrstvwxz")
+              for stem in EN_STEMS for ending in EN_ENDINGS]
+    rng.shuffle(vocab)
+    weights = [1.0 / (rank + 1) for rank in range(len(vocab))]
+    return {
+        f"chunk-{i}": {
+            "content": " ".join(rng.choices(vocab, weights, k=250)),
+            "full_doc_id": f"doc-{i // 10}",
+        }
+        for i in range(count)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CORTEX BM25 lexical index benchmark")
+    parser.add_argument("--working-dir", type=Path, default=WORKING_DIR)
+    parser.add_argument("--synthetic", type=int, default=0, help="Use N synthetic chunks instead of the store")
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    if args.synthetic:
+        chunks = make_synthetic(args.synthetic)
+        source = f"synthetic x{args.synthetic}"
+    else:
+        path = args.working_dir / CHUNKS_FILE
+        if not path.exists():
+            print(f"[ERROR] {path} не найден (используйте --synthetic N)")
+            return
+        chunks = load_chunks(path)
+        source = str(path)
+
+    rng = random.Random(7)
+    samples = rng.sample(sorted(chunks), min(args.queries, len(chunks)))
+    queries = []
+    for chunk_id in samples:
+        words = chunks[chunk_id]["content"].split()
+        start = rng.randrange(max(1, len(words) - 4))
+        queries.append((chunk_id, " ".join(words[start:start + rng.randint(2, 4)])))
+
+    print("=" * 78)
+    print("CORTEX LEXICAL INDEX BENCHMARK: BM25")
+    print("=" * 78)
+    print(f"📂 {source}: {len(chunks)} chunks")
+
+    tmp = Path(tempfile.mkdtemp())
+    try:
+        with open(tmp / CHUNKS_FILE, 'w', encoding='utf-8') as f:
+            json.dump(chunks, f, ensure_ascii=False)
+
+        index = LexicalIndex(tmp)
+        started = time.perf_counter()
+        index.refresh()
+        build_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        cold = LexicalIndex(tmp)
+        cold.load()
+        load_seconds = time.perf_counter() - started
+
+        timings, hits = [], 0
+        for chunk_id, query in queries:
+            started = time.perf_counter()
+            found = index.search(query, args.top_k)
+            timings.append(time.perf_counter() - started)
+            hits += any(hit == chunk_id for hit, _ in found)
+        stats = index.stats()
+
+        # Досинхронизация после задачи ингеста: удалён один документ
+        doc_id = next(iter(chunks.values()))["full_doc_id"]
+        removed = {chunk_id for chunk_id, chunk in chunks.items() if chunk["full_doc_id"] == doc_id}
+        with open(tmp / CHUNKS_FILE, 'w', encoding='utf-8') as f:
+            json.dump({k: v for k, v in chunks.items() if k not in removed}, f, ensure_ascii=False)
+        started = time.perf_counter()
+        index.refresh()
+        resync_seconds = time.perf_counter() - started
+
+        print(f"🔨 build {build_seconds:.2f}s, cold load {load_seconds:.2f}s, "
+              f"resync -{len(removed)} chunks {resync_seconds:.2f}s "
+              f"(chunk store JSON parse included)")
+        print(f"📦 {stats['terms']} terms, {stats['avg_chunk_terms']} terms/chunk, "
+              f"index on disk {stats['file_bytes'] / 2**20:.1f}MB")
+        print(f"🔍 search p50 {statistics.median(timings) * 1000:.3f}ms, "
+              f"p95 {sorted(timings)[int(len(timings) * 0.95)] * 1000:.3f}ms, "
+              f"hit@{args.top_k} {hits / len(queries):.3f}")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    print("=" * 78)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Rerank Benchmark для CORTEX
+Сравнение латентности: LLM rerank (generate на документ), listwise LLM rerank
+(один generate на список) и embedding rerank (косинус)
+
+Кандидаты — фрагменты документов из library/raw_documents (как чанки LightRAG).
+Требует запущенный Ollama с mistral-small:latest и nomic-embed-text:latest.
+
+Usage:
+    python bench_rerank.py --docs 20 --runs 3
+    python bench_rerank.py --skip-llm --docs 100
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import time
+from pathlib import Path
+
+from ollama import AsyncClient
+
+from rerankers import embedding_rerank, llm_pointwise_rerank, llm_listwise_rerank
+
+if "WORLD_OLLAMA_ROOT" in os.environ:
+    PROJECT_ROOT = Path(os.environ["WORLD_OLLAMA_ROOT"])
+else:
+    PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+
+LIBRARY_DIR = PROJECT_ROOT / "library" / "raw_documents"
+OLLAMA_BASE_URL = "http://localhost:11434"
+LLM_MODEL = "mistral-small:latest"
+EMBEDDING_MODEL = "nomic-embed-text:latest"
+CHUNK_CHARS = 1200
+
+QUERIES = [
+    "Что такое принцип дробления в архитектуре агента?",
+    "Как работает амортизация ошибок?",
+    "MSI Afterburner memory clock overclock",
+]
+
+
+def load_candidates(limit: int) -> list[str]:
+    chunks = []
+    for path in sorted(LIBRARY_DIR.glob("*.txt")):
+        text = path.read_text(encoding="utf-8", errors="ignore")
+        chunks.extend(text[i:i + CHUNK_CHARS] for i in range(0, len(text), CHUNK_CHARS))
+        if len(chunks) >= limit:
+            break
+    return [chunk for chunk in chunks if chunk.strip()][:limit]
+
+
+def summarize(name: str, timings: list[float]) -> str:
+    ordered = sorted(timings)
+    p95 = ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))]
+    return (f"{name:<12} runs={len(timings):<3} mean={statistics.mean(timings) * 1000:>10.1f} ms"
+            f"  p95={p95 * 1000:>10.1f} ms")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="CORTEX rerank latency benchmark")
+    parser.add_argument("--docs", type=int, default=20, help="Candidates per query")
+    parser.add_argument("--runs", type=int, default=3, help="Repetitions per query")
+    parser.add_argument("--top-n", type=int, default=5)
+    parser.add_argument("--skip-llm", action="store_true", help="Only benchmark embedding rerank")
+    args = parser.parse_args()
+
+    client = AsyncClient(host=OLLAMA_BASE_URL)
+    documents = load_candidates(args.docs)
+    print("=" * 60)
+    print("CORTEX RERANK BENCHMARK")
+    print("=" * 60)
+    print(f"📂 Library: {LIBRARY_DIR}")
+    print(f"📄 Candidates: {len(documents)} x {CHUNK_CHARS} chars, queries: {len(QUERIES)}")
+    print("=" * 60)
+
+    async def embed(texts):
+        response = await client.embed(model=EMBEDDING_MODEL, input=texts)
+        return response["embeddings"]
+
+    async def generate(prompt):
+        response = await client.generate(model=LLM_MODEL, prompt=prompt)
+        return response["response"]
+
+    # Прогрев моделей, чтобы не мерить холодную загрузку
+    await embed(["warmup"])
+    if not args.skip_llm:
+        await generate("ok")
+
+    timings = {"embedding": [], "llm": [], "listwise": []}
+    overlaps = {"embedding": [], "listwise": []}
+    for query in QUERIES:
+        for _ in range(args.runs):
+            started = time.perf_counter()
+            by_embedding = await embedding_rerank(embed, query, documents, args.top_n)
+            timings["embedding"].append(time.perf_counter() - started)
+
+        if args.skip_llm:
+            continue
+        for _ in range(args.runs):
+            started = time.perf_counter()
+            by_llm = await llm_pointwise_rerank(generate, query, documents, args.top_n)
+            timings["llm"].append(time.perf_counter() - started)
+
+        for _ in range(args.runs):
+            started = time.perf_counter()
+            by_listwise = await llm_listwise_rerank(generate, query, documents, args.top_n)
+            timings["listwise"].append(time.perf_counter() - started)
+
+        top_llm = {item["index"] for item in by_llm}
+        for name, ranked in (("embedding", by_embedding), ("listwise", by_listwise)):
+            top = {item["index"] for item in ranked}
+            overlaps[name].append(len(top & top_llm) / max(1, args.top_n))
+
+    print(summarize("embedding", timings["embedding"]))
+    if timings["llm"]:
+        print(summarize("llm", timings["llm"]))
+        print(summarize("listwise", timings["listwise"]))
+        for name in ("embedding", "listwise"):
+            speedup = statistics.mean(timings["llm"]) / statistics.mean(timings[name])
+            print(f"⚡ {name} vs llm: x{speedup:.1f} faster, "
+                  f"top-{args.top_n} overlap {statistics.mean(overlaps[name]):.2f}")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
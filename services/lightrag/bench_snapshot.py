@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Snapshot Benchmark для CORTEX
+Сравнение: загрузка JSON/GraphML (как в LightRAG) против бинарного снимка
+
+Для каждого хранилища: размер на диске и время загрузки в обоих форматах,
+со сжатием zstd и без. --synthetic N генерирует тестовый WORKING_DIR с N
+сущностями (когда реального индекса нет или нужен больший масштаб).
+
+Usage:
+    python bench_snapshot.py
+    python bench_snapshot.py --working-dir services/lightrag/data --runs 5
+    python bench_snapshot.py --synthetic 10000
+"""
+
+import argparse
+import base64
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from binary_snapshot import BinarySnapshot, source_kind, zstandard, KIND_KV, KIND_VECTORS, KIND_GRAPH
+
+if "WORLD_OLLAMA_ROOT" in os.environ:
+    PROJECT_ROOT = Path(os.environ["WORLD_OLLAMA_ROOT"])
+else:
+    PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+
+WORKING_DIR = PROJECT_ROOT / "services" / "lightrag" / "data"
+EMBEDDING_DIM = 768
+
+
+def load_original(path: Path, kind: str):
+    """Та же работа, что делают загрузчики LightRAG / nano-vectordb / NetworkX."""
+    if kind == KIND_KV:
+        with open(path, 'r', encoding='utf-8-sig') as f:
+            return json.loads(f.read())
+    if kind == KIND_VECTORS:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        data["matrix"] = np.frombuffer(base64.b64decode(data["matrix"]), dtype=np.float32).reshape(
+            -1, data["embedding_dim"]
+        )
+        return data
+    import networkx as nx
+    return nx.read_graphml(path)
+
+
+def make_synthetic(directory: Path, entities: int):
+    import networkx as nx
+
+    rng = random.Random(42)
+    words = [f"term{i}" for i in range(2000)]
+
+    def text(n: int) -> str:
+        return " ".join(rng.choice(words) for _ in range(n))
+
+    chunks = max(1, entities // 5)
+    with open(directory / "kv_store_text_chunks.json", 'w', encoding='utf-8') as f:
+        json.dump({
+            f"chunk-{i}": {"tokens": 300, "content": text(200), "chunk_order_index": i, "full_doc_id": f"doc-{i // 10}"}
+            for i in range(chunks)
+        }, f, ensure_ascii=False, indent=2)
+
+    for name, count in (("entities", entities), ("relationships", entities * 2), ("chunks", chunks)):
+        matrix = np.random.default_rng(1).standard_normal((count, EMBEDDING_DIM), dtype=np.float32)
+        rows = [
+            {"__id__": f"{name}-{i}", "__created_at__": 1700000000, "entity_name": f"E{i}", "content": text(30)}
+            for i in range(count)
+        ]
+        with open(directory / f"vdb_{name}.json", 'w', encoding='utf-8') as f:
+            json.dump({
+                "embedding_dim": EMBEDDING_DIM,
+                "data": rows,
+                "matrix": base64.b64encode(matrix.tobytes()).decode()
+            }, f, ensure_ascii=False)
+
+    graph = nx.Graph()
+    for i in range(entities):
+        graph.add_node(f"E{i}", entity_id=f"E{i}", entity_type="concept", description=text(25), source_id=f"chunk-{i % chunks}")
+    for _ in range(entities * 2):
+        u, v = rng.randrange(entities), rng.randrange(entities)
+        if u != v:
+            graph.add_edge(f"E{u}", f"E{v}", weight=1.0, description=text(15), keywords=text(3), source_id="chunk-0")
+    nx.write_graphml(graph, directory / "graph_chunk_entity_relation.graphml")
+
+
+def timed(fn, runs: int) -> float:
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CORTEX binary snapshot benchmark")
+    parser.add_argument("--working-dir", type=Path, default=WORKING_DIR)
+    parser.add_argument("--synthetic", type=int, default=0, help="Generate a synthetic index with N entities")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        working_dir = args.working_dir
+        if args.synthetic:
+            working_dir = tmp / "data"
+            working_dir.mkdir()
+            print(f"⏳ Generating synthetic index: {args.synthetic} entities...")
+            make_synthetic(working_dir, args.synthetic)
+
+        sources = [p for p in sorted(working_dir.iterdir()) if source_kind(p.name) and p.is_file()]
+        if not sources:
+            print(f"[ERROR] No LightRAG stores in {working_dir}")
+            return
+
+        variants = [("none", BinarySnapshot(tmp / "snapshot-raw", compression="none"))]
+        if zstandard is not None:
+            variants.append(("zstd", BinarySnapshot(tmp / "snapshot-zstd", compression="zstd")))
+
+        print("=" * 78)
+        print("CORTEX SNAPSHOT BENCHMARK")
+        print("=" * 78)
+        print(f"📂 Working dir: {working_dir}")
+        for name, snapshot in variants:
+            started = time.perf_counter()
+            snapshot.write(working_dir)
+            print(f"💾 Snapshot ({name}) written in {time.perf_counter() - started:.2f}s")
+        print("-" * 78)
+        print(f"{'store':<40} {'format':<8} {'size MB':>9} {'load ms':>10} {'speedup':>8}")
+
+        totals = {"original": [0, 0.0]}
+        for path in sources:
+            kind = source_kind(path.name)
+            original_seconds = timed(lambda: load_original(path, kind), args.runs)
+            original_size = path.stat().st_size
+            totals["original"][0] += original_size
+            totals["original"][1] += original_seconds
+            print(f"{path.name:<40} {'source':<8} {original_size / 2**20:>9.2f} {original_seconds * 1000:>10.1f}")
+            for name, snapshot in variants:
+                entry = snapshot.fresh_entry(path, kind)
+                size = sum((snapshot.snapshot_dir / file).stat().st_size for file in entry["files"].values())
+                seconds = timed(lambda: snapshot.load(path, kind), args.runs)
+                total = totals.setdefault(name, [0, 0.0])
+                total[0] += size
+                total[1] += seconds
+                print(f"{'':<40} {name:<8} {size / 2**20:>9.2f} {seconds * 1000:>10.1f} "
+                      f"{original_seconds / max(seconds, 1e-9):>7.1f}x")
+
+        print("-" * 78)
+        original_size, original_seconds = totals["original"]
+        for name, (size, seconds) in totals.items():
+            print(f"{'TOTAL':<40} {name:<8} {size / 2**20:>9.2f} {seconds * 1000:>10.1f} "
+                  f"{original_seconds / max(seconds, 1e-9):>7.1f}x  (disk {size / max(original_size, 1):.0%})")
+        print("=" * 78)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Vector Index Benchmark для CORTEX
+Recall@k и латентность IVF (vector_index.py) против полного перебора NanoVectorDB
+
+Векторы — vdb_*.json из WORKING_DIR или синтетические (--synthetic N):
+смесь "тем" в 768-d, как эмбеддинги nomic-embed-text близких по смыслу
+фрагментов; энергия убывает по измерениям, как у Matryoshka-эмбеддингов
+(для реальной оценки усечения — --store на настоящем индексе). Запросы —
+зашумлённые копии векторов базы. Для каждого формата хранения (--dtype
+float32/float16/int8), усечения (--dims, Matryoshka), nprobe и rescore:
+recall@k относительно перебора, медиана латентности, доля просмотренных
+векторов, размер векторов индекса (диск = память при полном чтении memory-map).
+
+Usage:
+    python bench_vectors.py --store entities
+    python bench_vectors.py --synthetic 100000 --nprobe 4 8 16 32 64
+    python bench_vectors.py --synthetic 10000 --nlist 200 --top-k 60
+    python bench_vectors.py --synthetic 100000 --dtype float32 float16 int8 --rescore 0 4 --nprobe 16
+    python bench_vectors.py --synthetic 100000 --nlist 1 --nprobe 1 --dims 0 128 256 --rescore 0 4 10
+"""
+
+import argparse
+import base64
+import json
+import os
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from vector_index import IVFIndex, VECTOR_DTYPES, brute_force, normalize
+
+if "WORLD_OLLAMA_ROOT" in os.environ:
+    PROJECT_ROOT = Path(os.environ["WORLD_OLLAMA_ROOT"])
+else:
+    PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+
+WORKING_DIR = PROJECT_ROOT / "services" / "lightrag" / "data"
+EMBEDDING_DIM = 768
+
+
+def load_store(path: Path) -> np.ndarray:
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    matrix = np.frombuffer(base64.b64decode(data["matrix"]), dtype=np.float32)
+    return normalize(matrix.reshape(-1, data["embedding_dim"])).astype(np.float32)
+
+
+def make_synthetic(count: int, dim: int = EMBEDDING_DIM, seed: int = 42) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    topics = normalize(rng.standard_normal((max(1, count // 50), dim), dtype=np.float32))
+    vectors = topics[rng.integers(0, len(topics), count)]
+    vectors = vectors + rng.standard_normal((count, dim), dtype=np.float32) * (1.5 / np.sqrt(dim))
+    # Первые измерения несут больше энергии (как у обученных с Matryoshka loss)
+    spectrum = 1.0 / np.sqrt(1.0 + np.arange(dim, dtype=np.float32) / 32.0)
+    return normalize(vectors * spectrum).astype(np.float32)
+
+
+def make_queries(matrix: np.ndarray, count: int, seed: int = 7) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    base = matrix[rng.integers(0, len(matrix), count)]
+    noise = rng.standard_normal(base.shape, dtype=np.float32) * (1.0 / np.sqrt(matrix.shape[1]))
+    return normalize(base + noise).astype(np.float32)
+
+
+def median_ms(fn, queries: np.ndarray) -> tuple[float, list]:
+    timings, results = [], []
+    for query in queries:
+        started = time.perf_counter()
+        results.append(fn(query))
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CORTEX IVF vs brute-force benchmark")
+    parser.add_argument("--working-dir", type=Path, default=WORKING_DIR)
+    parser.add_argument("--store", default="entities", help="entities | relationships | chunks")
+    parser.add_argument("--synthetic", type=int, default=0, help="Use N synthetic vectors instead of a store")
+    parser.add_argument("--nlist", type=int, default=0, help="0 = 4*sqrt(N)")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16, 32, 64])
+    parser.add_argument("--dtype", nargs="+", choices=VECTOR_DTYPES, default=["float32"])
+    parser.add_argument("--dims", type=int, nargs="+", default=[0],
+                        help="Matryoshka: index only the first N dimensions (0 = all)")
+    parser.add_argument("--rescore", type=int, nargs="+", default=[0],
+                        help="Candidates per top_k rescored with float32 vectors (0 = off)")
+    parser.add_argument("--top-k", type=int, default=40)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    if args.synthetic:
+        matrix = make_synthetic(args.synthetic)
+        source = f"synthetic x{args.synthetic}"
+    else:
+        path = args.working_dir / f"vdb_{args.store}.json"
+        if not path.exists():
+            print(f"[ERROR] {path} не найден (используйте --synthetic N)")
+            return
+        matrix = load_store(path)
+        source = str(path)
+    queries = make_queries(matrix, args.queries)
+
+    print("=" * 78)
+    print("CORTEX VECTOR INDEX BENCHMARK: IVF vs brute force")
+    print("=" * 78)
+    print(f"📂 {source}: {len(matrix)} vectors x {matrix.shape[1]}d, "
+          f"{matrix.nbytes / 2**20:.1f}MB in RAM (brute force)")
+
+    brute_ms, truth = median_ms(lambda q: brute_force(matrix, q, args.top_k)[0], queries)
+    truth = [set(rows.tolist()) for rows in truth]
+
+    def ivf_search(index: IVFIndex, query: np.ndarray, nprobe: int, rescore: int) -> np.ndarray:
+        if not rescore:
+            return index.search(query, args.top_k, nprobe)[0]
+        rows, _ = index.search(query, args.top_k * rescore, nprobe)
+        return rows[np.argsort(-(matrix[rows] @ query))[:args.top_k]]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for dtype, dims in [(dtype, dims) for dtype in args.dtype for dims in args.dims]:
+            started = time.perf_counter()
+            index = IVFIndex.build(
+                Path(tmp) / f"index-{dtype}-{dims}.ivf", matrix, [str(i) for i in range(len(matrix))],
+                nlist=args.nlist, dtype=dtype, dims=dims
+            )
+            build_seconds = time.perf_counter() - started
+            print("-" * 78)
+            print(f"🔨 IVF {dtype} x {index.dims}d: nlist={index.nlist}, build {build_seconds:.2f}s, "
+                  f"vectors {index.vectors.nbytes / 2**20:.1f}MB ({index.vectors.nbytes / matrix.nbytes:.0%}), "
+                  f"index on disk {index.disk_bytes() / 2**20:.1f}MB")
+            print(f"{'search':<24} {'recall@' + str(args.top_k):>10} {'p50 ms':>9} {'speedup':>8} {'scanned':>9}")
+            print(f"{'brute force float32':<24} {1.0:>10.3f} {brute_ms:>9.3f} {1.0:>7.1f}x {1.0:>9.1%}")
+
+            sizes = np.diff(index.offsets)
+            for nprobe in args.nprobe:
+                if nprobe > index.nlist:
+                    continue
+                scanned = statistics.mean(sizes[index.probe_lists(q, nprobe)].sum() for q in queries[:20]) / len(matrix)
+                for rescore in args.rescore:
+                    ivf_ms, found = median_ms(lambda q: ivf_search(index, q, nprobe, rescore), queries)
+                    recall = statistics.mean(
+                        len(expected & set(rows.tolist())) / len(expected) for expected, rows in zip(truth, found)
+                    )
+                    label = f"{dtype}/{index.dims} p{nprobe}" + (f" r{rescore}" if rescore else "")
+                    print(f"{label:<24} {recall:>10.3f} {ivf_ms:>9.3f} "
+                          f"{brute_ms / max(ivf_ms, 1e-9):>7.1f}x {scanned:>9.1%}")
+            del index
+    print("=" * 78)
+
+
+if __name__ == "__main__":
+    main()
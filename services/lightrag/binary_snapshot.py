@@ -0,0 +1,478 @@
+#!/usr/bin/env python3
+"""
+Binary Snapshot для CORTEX
+Компактный бинарный снимок WORKING_DIR: kv-хранилища, векторы, граф
+
+Старт и восстановление шли через GraphML и большие JSON (kv_store_*.json,
+vdb_*.json с base64-матрицей) — медленный разбор и раздутый размер на диске.
+Снимок хранит те же данные так:
+
+- kv_store_*.json  → marshal (dict как есть), опционально zstd
+- vdb_*.json       → матрица .npy (memory-map, без base64) + колонки метаданных
+- graph_*.graphml  → таблица строк-идентификаторов узлов, рёбра как два
+                     массива int32 (.npy), атрибуты узлов/рёбер по колонкам
+
+Снимок используется, только если исходный файл не менялся после записи
+(полный путь + размер + mtime_ns в manifest.json, для небольших хранилищ ещё
+и sha256 содержимого), иначе — обычная загрузка из JSON/GraphML. marshal
+зависит от версии Python, поэтому она тоже проверяется.
+
+write() инкрементальный: хранилища, исходный файл которых не менялся,
+переходят в новый манифест как есть, перезаписываются только изменённые.
+Файлы блоков именуются с номером поколения, manifest.json заменяется
+атомарно, неиспользуемые блоки удаляются после замены.
+
+install_loaders() подменяет функции загрузки LightRAG (json_kv_impl.load_json,
+NetworkXStorage.load_nx_graph, nano_vectordb load_storage) на чтение из снимка.
+"""
+
+import base64
+import hashlib
+import json
+import logging
+import marshal
+import os
+import shutil
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+try:
+    import zstandard
+except ImportError:  # опциональная зависимость: без неё блоки пишутся несжатыми
+    zstandard = None
+
+SNAPSHOT_FORMAT = 2
+MANIFEST_FILE = "manifest.json"
+# Хранилища до этого размера сверяются ещё и по sha256 (mtime может не успеть смениться)
+HASH_MAX_BYTES = 4 * 1024 * 1024
+
+KIND_KV = "kv"
+KIND_VECTORS = "vectors"
+KIND_GRAPH = "graph"
+
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def source_kind(name: str) -> str | None:
+    if name.startswith("kv_store_") and name.endswith(".json"):
+        return KIND_KV
+    if name.startswith("vdb_") and name.endswith(".json"):
+        return KIND_VECTORS
+    if name.startswith("graph_") and name.endswith(".graphml"):
+        return KIND_GRAPH
+    return None
+
+
+# ============================================================
+# КОЛОНКИ
+# ============================================================
+
+def to_columns(rows: list[dict]):
+    """Список словарей → {поле: [значения]}; если наборы ключей различаются — None."""
+    if not rows:
+        return {}
+    fields = list(rows[0])
+    field_set = set(fields)
+    if any(len(row) != len(fields) or set(row) != field_set for row in rows):
+        return None
+    return {field: [row[field] for row in rows] for field in fields}
+
+
+def from_columns(columns: dict, count: int) -> list[dict]:
+    if not columns:
+        return [{} for _ in range(count)]
+    fields = list(columns)
+    return [dict(zip(fields, values)) for values in zip(*(columns[field] for field in fields))]
+
+
+# ============================================================
+# СНИМОК
+# ============================================================
+
+class BinarySnapshot:
+    def __init__(self, snapshot_dir: Path, compression: str = "zstd", level: int = 3):
+        self.snapshot_dir = Path(snapshot_dir)
+        if compression == "zstd" and zstandard is None:
+            logging.warning("[SNAPSHOT] zstandard не установлен — снимок без сжатия")
+            compression = "none"
+        self.compression = compression
+        self.level = level
+        self._manifest = None
+        self._manifest_mtime_ns = None
+        self._aliases = {}  # каталог-копия → каталог, с которого снят снимок
+        self.hits = 0
+        self.misses = 0
+        self.last_write = None
+
+    # ---------- блоки ----------
+
+    def _write_blob(self, directory: Path, name: str, obj) -> str:
+        data = marshal.dumps(obj)
+        if self.compression == "zstd":
+            data = zstandard.ZstdCompressor(level=self.level).compress(data)
+            name += ".zst"
+        (directory / name).write_bytes(data)
+        return name
+
+    def _read_blob(self, name: str):
+        data = (self.snapshot_dir / name).read_bytes()
+        if name.endswith(".zst"):
+            if zstandard is None:
+                raise RuntimeError("snapshot is zstd-compressed but zstandard is not installed")
+            data = zstandard.ZstdDecompressor().decompress(data)
+        return marshal.loads(data)
+
+    # ---------- запись ----------
+
+    def write(self, working_dir: Path) -> dict:
+        """Снимок хранилищ working_dir: перезаписываются только изменённые (синхронно — через to_thread)."""
+        started = time.perf_counter()
+        working_dir = Path(working_dir)
+        self.snapshot_dir.mkdir(parents=True, exist_ok=True)
+        previous = self.manifest() or {"entries": {}}
+        generation = previous.get("generation", 0) + 1
+
+        entries, written, reused = {}, 0, 0
+        for path in sorted(working_dir.iterdir()):
+            kind = source_kind(path.name)
+            if kind is None or not path.is_file():
+                continue
+            key = self.source_key(path)
+            # stat до чтения: если файл изменится во время записи, снимок не совпадёт и не будет использован
+            stat = path.stat()
+            old = previous["entries"].get(key)
+            if old is not None and old["kind"] == kind and self._matches(old, path, stat):
+                entries[key] = old
+                reused += 1
+                continue
+            try:
+                files = getattr(self, f"_write_{kind}")(self.snapshot_dir, path, generation)
+            except Exception as e:
+                logging.warning(f"[SNAPSHOT] Skip {path.name}: {e}")
+                continue
+            entry = {"kind": kind, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "files": files}
+            if stat.st_size <= HASH_MAX_BYTES:
+                entry["sha256"] = file_sha256(path)
+            entries[key] = entry
+            written += 1
+
+        manifest = {
+            "format": SNAPSHOT_FORMAT,
+            "python": list(sys.version_info[:2]),
+            "compression": self.compression,
+            "generation": generation,
+            "created_at": time.time(),
+            "entries": entries
+        }
+        tmp = self.snapshot_dir / f"{MANIFEST_FILE}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=1)
+        os.replace(tmp, self.snapshot_dir / MANIFEST_FILE)
+        self._manifest = None
+        self._remove_unreferenced(entries)
+
+        self.last_write = {
+            "written": written,
+            "reused": reused,
+            "seconds": round(time.perf_counter() - started, 3)
+        }
+        logging.info(
+            f"[SNAPSHOT] Wrote {written} stores, reused {reused} in {self.snapshot_dir} "
+            f"in {self.last_write['seconds']:.2f}s"
+        )
+        return manifest
+
+    def _remove_unreferenced(self, entries: dict):
+        referenced = {name for entry in entries.values() for name in entry["files"].values()}
+        for path in self.snapshot_dir.iterdir():
+            if path.name == MANIFEST_FILE or path.name in referenced or not path.is_file():
+                continue
+            try:
+                path.unlink()
+            except OSError:
+                # Блок ещё открыт (mmap на Windows) — удалится при следующей записи
+                pass
+
+    def _write_kv(self, directory: Path, path: Path, generation: int) -> dict:
+        with open(path, 'r', encoding='utf-8-sig') as f:
+            data = json.load(f)
+        return {"data": self._write_blob(directory, f"{path.stem}.{generation}.kv.bin", data)}
+
+    def _write_vectors(self, directory: Path, path: Path, generation: int) -> dict:
+        with open(path, 'r', encoding='utf-8') as f:
+            storage = json.load(f)
+        dim = storage["embedding_dim"]
+        matrix = np.frombuffer(base64.b64decode(storage["matrix"]), dtype=np.float32).reshape(-1, dim)
+        rows = storage.get("data", [])
+        extra = {k: v for k, v in storage.items() if k not in ("embedding_dim", "data", "matrix")}
+        columns = to_columns(rows)
+        matrix_name = f"{path.stem}.{generation}.matrix.npy"
+        np.save(directory / matrix_name, np.ascontiguousarray(matrix))
+        meta = {"embedding_dim": dim, "count": len(rows), "extra": extra}
+        if columns is None:
+            meta["rows"] = rows
+        else:
+            meta["columns"] = columns
+        return {"matrix": matrix_name, "meta": self._write_blob(directory, f"{path.stem}.{generation}.meta.bin", meta)}
+
+    def _write_graph(self, directory: Path, path: Path, generation: int) -> dict:
+        import networkx as nx
+
+        graph = nx.read_graphml(path)
+        nodes = list(graph.nodes)
+        index = {node: i for i, node in enumerate(nodes)}
+        edges = list(graph.edges(data=True))
+        src = np.fromiter((index[u] for u, _, _ in edges), dtype=np.int32, count=len(edges))
+        dst = np.fromiter((index[v] for _, v, _ in edges), dtype=np.int32, count=len(edges))
+
+        node_attrs = [graph.nodes[node] for node in nodes]
+        edge_attrs = [attrs for _, _, attrs in edges]
+        node_columns = to_columns(node_attrs)
+        edge_columns = to_columns(edge_attrs)
+        meta = {
+            "directed": graph.is_directed(),
+            "graph": dict(graph.graph),
+            "nodes": nodes,
+            "node_columns": node_columns,
+            "node_rows": node_attrs if node_columns is None else None,
+            "edge_columns": edge_columns,
+            "edge_rows": edge_attrs if edge_columns is None else None,
+        }
+        prefix = f"{path.stem}.{generation}"
+        np.save(directory / f"{prefix}.src.npy", src)
+        np.save(directory / f"{prefix}.dst.npy", dst)
+        return {
+            "src": f"{prefix}.src.npy",
+            "dst": f"{prefix}.dst.npy",
+            "meta": self._write_blob(directory, f"{prefix}.meta.bin", meta)
+        }
+
+    # ---------- чтение ----------
+
+    def manifest(self) -> dict | None:
+        path = self.snapshot_dir / MANIFEST_FILE
+        try:
+            mtime_ns = path.stat().st_mtime_ns
+        except FileNotFoundError:
+            self._manifest = None
+            return None
+        if self._manifest is None or mtime_ns != self._manifest_mtime_ns:
+            with open(path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            usable = (
+                manifest.get("format") == SNAPSHOT_FORMAT
+                and manifest.get("python") == list(sys.version_info[:2])
+            )
+            self._manifest = manifest if usable else {"entries": {}}
+            self._manifest_mtime_ns = mtime_ns
+        return self._manifest
+
+    def add_alias(self, directory: Path, source_dir: Path):
+        """Файлы directory — копии файлов source_dir (реплика читателя, с сохранением mtime)."""
+        self._aliases[str(Path(directory).resolve())] = Path(source_dir).resolve()
+
+    def source_key(self, source_path) -> str:
+        """Ключ записи манифеста: полный путь исходного файла (копия → путь оригинала)."""
+        path = Path(source_path).resolve()
+        origin = self._aliases.get(str(path.parent))
+        return str(origin / path.name if origin is not None else path)
+
+    @staticmethod
+    def _matches(entry: dict, path: Path, stat) -> bool:
+        if stat.st_size != entry["size"] or stat.st_mtime_ns != entry["mtime_ns"]:
+            return False
+        return "sha256" not in entry or file_sha256(path) == entry["sha256"]
+
+    def fresh_entry(self, source_path, kind: str) -> dict | None:
+        """Запись манифеста, если исходный файл совпадает со снятым (путь + размер + mtime [+ sha256])."""
+        manifest = self.manifest()
+        if not manifest:
+            return None
+        path = Path(source_path)
+        entry = manifest["entries"].get(self.source_key(path))
+        if entry is None or entry["kind"] != kind:
+            return None
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            return None
+        return entry if self._matches(entry, path, stat) else None
+
+    def is_stale(self, working_dir: Path) -> bool:
+        for path in Path(working_dir).iterdir():
+            kind = source_kind(path.name)
+            if kind and path.is_file() and self.fresh_entry(path, kind) is None:
+                return True
+        return False
+
+    def read_kv(self, entry: dict) -> dict:
+        return self._read_blob(entry["files"]["data"])
+
+    def read_vectors(self, entry: dict, mmap: bool = True) -> dict:
+        meta = self._read_blob(entry["files"]["meta"])
+        matrix = np.load(self.snapshot_dir / entry["files"]["matrix"], mmap_mode="r" if mmap else None)
+        rows = meta.get("rows")
+        if rows is None:
+            rows = from_columns(meta["columns"], meta["count"])
+        return {**meta["extra"], "embedding_dim": meta["embedding_dim"], "data": rows, "matrix": matrix}
+
+    def read_graph(self, entry: dict):
+        import networkx as nx
+
+        meta = self._read_blob(entry["files"]["meta"])
+        src = np.load(self.snapshot_dir / entry["files"]["src"], mmap_mode="r")
+        dst = np.load(self.snapshot_dir / entry["files"]["dst"], mmap_mode="r")
+        nodes = meta["nodes"]
+        node_rows = meta["node_rows"] or from_columns(meta["node_columns"], len(nodes))
+        edge_rows = meta["edge_rows"] or from_columns(meta["edge_columns"], len(src))
+
+        graph = nx.DiGraph() if meta["directed"] else nx.Graph()
+        graph.graph.update(meta["graph"])
+        graph.add_nodes_from(zip(nodes, node_rows))
+        graph.add_edges_from(
+            (nodes[u], nodes[v], attrs) for u, v, attrs in zip(src.tolist(), dst.tolist(), edge_rows)
+        )
+        return graph
+
+    def load(self, source_path, kind: str):
+        """Данные из снимка или None, если снимок для файла отсутствует/устарел."""
+        entry = self.fresh_entry(source_path, kind)
+        if entry is None:
+            self.misses += 1
+            return None
+        try:
+            data = getattr(self, f"read_{kind}")(entry)
+        except Exception as e:
+            logging.warning(f"[SNAPSHOT] Fallback for {Path(source_path).name}: {e}")
+            self.misses += 1
+            return None
+        self.hits += 1
+        return data
+
+    # ---------- восстановление ----------
+
+    def restore(self, working_dir: Path) -> list[str]:
+        """Восстанавливает исходные JSON/GraphML файлы из снимка (например, после потери WORKING_DIR)."""
+        import networkx as nx
+
+        working_dir = Path(working_dir)
+        working_dir.mkdir(parents=True, exist_ok=True)
+        manifest = self.manifest() or {"entries": {}}
+        restored = []
+        for source, entry in manifest["entries"].items():
+            name = Path(source).name
+            target = working_dir / name
+            kind = entry["kind"]
+            if kind == KIND_KV:
+                with open(target, 'w', encoding='utf-8') as f:
+                    json.dump(self.read_kv(entry), f, ensure_ascii=False, indent=2)
+            elif kind == KIND_VECTORS:
+                storage = self.read_vectors(entry, mmap=False)
+                storage["matrix"] = base64.b64encode(
+                    np.ascontiguousarray(storage["matrix"], dtype=np.float32).tobytes()
+                ).decode()
+                with open(target, 'w', encoding='utf-8') as f:
+                    json.dump(storage, f, ensure_ascii=False)
+            elif kind == KIND_GRAPH:
+                nx.write_graphml(self.read_graph(entry), target)
+            restored.append(name)
+        return restored
+
+    def stats(self) -> dict:
+        manifest = self.manifest()
+        size = sum(p.stat().st_size for p in self.snapshot_dir.glob("*") if p.is_file()) \
+            if self.snapshot_dir.exists() else 0
+        return {
+            "path": str(self.snapshot_dir),
+            "compression": self.compression,
+            "stores": len(manifest["entries"]) if manifest else 0,
+            "created_at": manifest.get("created_at") if manifest else None,
+            "size_mb": round(size / 1024 / 1024, 2),
+            "last_write": self.last_write,
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+
+# ============================================================
+# ПОДКЛЮЧЕНИЕ К LIGHTRAG
+# ============================================================
+
+def install_loaders(snapshot: BinarySnapshot) -> list[str]:
+    """Подменяет загрузчики хранилищ LightRAG на чтение из снимка (с откатом на оригинал).
+
+    Возвращает список подключённых хуков; при другой версии LightRAG
+    недостающие точки подключения просто пропускаются.
+    """
+    installed = []
+    try:
+        import lightrag.kg.json_kv_impl as json_kv_impl
+
+        original_load_json = json_kv_impl.load_json
+
+        def load_json(file_name):
+            data = snapshot.load(file_name, KIND_KV)
+            return data if data is not None else original_load_json(file_name)
+
+        json_kv_impl.load_json = load_json
+        installed.append("kv")
+    except (ImportError, AttributeError) as e:
+        logging.warning(f"[SNAPSHOT] kv loader not installed: {e}")
+
+    try:
+        import nano_vectordb.dbs as nano_dbs
+
+        original_load_storage = nano_dbs.load_storage
+
+        def load_storage(file_name):
+            data = snapshot.load(file_name, KIND_VECTORS)
+            return data if data is not None else original_load_storage(file_name)
+
+        nano_dbs.load_storage = load_storage
+        installed.append("vectors")
+    except (ImportError, AttributeError) as e:
+        logging.warning(f"[SNAPSHOT] vector loader not installed: {e}")
+
+    try:
+        from lightrag.kg.networkx_impl import NetworkXStorage
+
+        original_load_nx_graph = NetworkXStorage.load_nx_graph
+
+        def load_nx_graph(file_name):
+            graph = snapshot.load(file_name, KIND_GRAPH)
+            return graph if graph is not None else original_load_nx_graph(file_name)
+
+        NetworkXStorage.load_nx_graph = staticmethod(load_nx_graph)
+        installed.append("graph")
+    except (ImportError, AttributeError) as e:
+        logging.warning(f"[SNAPSHOT] graph loader not installed: {e}")
+
+    return installed
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="CORTEX binary snapshot: write / restore / stats")
+    parser.add_argument("command", choices=["write", "restore", "stats"])
+    parser.add_argument("--working-dir", type=Path, required=True)
+    parser.add_argument("--snapshot-dir", type=Path, required=True)
+    parser.add_argument("--compression", choices=["zstd", "none"], default="zstd")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    snapshot = BinarySnapshot(args.snapshot_dir, compression=args.compression)
+    if args.command == "write":
+        snapshot.write(args.working_dir)
+    elif args.command == "restore":
+        print(f"[OK] Restored: {', '.join(snapshot.restore(args.working_dir)) or '-'}")
+    print(json.dumps(snapshot.stats(), indent=2))
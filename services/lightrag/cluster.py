@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+CORTEX Cluster
+Многопроцессный запуск: один писатель + N читающих воркеров запросов
+
+- writer (CORTEX_ROLE=writer, порт --writer-port): очередь индексации, LightRAG
+  над WORKING_DIR; публикует версию индекса (replication.py), когда очередь
+  опустела, не чаще CORTEX_SNAPSHOT_PUBLISH_INTERVAL
+- readers (CORTEX_ROLE=reader, общий порт --port, uvicorn workers): /query по
+  последней опубликованной версии, перечитывают индекс при новой версии;
+  /insert, /index_library, /jobs и т.п. прозрачно пересылаются писателю
+
+JSON-обработка, обход графа и разбиение на предложения теперь идут на N ядрах.
+Каждый читатель держит свою копию индекса в памяти (RAM ≈ N x размер индекса).
+GPU по-прежнему общий: LLM_MAX_ASYNC — лимит на весь кластер, а не на процесс
+(слоты-файлы в CORTEX_LLM_SLOTS_DIR, см. priority_scheduler.ClusterSlots).
+Приоритеты interactive/bulk действуют внутри процесса; между процессами слот
+получает первый освободивший его опрос. Кэш эмбеддингов пишет только writer,
+читатели открывают его read-only.
+
+Usage:
+    python cluster.py --readers 4
+    python cluster.py --readers 2 --port 8004 --writer-port 8005
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+import urllib.request
+from pathlib import Path
+
+import uvicorn
+
+SERVICE_DIR = Path(__file__).resolve().parent
+
+
+def wait_for_writer(url: str, timeout_seconds: float, process: subprocess.Popen) -> bool:
+    """Читатели ждут первую версию индекса, поэтому писатель должен подняться первым."""
+    deadline = time.monotonic() + timeout_seconds
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            return False
+        try:
+            with urllib.request.urlopen(f"{url}/health", timeout=2):
+                return True
+        except OSError:
+            time.sleep(0.5)
+    return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CORTEX writer + read-only query workers")
+    parser.add_argument("--readers", type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    parser.add_argument("--host", default=os.getenv("CORTEX_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("CORTEX_PORT", "8004")))
+    parser.add_argument("--writer-port", type=int, default=8005)
+    parser.add_argument("--writer-timeout", type=float, default=60.0, help="Seconds to wait for writer /health")
+    args = parser.parse_args()
+
+    writer_url = f"http://127.0.0.1:{args.writer_port}"
+    writer_env = {
+        **os.environ,
+        "CORTEX_ROLE": "writer",
+        "CORTEX_HOST": "127.0.0.1",
+        "CORTEX_PORT": str(args.writer_port)
+    }
+    print(f"=== CORTEX writer → {writer_url} ===")
+    writer = subprocess.Popen([sys.executable, str(SERVICE_DIR / "lightrag_server.py")], env=writer_env)
+    try:
+        if not wait_for_writer(writer_url, args.writer_timeout, writer):
+            print("[ERROR] Writer не запустился — читатели не стартуют")
+            sys.exit(1)
+
+        # Воркеры uvicorn наследуют окружение процесса
+        os.environ.update({
+            "CORTEX_ROLE": "reader",
+            "CORTEX_WRITER_URL": writer_url
+        })
+        print(f"=== CORTEX readers x{args.readers} → http://{args.host}:{args.port} ===")
+        uvicorn.run(
+            "lightrag_server:app",
+            host=args.host,
+            port=args.port,
+            workers=args.readers,
+            app_dir=str(SERVICE_DIR),
+            log_level="info"
+        )
+    finally:
+        writer.terminate()
+        try:
+            writer.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            writer.kill()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+"""
+CSR Graph для CORTEX
+Граф знаний в виде сжатых разреженных строк (CSR) поверх NumPy
+
+NetworkX хранит каждый узел и каждую смежность как Python dict — при росте
+числа сущностей обход графа в local/global и ранжирование по степени
+упираются в интерпретатор и память. Здесь структура графа — массивы:
+
+- names / index     таблица интернирования: имя сущности ↔ целый id
+- indptr / indices  смежность CSR (соседи узла i: indices[indptr[i]:indptr[i+1]])
+- edge_ids          номер ребра для каждой позиции смежности
+- edge_src/edge_dst концы рёбер (int32), ключи (min, max) отсортированы
+                    для векторного поиска ребра по паре узлов
+- degrees           степени (петля считается дважды, как в NetworkX)
+
+Расширение окрестности, степени и поиск рёбер для пачки узлов — один
+проход NumPy вместо цикла по dict.
+
+CSRGraphStorage — бэкенд графа LightRAG (graph_storage="CSRGraphStorage"):
+запись, атрибуты и GraphML-файл остаются за NetworkXStorage, а операции
+чтения запросного пути (степени, рёбра узлов, популярные метки) идут по
+CSR-индексу, который перестраивается лениво после изменений графа.
+"""
+
+import logging
+import time
+
+import numpy as np
+
+try:
+    from lightrag.kg.networkx_impl import NetworkXStorage
+except ImportError:  # бенчмарк и CSRGraph работают и без LightRAG
+    NetworkXStorage = None
+
+STORAGE_NAME = "CSRGraphStorage"
+
+
+def _gather(indptr: np.ndarray, ids: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Позиции смежности для набора узлов: (номер узла в ids, позиция в indices)."""
+    starts = indptr[ids]
+    counts = indptr[ids + 1] - starts
+    total = int(counts.sum())
+    if total == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    owners = np.repeat(np.arange(len(ids)), counts)
+    # Позиция внутри строки = сквозной номер − начало блока этого узла в результате
+    block_starts = np.cumsum(counts) - counts
+    positions = np.arange(total) - np.repeat(block_starts, counts) + np.repeat(starts, counts)
+    return owners, positions
+
+
+class CSRGraph:
+    """Неизменяемая структура неориентированного графа: узлы — int, рёбра — пары int."""
+
+    def __init__(self, names: list[str], edge_src: np.ndarray, edge_dst: np.ndarray):
+        self.names = names
+        self.index = {name: i for i, name in enumerate(names)}
+        n = len(names)
+        self.edge_src = np.asarray(edge_src, dtype=np.int32)
+        self.edge_dst = np.asarray(edge_dst, dtype=np.int32)
+        edges = np.arange(len(self.edge_src), dtype=np.int32)
+
+        self.degrees = (
+            np.bincount(self.edge_src, minlength=n) + np.bincount(self.edge_dst, minlength=n)
+        ).astype(np.int32)
+
+        # Смежность в обе стороны; петля попадает в строку узла один раз
+        loops = self.edge_src == self.edge_dst
+        heads = np.concatenate([self.edge_src, self.edge_dst[~loops]])
+        tails = np.concatenate([self.edge_dst, self.edge_src[~loops]])
+        slots = np.concatenate([edges, edges[~loops]])
+        order = np.argsort(heads, kind="stable")
+        self.indices = tails[order]
+        self.edge_ids = slots[order]
+        self.indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(heads, minlength=n), out=self.indptr[1:])
+
+        keys = self._keys(self.edge_src, self.edge_dst)
+        self._key_order = np.argsort(keys, kind="stable").astype(np.int32)
+        self._sorted_keys = keys[self._key_order]
+        self._name_rank = None
+
+    @classmethod
+    def from_networkx(cls, graph) -> "CSRGraph":
+        # Один проход по смежности NetworkX; каждое ребро берём со стороны меньшего id
+        adjacency = list(graph.adjacency())
+        index = {node: i for i, (node, _) in enumerate(adjacency)}
+        counts = np.fromiter((len(nbrs) for _, nbrs in adjacency), dtype=np.int64, count=len(adjacency))
+        tails = np.fromiter(
+            (index[v] for _, nbrs in adjacency for v in nbrs), dtype=np.int64, count=int(counts.sum())
+        )
+        heads = np.repeat(np.arange(len(adjacency)), counts)
+        once = heads <= tails
+        return cls([str(node) for node, _ in adjacency], heads[once], tails[once])
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    @property
+    def edge_count(self) -> int:
+        return len(self.edge_src)
+
+    def _keys(self, src: np.ndarray, dst: np.ndarray) -> np.ndarray:
+        lo = np.minimum(src, dst).astype(np.int64)
+        hi = np.maximum(src, dst).astype(np.int64)
+        return lo * max(len(self.names), 1) + hi
+
+    # ---------------- поиск по именам ----------------
+
+    def ids(self, names) -> np.ndarray:
+        """Имена → id (−1 для отсутствующих)."""
+        return np.fromiter((self.index.get(name, -1) for name in names), dtype=np.int64, count=len(names))
+
+    def degree_of(self, ids: np.ndarray) -> np.ndarray:
+        """Степени для пачки id (0 для отсутствующих узлов)."""
+        ids = np.asarray(ids, dtype=np.int64)
+        degrees = np.zeros(len(ids), dtype=np.int64)
+        known = ids >= 0
+        degrees[known] = self.degrees[ids[known]]
+        return degrees
+
+    def edge_rows(self, src: np.ndarray, dst: np.ndarray) -> np.ndarray:
+        """Номер ребра для каждой пары id (−1, если ребра или узла нет)."""
+        src = np.asarray(src, dtype=np.int64)
+        dst = np.asarray(dst, dtype=np.int64)
+        found = np.full(len(src), -1, dtype=np.int64)
+        valid = (src >= 0) & (dst >= 0)
+        if not valid.any() or not len(self._sorted_keys):
+            return found
+        keys = self._keys(src[valid], dst[valid])
+        positions = np.searchsorted(self._sorted_keys, keys)
+        positions = np.minimum(positions, len(self._sorted_keys) - 1)
+        hit = self._sorted_keys[positions] == keys
+        rows = np.where(hit, self._key_order[positions], -1)
+        found[valid] = rows
+        return found
+
+    # ---------------- окрестности ----------------
+
+    def neighbors(self, ids: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Все смежности набора узлов: (узел-источник, сосед, номер ребра)."""
+        ids = np.asarray(ids, dtype=np.int64)
+        ids = ids[ids >= 0]
+        owners, positions = _gather(self.indptr, ids)
+        return ids[owners], self.indices[positions], self.edge_ids[positions]
+
+    def expand(self, seeds: np.ndarray, hops: int = 1, limit: int | None = None) -> np.ndarray:
+        """Узлы в пределах hops шагов от seeds (BFS по уровням, seeds первыми)."""
+        seeds = np.unique(np.asarray(seeds, dtype=np.int64))
+        seeds = seeds[seeds >= 0]
+        visited = np.zeros(len(self.names), dtype=bool)
+        visited[seeds] = True
+        levels = [seeds]
+        frontier = seeds
+        for _ in range(hops):
+            if not len(frontier):
+                break
+            _, tails, _ = self.neighbors(frontier)
+            frontier = np.unique(tails[~visited[tails]])
+            visited[frontier] = True
+            levels.append(frontier)
+            if limit is not None and sum(len(level) for level in levels) >= limit:
+                break
+        result = np.concatenate(levels)
+        return result[:limit] if limit is not None else result
+
+    # ---------------- ранжирование ----------------
+
+    def name_rank(self) -> np.ndarray:
+        """Порядковый номер имени при сортировке (для детерминированного разрешения ничьих)."""
+        if self._name_rank is None:
+            rank = np.empty(len(self.names), dtype=np.int64)
+            rank[sorted(range(len(self.names)), key=self.names.__getitem__)] = np.arange(len(self.names))
+            self._name_rank = rank
+        return self._name_rank
+
+    def top_by_degree(self, limit: int, ids: np.ndarray | None = None) -> np.ndarray:
+        """id узлов по убыванию степени, при равенстве — по имени (как get_popular_labels)."""
+        if ids is None:
+            ids = np.arange(len(self.names))
+        ids = np.asarray(ids, dtype=np.int64)
+        ids = ids[ids >= 0]
+        if limit <= 0:
+            return ids[:0]
+        if len(ids) > limit:
+            # Сначала отсекаем кандидатов по степени за O(n), сортируем только их
+            cutoff = np.partition(self.degrees[ids], len(ids) - limit)[len(ids) - limit]
+            ids = ids[self.degrees[ids] >= cutoff]
+        order = np.lexsort((self.name_rank()[ids], -self.degrees[ids].astype(np.int64)))
+        return ids[order][:limit]
+
+    def nbytes(self) -> int:
+        arrays = (self.indptr, self.indices, self.edge_ids, self.edge_src, self.edge_dst,
+                  self.degrees, self._key_order, self._sorted_keys)
+        return sum(array.nbytes for array in arrays)
+
+
+# ============================================================
+# БЭКЕНД ГРАФА ДЛЯ LIGHTRAG
+# ============================================================
+
+if NetworkXStorage is not None:
+
+    class CSRGraphStorage(NetworkXStorage):
+        """NetworkXStorage с CSR-индексом для чтения.
+
+        Любая запись увеличивает _generation; индекс перестраивается при первом
+        чтении после изменения (или после перечитывания графа другим процессом).
+        """
+
+        def __post_init__(self):
+            super().__post_init__()
+            self._csr = None
+            self._csr_source = None
+            self._csr_generation = -1
+            self._generation = 0
+            self.csr_builds = 0
+            self.csr_build_seconds = 0.0
+
+        def _touch(self):
+            self._generation += 1
+
+        async def _get_csr(self) -> tuple:
+            graph = await self._get_graph()
+            if self._csr is None or self._csr_source is not graph or self._csr_generation != self._generation:
+                started = time.perf_counter()
+                self._csr = CSRGraph.from_networkx(graph)
+                self._csr_source = graph
+                self._csr_generation = self._generation
+                self.csr_builds += 1
+                self.csr_build_seconds = time.perf_counter() - started
+                logging.info(
+                    f"[CSR] Graph index rebuilt: {len(self._csr)} nodes, {self._csr.edge_count} edges "
+                    f"in {self.csr_build_seconds * 1000:.1f}ms"
+                )
+            return graph, self._csr
+
+        # ---------------- чтение (запросный путь) ----------------
+
+        async def node_degree(self, node_id: str) -> int:
+            _, csr = await self._get_csr()
+            return int(csr.degree_of(csr.ids([node_id]))[0])
+
+        async def edge_degree(self, src_id: str, tgt_id: str) -> int:
+            _, csr = await self._get_csr()
+            return int(csr.degree_of(csr.ids([src_id, tgt_id])).sum())
+
+        async def node_degrees_batch(self, node_ids: list[str]) -> dict[str, int]:
+            _, csr = await self._get_csr()
+            degrees = csr.degree_of(csr.ids(node_ids))
+            return dict(zip(node_ids, degrees.tolist()))
+
+        async def edge_degrees_batch(self, edge_pairs: list[tuple[str, str]]) -> dict[tuple[str, str], int]:
+            _, csr = await self._get_csr()
+            src = csr.degree_of(csr.ids([src for src, _ in edge_pairs]))
+            dst = csr.degree_of(csr.ids([dst for _, dst in edge_pairs]))
+            return {tuple(pair): degree for pair, degree in zip(edge_pairs, (src + dst).tolist())}
+
+        async def get_node_edges(self, source_node_id: str) -> list[tuple[str, str]] | None:
+            _, csr = await self._get_csr()
+            ids = csr.ids([source_node_id])
+            if ids[0] < 0:
+                return None
+            _, tails, _ = csr.neighbors(ids)
+            return [(source_node_id, csr.names[tail]) for tail in tails.tolist()]
+
+        async def get_nodes_edges_batch(self, node_ids: list[str]) -> dict[str, list[tuple[str, str]]]:
+            _, csr = await self._get_csr()
+            result = {node_id: [] for node_id in node_ids}
+            heads, tails, _ = csr.neighbors(csr.ids(list(result)))
+            names = csr.names
+            for head, tail in zip(heads.tolist(), tails.tolist()):
+                result[names[head]].append((names[head], names[tail]))
+            return result
+
+        async def get_nodes_batch(self, node_ids: list[str]) -> dict[str, dict]:
+            graph = await self._get_graph()
+            nodes = graph.nodes
+            return {node_id: dict(nodes[node_id]) for node_id in node_ids if node_id in nodes}
+
+        async def get_edges_batch(self, pairs: list[dict[str, str]]) -> dict[tuple[str, str], dict]:
+            graph = await self._get_graph()
+            result = {}
+            for pair in pairs:
+                edge = graph.edges.get((pair["src"], pair["tgt"]))
+                if edge is not None:
+                    result[(pair["src"], pair["tgt"])] = dict(edge)
+            return result
+
+        async def get_popular_labels(self, limit: int = 300) -> list[str]:
+            _, csr = await self._get_csr()
+            return [csr.names[i] for i in csr.top_by_degree(limit).tolist()]
+
+        # ---------------- запись: NetworkX + инвалидация индекса ----------------
+
+        async def upsert_node(self, node_id: str, node_data: dict[str, str]) -> None:
+            await super().upsert_node(node_id, node_data)
+            self._touch()
+
+        async def upsert_edge(self, source_node_id: str, target_node_id: str, edge_data: dict[str, str]) -> None:
+            await super().upsert_edge(source_node_id, target_node_id, edge_data)
+            self._touch()
+
+        async def upsert_nodes_batch(self, nodes: list[tuple[str, dict[str, str]]]) -> None:
+            await super().upsert_nodes_batch(nodes)
+            self._touch()
+
+        async def upsert_edges_batch(self, edges) -> None:
+            await super().upsert_edges_batch(edges)
+            self._touch()
+
+        async def delete_node(self, node_id: str) -> None:
+            await super().delete_node(node_id)
+            self._touch()
+
+        async def remove_nodes(self, nodes: list[str]):
+            await super().remove_nodes(nodes)
+            self._touch()
+
+        async def remove_edges(self, edges: list[tuple[str, str]]):
+            await super().remove_edges(edges)
+            self._touch()
+
+        async def drop(self) -> dict[str, str]:
+            result = await super().drop()
+            self._touch()
+            return result
+
+        def csr_stats(self) -> dict:
+            return {
+                "nodes": len(self._csr) if self._csr is not None else None,
+                "edges": self._csr.edge_count if self._csr is not None else None,
+                "index_bytes": self._csr.nbytes() if self._csr is not None else None,
+                "builds": self.csr_builds,
+                "last_build_ms": round(self.csr_build_seconds * 1000, 1),
+                "stale": self._csr_generation != self._generation
+            }
+
+
+def register_storage() -> bool:
+    """Регистрирует CSRGraphStorage в реестре хранилищ LightRAG.
+
+    LightRAG проверяет graph_storage по STORAGE_IMPLEMENTATIONS и импортирует
+    класс по STORAGES (абсолютное имя модуля тоже допустимо).
+    """
+    if NetworkXStorage is None:
+        return False
+    try:
+        from lightrag import kg
+    except ImportError:
+        return False
+    implementations = kg.STORAGE_IMPLEMENTATIONS["GRAPH_STORAGE"]["implementations"]
+    if STORAGE_NAME not in implementations:
+        implementations.append(STORAGE_NAME)
+    kg.STORAGE_ENV_REQUIREMENTS.setdefault(STORAGE_NAME, [])
+    kg.STORAGES[STORAGE_NAME] = "csr_graph"
+    return True
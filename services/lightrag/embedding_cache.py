@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Persistent Embedding Cache для CORTEX
+Контентно-адресуемый кэш эмбеддингов на SQLite (float16 BLOB)
+
+Ключ = sha256(model + text), поэтому повторная индексация неизменённой
+библиотеки (/api/reindex, init_index.py) не обращается к Ollama вообще.
+Кэш живёт вне WORKING_DIR и переживает /clear_cache.
+
+В кластере (cluster.py) файл общий: пишет только процесс-писатель, читатели
+открывают его read_only — иначе их INSERT конкурируют за блокировку SQLite
+с индексацией и падают с "database is locked".
+"""
+
+import hashlib
+import sqlite3
+import threading
+from pathlib import Path
+
+import numpy as np
+
+
+class EmbeddingCache:
+    """Дисковый кэш эмбеддингов: sha256(model, text) → вектор float16/float32."""
+
+    def __init__(self, db_path: Path, dtype: str = "float16", read_only: bool = False):
+        self.db_path = Path(db_path)
+        self.dtype = np.dtype(dtype)
+        self.read_only = read_only
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self._lock = threading.Lock()
+        if read_only:
+            # Файл создаёт писатель; mode=ro не даёт этому соединению брать блокировку записи
+            uri = f"{self.db_path.resolve().as_uri()}?mode=ro"
+            self._conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            self._entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            return
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS embeddings (
+                key BLOB PRIMARY KEY,
+                dim INTEGER NOT NULL,
+                dtype TEXT NOT NULL,
+                vector BLOB NOT NULL
+            ) WITHOUT ROWID"""
+        )
+        self._conn.commit()
+        # Число записей держим в памяти, чтобы stats() не делал COUNT(*) на каждый /status
+        self._entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    @staticmethod
+    def make_key(model: str, text: str) -> bytes:
+        digest = hashlib.sha256()
+        digest.update(model.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(text.encode("utf-8"))
+        return digest.digest()
+
+    def get_many(self, model: str, texts: list[str]) -> list:
+        """Возвращает список векторов (list[float]) или None для промахов."""
+        keys = [self.make_key(model, text) for text in texts]
+        found = {}
+        with self._lock:
+            # SQLite ограничивает число параметров запроса — идём порциями
+            for start in range(0, len(keys), 500):
+                part = keys[start:start + 500]
+                placeholders = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT key, dtype, vector FROM embeddings WHERE key IN ({placeholders})",
+                    part
+                ).fetchall()
+                for key, dtype, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=dtype).astype(np.float32).tolist()
+
+        results = [found.get(key) for key in keys]
+        hit_count = sum(1 for vector in results if vector is not None)
+        self.hits += hit_count
+        self.misses += len(results) - hit_count
+        return results
+
+    def put_many(self, model: str, texts: list[str], vectors: list[list[float]]):
+        if self.read_only:
+            return
+        rows = []
+        for text, vector in zip(texts, vectors):
+            array = np.asarray(vector, dtype=self.dtype)
+            rows.append((self.make_key(model, text), int(array.shape[0]), self.dtype.name, array.tobytes()))
+        with self._lock:
+            cursor = self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, dim, dtype, vector) VALUES (?, ?, ?, ?)",
+                rows
+            )
+            self._conn.commit()
+            self._entries += max(cursor.rowcount, 0)
+        self.writes += len(rows)
+
+    def count(self) -> int:
+        return self._entries
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "path": str(self.db_path),
+            "dtype": self.dtype.name,
+            "read_only": self.read_only,
+            "entries": self.count(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "writes": self.writes,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
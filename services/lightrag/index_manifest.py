@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Index Manifest для CORTEX
+Инкрементальная индексация библиотеки по content-hash манифесту
+
+Манифест (WORKING_DIR/index_manifest.json) хранит для каждого проиндексированного
+файла: путь, размер, mtime, sha256 содержимого и doc_id в LightRAG.
+При /index_library и /api/reindex неизменённые файлы пропускаются,
+изменённые переиндексируются, удалённые — удаляются из графа.
+/clear_cache удаляет манифест вместе с индексом, поэтому они не расходятся.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class IndexManifest:
+    """Персистентный манифест: абсолютный путь → {size, mtime, sha256, doc_id, indexed_at}."""
+
+    def __init__(self, manifest_path: Path):
+        self.manifest_path = Path(manifest_path)
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._loaded_mtime = None
+
+    def _reload_if_needed(self):
+        # Файл мог быть удалён (/clear_cache) или заменён — перечитываем по mtime
+        try:
+            mtime = self.manifest_path.stat().st_mtime
+        except FileNotFoundError:
+            self._entries = {}
+            self._loaded_mtime = None
+            return
+        if mtime != self._loaded_mtime:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                self._entries = json.load(f).get("files", {})
+            self._loaded_mtime = mtime
+
+    def _save(self):
+        self.manifest_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.manifest_path.with_suffix(".json.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"version": 1, "files": self._entries}, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.manifest_path)
+        self._loaded_mtime = self.manifest_path.stat().st_mtime
+
+    @staticmethod
+    def key(path: Path) -> str:
+        return str(Path(path).resolve())
+
+    def get(self, path: Path):
+        with self._lock:
+            self._reload_if_needed()
+            return self._entries.get(self.key(path))
+
+    def put(self, path: Path, size: int, mtime: float, sha256: str, doc_id: str):
+        with self._lock:
+            self._reload_if_needed()
+            self._entries[self.key(path)] = {
+                "size": size,
+                "mtime": mtime,
+                "sha256": sha256,
+                "doc_id": doc_id,
+                "indexed_at": time.time()
+            }
+            self._save()
+
+    def remove(self, path: Path):
+        with self._lock:
+            self._reload_if_needed()
+            if self._entries.pop(self.key(path), None) is not None:
+                self._save()
+
+    def plan(self, root: Path, files: list[Path], force: bool = False, recursive: bool = True) -> dict:
+        """Сравнивает текущие файлы под root с манифестом.
+
+        Быстрый путь: совпали size и mtime → файл не читается.
+        Иначе сравнивается sha256 (touch без изменений → skipped).
+        recursive=False — files собраны только из самого root (glob, а не rglob):
+        записи подкаталогов не считаются удалёнными.
+        """
+        started = time.perf_counter()
+        root_key = self.key(root).rstrip(os.sep)
+        added, changed, skipped = [], [], []
+        seen = set()
+        with self._lock:
+            self._reload_if_needed()
+            entries = dict(self._entries)
+
+        for path in files:
+            key = self.key(path)
+            seen.add(key)
+            entry = entries.get(key)
+            if entry is None:
+                added.append(key)
+                continue
+            if force:
+                changed.append(key)
+                continue
+            stat = os.stat(key)
+            if stat.st_size == entry["size"] and stat.st_mtime == entry["mtime"]:
+                skipped.append(key)
+            elif file_sha256(Path(key)) == entry["sha256"]:
+                skipped.append(key)
+                # Содержимое то же — обновляем mtime, чтобы в следующий раз не хэшировать
+                self.put(Path(key), stat.st_size, stat.st_mtime, entry["sha256"], entry["doc_id"])
+            else:
+                changed.append(key)
+
+        if recursive:
+            scanned = [key for key in entries if key.startswith(root_key + os.sep)]
+        else:
+            scanned = [key for key in entries if os.path.dirname(key) == root_key]
+        removed = [key for key in scanned if key not in seen]
+        return {
+            "added": added,
+            "changed": changed,
+            "skipped": skipped,
+            "removed": removed,
+            "scan_seconds": round(time.perf_counter() - started, 3)
+        }
+
+    def __len__(self):
+        with self._lock:
+            self._reload_if_needed()
+            return len(self._entries)
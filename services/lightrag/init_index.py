@@ -33,6 +33,9 @@ DELAY_BETWEEN_CHUNKS = 20  # Seconds (GPU cooling)
 
 # HTTP headers with authentication
 HEADERS = {"X-API-KEY": API_KEY}
+# /insert is queued by default; wait=true keeps the blocking behaviour
+# so the GPU cooldown between chunks still applies
+INSERT_PARAMS = {"wait": "true"}
 
 def wait_for_server(max_attempts=30):
     """Wait for LightRAG server to be ready"""
@@ -75,6 +78,7 @@ def ingest_file(file_path, chunk_index=0):
                 response = requests.post(
                     f"{SERVER_URL}/insert", 
                     json=payload, 
+                    params=INSERT_PARAMS,
                     headers=HEADERS,
                     timeout=300
                 )
@@ -109,6 +113,7 @@ def ingest_file(file_path, chunk_index=0):
                 response = requests.post(
                     f"{SERVER_URL}/insert", 
                     json=payload, 
+                    params=INSERT_PARAMS,
                     headers=HEADERS,
                     timeout=180
                 )
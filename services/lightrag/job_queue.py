@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+"""
+Ingestion Job Queue для CORTEX
+Персистентная очередь задач индексации (SQLite) + фоновый воркер
+
+/insert, /insert_batch, /index_library и /api/reindex ставят задачу в очередь
+и сразу возвращают job_id. Воркер обрабатывает задачи по одной, документ за
+документом, записывая время и ошибку для каждого документа. После падения
+процесса незавершённые задачи возвращаются в очередь и продолжаются с первого
+необработанного документа.
+"""
+
+import asyncio
+import inspect
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+
+DOC_PENDING = "pending"
+DOC_DONE = "done"
+DOC_FAILED = "failed"
+
+# Пауза перед повтором, если цикл воркера упал (например, SQLite недоступен)
+WORKER_RETRY_SECONDS = 5.0
+
+
+class JobStore:
+    """SQLite-хранилище задач и их документов (переживает рестарт процесса)."""
+
+    def __init__(self, db_path: Path):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                status TEXT NOT NULL,
+                params TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL,
+                error TEXT
+            );
+            CREATE TABLE IF NOT EXISTS job_documents (
+                job_id TEXT NOT NULL,
+                idx INTEGER NOT NULL,
+                name TEXT NOT NULL,
+                text TEXT,
+                status TEXT NOT NULL,
+                seconds REAL,
+                error TEXT,
+                PRIMARY KEY (job_id, idx)
+            );
+            CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at);
+            """
+        )
+        self._conn.commit()
+
+    def create(self, kind: str, documents: list[dict], params: dict = None) -> str:
+        """documents: [{"name": ..., "text": ... | None}] — text=None означает чтение файла name."""
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, kind, status, params, created_at) VALUES (?, ?, ?, ?, ?)",
+                (job_id, kind, JOB_QUEUED, json.dumps(params or {}, ensure_ascii=False), time.time())
+            )
+            self._conn.executemany(
+                "INSERT INTO job_documents (job_id, idx, name, text, status) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (job_id, idx, doc["name"], doc.get("text"), DOC_PENDING)
+                    for idx, doc in enumerate(documents)
+                ]
+            )
+            self._conn.commit()
+        return job_id
+
+    def requeue_interrupted(self) -> int:
+        """Задачи, оставшиеся в running после падения, снова ставятся в очередь."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = ? WHERE status = ?", (JOB_QUEUED, JOB_RUNNING)
+            )
+            self._conn.commit()
+            return cursor.rowcount
+
+    def next_queued(self):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1", (JOB_QUEUED,)
+            ).fetchone()
+        return row["id"] if row else None
+
+    def mark_running(self, job_id: str):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, started_at = COALESCE(started_at, ?) WHERE id = ?",
+                (JOB_RUNNING, time.time(), job_id)
+            )
+            self._conn.commit()
+
+    def pending_documents(self, job_id: str) -> list[dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT idx, name, text FROM job_documents WHERE job_id = ? AND status = ? ORDER BY idx",
+                (job_id, DOC_PENDING)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def record_document(self, job_id: str, idx: int, status: str, seconds: float, error: str = None):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE job_documents SET status = ?, seconds = ?, error = ?, text = NULL "
+                "WHERE job_id = ? AND idx = ?",
+                (status, round(seconds, 3), error, job_id, idx)
+            )
+            self._conn.commit()
+
+    def finish(self, job_id: str, error: str = None):
+        with self._lock:
+            failed = self._conn.execute(
+                "SELECT COUNT(*) FROM job_documents WHERE job_id = ? AND status = ?",
+                (job_id, DOC_FAILED)
+            ).fetchone()[0]
+            status = JOB_FAILED if (error or failed) else JOB_COMPLETED
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?, error = ? WHERE id = ?",
+                (status, time.time(), error, job_id)
+            )
+            self._conn.commit()
+
+    def _progress(self, job_id: str) -> dict:
+        rows = self._conn.execute(
+            "SELECT status, COUNT(*) AS n, COALESCE(SUM(seconds), 0) AS seconds "
+            "FROM job_documents WHERE job_id = ? GROUP BY status",
+            (job_id,)
+        ).fetchall()
+        counts = {row["status"]: row["n"] for row in rows}
+        total = sum(counts.values())
+        return {
+            "total": total,
+            "done": counts.get(DOC_DONE, 0),
+            "failed": counts.get(DOC_FAILED, 0),
+            "pending": counts.get(DOC_PENDING, 0),
+            "documents_seconds": round(sum(row["seconds"] for row in rows), 3)
+        }
+
+    def _job_dict(self, row) -> dict:
+        job = {
+            "job_id": row["id"],
+            "kind": row["kind"],
+            "status": row["status"],
+            "params": json.loads(row["params"]),
+            "created_at": row["created_at"],
+            "started_at": row["started_at"],
+            "finished_at": row["finished_at"],
+            "error": row["error"],
+            "progress": self._progress(row["id"])
+        }
+        if row["started_at"]:
+            end = row["finished_at"] or time.time()
+            job["elapsed_seconds"] = round(end - row["started_at"], 3)
+        return job
+
+    def get(self, job_id: str, include_documents: bool = True):
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            job = self._job_dict(row)
+            if include_documents:
+                documents = self._conn.execute(
+                    "SELECT idx, name, status, seconds, error FROM job_documents "
+                    "WHERE job_id = ? ORDER BY idx",
+                    (job_id,)
+                ).fetchall()
+                job["documents"] = [dict(doc) for doc in documents]
+        return job
+
+    def list(self, limit: int = 50, status: str = None) -> list[dict]:
+        with self._lock:
+            if status:
+                rows = self._conn.execute(
+                    "SELECT * FROM jobs WHERE status = ? ORDER BY created_at DESC LIMIT ?",
+                    (status, limit)
+                ).fetchall()
+            else:
+                rows = self._conn.execute(
+                    "SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)
+                ).fetchall()
+            return [self._job_dict(row) for row in rows]
+
+    def queue_depth(self) -> int:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status IN (?, ?)", (JOB_QUEUED, JOB_RUNNING)
+            ).fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class IngestWorker:
+    """Фоновый воркер: забирает задачи из JobStore и обрабатывает по одной.
+
+    process_document(job, document) — корутина индексации одного документа;
+    on_job_finished(job_id) вызывается после каждой задачи (например, сброс кэша);
+    может быть корутиной — ожидающие wait_for получат ответ после её завершения.
+    """
+
+    def __init__(self, store: JobStore, process_document, on_job_finished=None):
+        self.store = store
+        self.process_document = process_document
+        self.on_job_finished = on_job_finished
+        self.current_job_id = None
+        self._wakeup = asyncio.Event()
+        self._waiters: dict[str, list[asyncio.Future]] = {}
+        self._task = None
+
+    def start(self):
+        requeued = self.store.requeue_interrupted()
+        if requeued:
+            logging.warning(f"[JOBS] Requeued {requeued} interrupted job(s) after restart")
+        self._task = asyncio.create_task(self._run())
+        self._wakeup.set()
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def submit(self, kind: str, documents: list[dict], params: dict = None) -> str:
+        job_id = self.store.create(kind, documents, params)
+        self._wakeup.set()
+        return job_id
+
+    async def wait_for(self, job_id: str) -> dict:
+        """Ожидание завершения задачи (для синхронного режима ?wait=true)."""
+        job = self.store.get(job_id, include_documents=False)
+        if job and job["status"] in (JOB_COMPLETED, JOB_FAILED):
+            return self.store.get(job_id)
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(job_id, []).append(future)
+        await future
+        return self.store.get(job_id)
+
+    def abort_waiters(self, error: Exception):
+        """Воркер не будет запущен (сбой старта): ожидающие wait_for получают error."""
+        for futures in self._waiters.values():
+            for future in futures:
+                if not future.done():
+                    future.set_exception(error)
+        self._waiters.clear()
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            try:
+                while (job_id := self.store.next_queued()) is not None:
+                    await self._run_job(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Воркер не должен умирать: иначе очередь встанет, а wait=true зависнет
+                logging.error(f"[JOBS] Worker loop failed, retrying in {WORKER_RETRY_SECONDS:.0f}s: {e}")
+                await asyncio.sleep(WORKER_RETRY_SECONDS)
+                self._wakeup.set()
+
+    async def _run_job(self, job_id: str):
+        self.current_job_id = job_id
+        error = None
+        try:
+            self.store.mark_running(job_id)
+            job = self.store.get(job_id, include_documents=False)
+            logging.info(f"[JOBS] Start {job['kind']} job {job_id} ({job['progress']['pending']} docs)")
+            for document in self.store.pending_documents(job_id):
+                started = time.perf_counter()
+                try:
+                    await self.process_document(job, document)
+                    self.store.record_document(
+                        job_id, document["idx"], DOC_DONE, time.perf_counter() - started
+                    )
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logging.warning(f"[JOBS] {job_id} document {document['name']} failed: {e}")
+                    self.store.record_document(
+                        job_id, document["idx"], DOC_FAILED, time.perf_counter() - started,
+                        f"{type(e).__name__}: {e}"
+                    )
+        except asyncio.CancelledError:
+            # Остановка сервера: задача останется running и будет перезапущена при старте
+            raise
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        finally:
+            self.current_job_id = None
+
+        try:
+            self.store.finish(job_id, error)
+            if self.on_job_finished:
+                result = self.on_job_finished(job_id)
+                if inspect.isawaitable(result):
+                    await result
+        except Exception as e:
+            # Сбой сброса кэша/BM25/снимка не должен останавливать очередь
+            logging.error(f"[JOBS] Post-job handling of {job_id} failed: {e}")
+        finally:
+            for future in self._waiters.pop(job_id, []):
+                if not future.done():
+                    future.set_result(None)
+        logging.info(f"[JOBS] Finished job {job_id}")
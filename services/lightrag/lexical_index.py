@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+"""
+Lexical Index для CORTEX
+Инвертированный индекс BM25 по чанкам LightRAG (kv_store_text_chunks.json)
+
+Все режимы LightRAG требуют эмбеддинга запроса, local/global — ещё и LLM для
+извлечения ключевых слов, поэтому даже поиск точного термина ("MSI Afterburner")
+занимает секунды. BM25 отвечает за миллисекунды без обращений к моделям:
+
+- токенизация RU/EN: слова из букв/цифр, нижний регистр, ё → е, стоп-слова
+- стемминг: лёгкий суффиксный стеммер (русский — упрощённый Snowball, шаги 1, 2, 4;
+  английский — снятие частых окончаний), без внешних зависимостей
+- индекс синхронизируется с хранилищем чанков по id: новые чанки токенизируются,
+  удалённые (adelete_by_doc_id) убираются; неизменённые не пересчитываются
+- постинги и термы чанков сохраняются в WORKING_DIR/lexical_index.marshal и
+  публикуются читателям вместе с остальным индексом
+
+refresh() выполняется в рабочем потоке: токенизация новых чанков идёт
+параллельно с поиском, блокировка держится только на время изменения словарей.
+"""
+
+import heapq
+import json
+import logging
+import marshal
+import math
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from functools import lru_cache
+from pathlib import Path
+
+INDEX_FORMAT = 1
+STEMMER_VERSION = 1
+INDEX_FILE = "lexical_index.marshal"
+CHUNKS_FILE = "kv_store_text_chunks.json"
+
+# ============================================================
+# ТОКЕНИЗАЦИЯ И СТЕММИНГ (RU/EN)
+# ============================================================
+
+TOKEN_RE = re.compile(r"[0-9a-zа-яё]+", re.IGNORECASE)
+CYRILLIC_RE = re.compile(r"[а-я]")
+
+STOPWORDS = frozenset("""
+    a an and are as at be but by for from has have how in is it its of on or that the this to was
+    were what when where which who why will with you your do does can not no if then than so into
+    и в во не что он на я с со как а то все она так его но да ты к у же вы за бы по только ее мне
+    было вот от меня еще нет о из ему теперь когда даже ну вдруг ли если уже или ни быть был него до
+    вас нибудь опять уж вам ведь там потом себя ничего ей может они тут где есть надо ней для мы тебя
+    их чем была сам чтоб без будто чего раз тоже себе под будет ж тогда кто этот того потому этого
+    какой совсем ним здесь этом один почти мой тем чтобы нее сейчас были куда зачем всех никогда можно
+    при наконец два об другой хоть после над больше тот через эти нас про всего них какая много разве
+    три эту моя впрочем хорошо свою этой перед иногда лучше чуть том нельзя такой им более всегда
+    конечно всю между это как какие каким
+""".split())
+
+RU_VOWELS = "аеиоуыэюя"
+
+
+def _endings(*groups: tuple[bool, str]) -> tuple[tuple[str, bool], ...]:
+    """(ending, после а/я) — длинные окончания проверяются первыми."""
+    items = [(ending, after_a) for after_a, words in groups for ending in words.split()]
+    return tuple(sorted(items, key=lambda item: -len(item[0])))
+
+
+RU_PERFECTIVE_GERUND = _endings((True, "в вши вшись"), (False, "ив ивши ившись ыв ывши ывшись"))
+RU_REFLEXIVE = _endings((False, "ся сь"))
+RU_ADJECTIVE = _endings((False, "ее ие ые ое ими ыми ей ий ый ой ем им ым ом его ого ему ому их ых ую юю ая яя ою ею"))
+RU_PARTICIPLE = _endings((True, "ем нн вш ющ щ"), (False, "ивш ывш ующ"))
+RU_VERB = _endings(
+    (True, "ла на ете йте ли й л ем н ло но ет ют ны ть ешь нно"),
+    (False, "ила ыла ена ейте уйте ите или ыли ей уй ил ыл им ым ен ило ыло ено ят ует уют ит ыт ены ить ыть ишь ую ю")
+)
+RU_NOUN = _endings((False, "а ев ов ие ье е иями ями ами еи ии и ией ей ой ий й иям ям ием ем ам ом о у ах иях ях ы ь ию ью ю ия ья я"))
+
+EN_SUFFIXES = (
+    ("ational", "ate"), ("ization", "ize"), ("fulness", "ful"), ("ousness", "ous"), ("iveness", "ive"),
+    ("ations", ""), ("ation", ""), ("ments", ""), ("ment", ""), ("ness", ""), ("ingly", ""),
+    ("ings", ""), ("ing", ""), ("edly", ""), ("ies", "y"), ("ied", "y"), ("ers", ""), ("er", ""),
+    ("ed", ""), ("ly", ""), ("es", ""), ("s", "")
+)
+
+
+def _strip_ending(rv: str, endings: tuple[tuple[str, bool], ...]) -> str | None:
+    for ending, after_a in endings:
+        if rv.endswith(ending):
+            stem = rv[:-len(ending)]
+            if not after_a or stem[-1:] in ("а", "я"):
+                return stem
+    return None
+
+
+def stem_ru(word: str) -> str:
+    """Упрощённый Snowball (русский): окончания снимаются только в RV (после первой гласной)."""
+    position = next((i + 1 for i, ch in enumerate(word) if ch in RU_VOWELS), None)
+    if position is None:
+        return word
+    prefix, rv = word[:position], word[position:]
+
+    stem = _strip_ending(rv, RU_PERFECTIVE_GERUND)
+    if stem is None:
+        rv = _strip_ending(rv, RU_REFLEXIVE) or rv
+        stem = _strip_ending(rv, RU_ADJECTIVE)
+        if stem is not None:
+            stem = _strip_ending(stem, RU_PARTICIPLE) or stem
+        else:
+            stem = _strip_ending(rv, RU_VERB)
+            if stem is None:
+                stem = _strip_ending(rv, RU_NOUN)
+    rv = rv if stem is None else stem
+
+    if rv.endswith("и"):
+        rv = rv[:-1]
+    if rv.endswith("ейше"):
+        rv = rv[:-4]
+    elif rv.endswith("ейш"):
+        rv = rv[:-3]
+    if rv.endswith("нн"):
+        rv = rv[:-1]
+    elif rv.endswith("ь"):
+        rv = rv[:-1]
+    return prefix + rv
+
+
+def stem_en(word: str) -> str:
+    """Снятие частых английских окончаний: drivers/driver → driv, updated/updates → updat."""
+    if len(word) <= 3:
+        return word
+    for suffix, replacement in EN_SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            if suffix == "s" and word.endswith(("ss", "us", "is")):
+                break
+            word = word[:-len(suffix)] + replacement
+            if suffix in ("ing", "ed") and len(word) > 3 and word[-1] == word[-2] and word[-1] not in "lsz":
+                word = word[:-1]
+            break
+    if word.endswith("e") and len(word) > 3:
+        word = word[:-1]
+    return word
+
+
+@lru_cache(maxsize=200_000)
+def stem(token: str) -> str:
+    if token.isdigit() or not token.isalpha():
+        return token
+    return stem_ru(token) if CYRILLIC_RE.search(token) else stem_en(token)
+
+
+def tokenize(text: str) -> list[str]:
+    """Термы текста: нижний регистр, ё → е, без стоп-слов, со стеммингом."""
+    return [
+        stem(token) for token in TOKEN_RE.findall(text.lower().replace("ё", "е"))
+        if token not in STOPWORDS
+    ]
+
+
+def term_frequencies(text: str) -> tuple[int, dict[str, int]]:
+    """(число термов, {терм: частота}); стеммер вызывается один раз на словоформу."""
+    length, counts = 0, {}
+    for token, count in Counter(TOKEN_RE.findall(text.lower().replace("ё", "е"))).items():
+        if token in STOPWORDS:
+            continue
+        term = stem(token)
+        counts[term] = counts.get(term, 0) + count
+        length += count
+    return length, counts
+
+
+def load_chunks(path: Path) -> dict:
+    """kv_store_text_chunks.json: {chunk_id: {"content", "full_doc_id", "file_path", ...}}."""
+    if not path.exists():
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+# ============================================================
+# BM25
+# ============================================================
+
+class LexicalIndex:
+    """BM25 (Okapi) по чанкам одного каталога LightRAG.
+
+    docs: chunk_id → (full_doc_id, длина в термах, термы чанка) — для удаления;
+    postings: терм → {chunk_id: частота}. Оба словаря сохраняются как есть
+    (marshal), поэтому загрузка не требует повторной токенизации.
+    """
+
+    def __init__(self, directory: Path, k1: float = 1.2, b: float = 0.75):
+        self.directory = Path(directory)
+        self.k1 = k1
+        self.b = b
+        self.docs: dict[str, tuple[str, int, tuple[str, ...]]] = {}
+        self.postings: dict[str, dict[str, int]] = {}
+        self.norms: dict[str, float] = {}
+        self.total_length = 0
+        self.synced_at = None
+        self.sync_seconds = 0.0
+        self.searches = 0
+        self._lock = threading.Lock()  # словари индекса: apply/load/save против search
+        self._sync_lock = threading.Lock()  # одна синхронизация за раз
+
+    @property
+    def path(self) -> Path:
+        return self.directory / INDEX_FILE
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    # ---------------- Хранение ----------------
+
+    def load(self) -> bool:
+        if not self.path.exists():
+            return False
+        try:
+            with open(self.path, 'rb') as f:
+                data = marshal.loads(f.read())  # marshal.load(f) читает файл мелкими порциями
+        except (OSError, EOFError, ValueError, TypeError) as e:
+            logging.warning(f"[BM25] Не удалось прочитать {self.path}: {e}")
+            return False
+        if (data.get("format"), data.get("stemmer"), data.get("python")) != (
+            INDEX_FORMAT, STEMMER_VERSION, list(sys.version_info[:2])
+        ):
+            return False
+        with self._lock:
+            self.docs, self.postings = data["docs"], data["postings"]
+            self.total_length = sum(length for _, length, _ in self.docs.values())
+            self._update_norms()
+        return True
+
+    def save(self):
+        with self._lock:
+            data = marshal.dumps({
+                "format": INDEX_FORMAT,
+                "stemmer": STEMMER_VERSION,
+                "python": list(sys.version_info[:2]),
+                "docs": self.docs,
+                "postings": self.postings,
+            })
+        self.directory.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, self.path)
+
+    # ---------------- Синхронизация с хранилищем чанков ----------------
+
+    def refresh(self) -> tuple[int, int]:
+        """Догоняет индекс до kv_store_text_chunks.json своего каталога: (добавлено, удалено).
+
+        Первый вызов сначала читает сохранённый индекс. Токенизация идёт без
+        блокировки поиска, под _lock — только изменение словарей.
+        """
+        with self._sync_lock:
+            started = time.perf_counter()
+            if self.synced_at is None:
+                self.load()
+            added, removed = self.prepare(load_chunks(self.directory / CHUNKS_FILE))
+            with self._lock:
+                self.apply(added, removed)
+            if added or removed or not self.path.exists():
+                self.save()
+            self.synced_at = time.time()
+            self.sync_seconds = time.perf_counter() - started
+            return len(added), len(removed)
+
+    def prepare(self, chunks: dict) -> tuple[list, list]:
+        """Разница с хранилищем чанков: (новые чанки с частотами термов, удалённые id)."""
+        added = [
+            (chunk_id, chunk.get("full_doc_id", ""), *term_frequencies(chunk.get("content", "")))
+            for chunk_id, chunk in chunks.items() if chunk_id not in self.docs
+        ]
+        removed = [chunk_id for chunk_id in self.docs if chunk_id not in chunks]
+        return added, removed
+
+    def apply(self, added: list, removed: list):
+        for chunk_id in removed:
+            _, length, terms = self.docs.pop(chunk_id)
+            self.total_length -= length
+            for term in terms:
+                postings = self.postings[term]
+                del postings[chunk_id]
+                if not postings:
+                    del self.postings[term]
+        for chunk_id, doc_id, length, counts in added:
+            self.docs[chunk_id] = (doc_id, length, tuple(counts))
+            self.total_length += length
+            for term, count in counts.items():
+                self.postings.setdefault(term, {})[chunk_id] = count
+        if added or removed:
+            self._update_norms()
+
+    def _update_norms(self):
+        # Нормировка длины зависит от средней длины чанка — пересчёт для всех
+        average = max(self.total_length / len(self.docs), 1e-9) if self.docs else 1.0
+        self.norms = {
+            chunk_id: self.k1 * (1 - self.b + self.b * length / average)
+            for chunk_id, (_, length, _) in self.docs.items()
+        }
+
+    # ---------------- Поиск ----------------
+
+    def search(self, query: str, top_k: int = 10) -> list[tuple[str, float]]:
+        """Лучшие чанки по BM25: [(chunk_id, score)] по убыванию score."""
+        terms = set(tokenize(query))
+        with self._lock:
+            self.searches += 1
+            count = len(self.docs)
+            if not count or top_k <= 0:
+                return []
+            scores: dict[str, float] = {}
+            k1, norms = self.k1, self.norms
+            for term in terms:
+                postings = self.postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for chunk_id, tf in postings.items():
+                    scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (k1 + 1) / (tf + norms[chunk_id])
+        return heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+
+    def stats(self) -> dict:
+        return {
+            "chunks": len(self.docs),
+            "terms": len(self.postings),
+            "avg_chunk_terms": round(self.total_length / len(self.docs), 1) if self.docs else 0,
+            "searches": self.searches,
+            "last_sync_seconds": round(self.sync_seconds, 3),
+            "synced_at": self.synced_at,
+            "file_bytes": self.path.stat().st_size if self.path.exists() else 0,
+        }
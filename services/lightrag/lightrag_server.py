@@ -7,19 +7,48 @@ LightRAG Server для AI Librarian
 
 import os
 import re
+import sys
+import time
+import json
 import asyncio
+import contextvars
+from collections import Counter, OrderedDict
 from pathlib import Path
-from contextlib import asynccontextmanager
+from contextlib import asynccontextmanager, contextmanager
 from fastapi import FastAPI, HTTPException, Request, status
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse, Response
 from pydantic import BaseModel
 import nest_asyncio
 from lightrag import LightRAG, QueryParam
 from lightrag.llm.ollama import ollama_model_complete, ollama_embed
-from lightrag.utils import EmbeddingFunc
+from lightrag.utils import EmbeddingFunc, compute_mdhash_id
+try:
+    # LightRAG 1.4+: doc_id считается от текста после sanitize_text_for_encoding
+    from lightrag.utils import sanitize_text_for_encoding as clean_text
+except ImportError:
+    from lightrag.utils import clean_text
 import uvicorn
+import httpx
 import logging
 
+from embedding_cache import EmbeddingCache
+from job_queue import JobStore, IngestWorker, JOB_FAILED, DOC_DONE, DOC_FAILED
+from index_manifest import IndexManifest, file_sha256
+from rerankers import embedding_rerank, llm_pointwise_rerank, llm_listwise_rerank, cosine_scores
+from condense import split_sentences, condense_sentences
+from term_expansion import TermExpander
+from metrics import MetricsRegistry, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from timings import StageTimings, SlowQueryLog, request_timings, stage_timer, record_mode
+from model_warmup import ModelKeeper, MODEL_KIND_LLM, MODEL_KIND_EMBEDDING, parse_keep_alive, load_seconds
+from replication import SnapshotPublisher, SnapshotFollower
+from binary_snapshot import BinarySnapshot, install_loaders
+from csr_graph import register_storage as register_csr_storage
+from vector_index import register_storage as register_ivf_storage, IMPORT_ERROR as IVF_IMPORT_ERROR
+from lexical_index import LexicalIndex
+from priority_scheduler import (
+    PriorityScheduler, ClusterSlots, workload_class, WORKLOAD_INTERACTIVE, WORKLOAD_BULK
+)
+
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
 
@@ -68,42 +97,230 @@ EMBEDDING_MODEL = "nomic-embed-text:latest"  # ИСПРАВЛЕНО: добав
 # См. инцидент "Custom Rerank Pipeline crashes CORTEX, 27.11.2025".
 # POST-PROCESSING rerank (строки ~416-431) оставлен для улучшения читаемости ответов.
 RERANK_MODEL = "mistral-small:latest"  # Используем ТОЛЬКО для post-processing (НЕ для retrieval)
+# Retrieval rerank: off | embedding (косинус по nomic, миллисекунды) | llm (generate на документ)
+# | listwise (все кандидаты в одном generate). Переопределяется полем rerank в /query
+RERANK_MODE = os.getenv("CORTEX_RERANK_MODE", "off")
+
+# Удержание моделей в памяти Ollama: keep_alive передаётся в каждый вызов,
+# при старте модели предзагружаются, фоновый пинг не даёт выгрузить простаивающие
+OLLAMA_KEEP_ALIVE = parse_keep_alive(os.getenv("CORTEX_OLLAMA_KEEP_ALIVE", "30m"))
+MODEL_PREWARM = os.getenv("CORTEX_MODEL_PREWARM", "1") != "0"
+KEEP_WARM_INTERVAL_SECONDS = float(os.getenv("CORTEX_KEEP_WARM_INTERVAL", "240"))  # 0 — без пинга
+COLD_LOAD_THRESHOLD_SECONDS = float(os.getenv("CORTEX_COLD_LOAD_THRESHOLD", "1.0"))
 
 # КРИТИЧНО: Ограничение параллелизма для 16GB VRAM
+# В кластере (writer + N reader) лимит общий для всех процессов: см. LLM_SLOTS_DIR
 LLM_MAX_ASYNC = 1  # СТРОГО 1 (не перегружаем GPU)
 
+# Кэш результатов /query (LRU + TTL, сбрасывается при любом изменении индекса)
+QUERY_CACHE_TTL_SECONDS = float(os.getenv("CORTEX_QUERY_CACHE_TTL", "900"))
+QUERY_CACHE_MAX_ENTRIES = int(os.getenv("CORTEX_QUERY_CACHE_MAX_ENTRIES", "256"))
+QUERY_CACHE_MAX_MB = float(os.getenv("CORTEX_QUERY_CACHE_MAX_MB", "64"))
+
+# Стратегия fallback-цепочки: sequential (по умолчанию) или race (параллельный запуск режимов)
+QUERY_STRATEGY_DEFAULT = os.getenv("CORTEX_QUERY_STRATEGY", "sequential")
+QUERY_RACE_CONCURRENCY = int(os.getenv("CORTEX_QUERY_RACE_CONCURRENCY", "3"))
+
+# Сжатие контекста перед переформулированием: relevance (эмбеддинги + SimHash) | legacy
+CONDENSE_MODE = os.getenv("CORTEX_CONDENSE_MODE", "relevance")
+CONDENSE_TOKEN_BUDGET = int(os.getenv("CORTEX_CONDENSE_TOKEN_BUDGET", "600"))
+CONDENSE_SIMHASH_DISTANCE = int(os.getenv("CORTEX_CONDENSE_SIMHASH_DISTANCE", "8"))
+CONDENSE_MAX_SENTENCES = int(os.getenv("CORTEX_CONDENSE_MAX_SENTENCES", "300"))
+
+# Эмбеддинги: батчи через /api/embed и собственный лимит параллелизма
+# (nomic-embed-text дешёвый, его НЕ нужно сериализовать как 22B LLM)
+EMBEDDING_BATCH_SIZE = int(os.getenv("CORTEX_EMBEDDING_BATCH_SIZE", "32"))
+EMBEDDING_MAX_ASYNC = int(os.getenv("CORTEX_EMBEDDING_MAX_ASYNC", "4"))
+
+# Приоритетный планировщик GPU: interactive (/query) раньше bulk (индексация).
+# Реальный лимит параллелизма (LLM_MAX_ASYNC / EMBEDDING_MAX_ASYNC) держит планировщик,
+# внутренняя очередь LightRAG только передаёт вызовы, иначе приоритеты не видны.
+SCHEDULER_AGING_SECONDS = float(os.getenv("CORTEX_SCHEDULER_AGING_SECONDS", "30"))
+LIGHTRAG_PASSTHROUGH_ASYNC = int(os.getenv("CORTEX_LIGHTRAG_PASSTHROUGH_ASYNC", "8"))
+
+# Персистентный кэш эмбеддингов (вне WORKING_DIR — переживает /clear_cache)
+EMBEDDING_CACHE_ENABLED = os.getenv("CORTEX_EMBEDDING_CACHE", "1") != "0"
+EMBEDDING_CACHE_PATH = Path(os.getenv(
+    "CORTEX_EMBEDDING_CACHE_PATH",
+    str(PROJECT_ROOT / "services" / "lightrag" / "cache" / "embeddings.sqlite")
+))
+EMBEDDING_CACHE_DTYPE = os.getenv("CORTEX_EMBEDDING_CACHE_DTYPE", "float16")  # float16 | float32
+
+# Очередь задач индексации (SQLite вне WORKING_DIR — переживает падение и /clear_cache)
+JOBS_DB_PATH = Path(os.getenv(
+    "CORTEX_JOBS_DB",
+    str(PROJECT_ROOT / "services" / "lightrag" / "state" / "ingest_jobs.sqlite")
+))
+INSERT_TIMEOUT_SECONDS = float(os.getenv("CORTEX_INSERT_TIMEOUT", "120"))
+
+# Синонимы RU/EN для расширения запросов (горячая перезагрузка по mtime).
+# По умолчанию — файл из поставки рядом с сервером (не зависит от WORLD_OLLAMA_ROOT)
+TERM_SYNONYMS_PATH = Path(os.getenv(
+    "CORTEX_TERM_SYNONYMS_PATH",
+    str(Path(__file__).resolve().parent / "term_synonyms.json")
+))
+TERM_SYNONYMS_RELOAD_SECONDS = float(os.getenv("CORTEX_TERM_SYNONYMS_RELOAD_SECONDS", "2"))
+
+# Журнал медленных запросов (JSON Lines с ротацией); порог 0 — выключен
+SLOW_QUERY_SECONDS = float(os.getenv("CORTEX_SLOW_QUERY_SECONDS", "20"))
+SLOW_QUERY_LOG_PATH = Path(os.getenv(
+    "CORTEX_SLOW_QUERY_LOG",
+    str(PROJECT_ROOT / "services" / "lightrag" / "logs" / "slow_queries.log")
+))
+SLOW_QUERY_LOG_MAX_MB = float(os.getenv("CORTEX_SLOW_QUERY_LOG_MAX_MB", "10"))
+SLOW_QUERY_LOG_BACKUPS = int(os.getenv("CORTEX_SLOW_QUERY_LOG_BACKUPS", "5"))
+
+# Многопроцессный режим (см. cluster.py):
+# single — один процесс, как раньше; writer — индексация + публикация версий индекса;
+# reader — только запросы по последней опубликованной версии, запись уходит писателю
+ROLE_SINGLE, ROLE_WRITER, ROLE_READER = "single", "writer", "reader"
+CORTEX_ROLE = os.getenv("CORTEX_ROLE", ROLE_SINGLE)
+CORTEX_HOST = os.getenv("CORTEX_HOST", "127.0.0.1")
+CORTEX_PORT = int(os.getenv("CORTEX_PORT", "8004"))
+WRITER_URL = os.getenv("CORTEX_WRITER_URL", "http://127.0.0.1:8005")
+SNAPSHOT_ROOT = Path(os.getenv(
+    "CORTEX_SNAPSHOT_ROOT",
+    str(PROJECT_ROOT / "services" / "lightrag" / "state" / "snapshots")
+))
+SNAPSHOT_POLL_SECONDS = float(os.getenv("CORTEX_SNAPSHOT_POLL_SECONDS", "2"))
+# Публикация — копия всего WORKING_DIR: после опустошения очереди ингеста и не чаще
+# раза в INTERVAL; при непрерывной индексации — не реже раза в MAX_DELAY
+SNAPSHOT_PUBLISH_INTERVAL_SECONDS = float(os.getenv("CORTEX_SNAPSHOT_PUBLISH_INTERVAL", "10"))
+SNAPSHOT_PUBLISH_MAX_DELAY_SECONDS = float(os.getenv("CORTEX_SNAPSHOT_PUBLISH_MAX_DELAY", "300"))
+# Общий для процессов кластера лимит LLM_MAX_ASYNC (файловые блокировки слотов)
+LLM_SLOTS_DIR = Path(os.getenv("CORTEX_LLM_SLOTS_DIR", str(SNAPSHOT_ROOT.parent / "llm_slots")))
+# Старый экземпляр LightRAG закрывается не сразу: дожидаемся запросов, начатых до переключения
+REPLICA_RETIRE_SECONDS = float(os.getenv("CORTEX_REPLICA_RETIRE_SECONDS", "60"))
+
+# Бинарный снимок хранилищ (marshal/npy вместо JSON/GraphML) для быстрого холодного старта
+BINARY_SNAPSHOT_ENABLED = os.getenv("CORTEX_BINARY_SNAPSHOT", "1") != "0"
+BINARY_SNAPSHOT_DIR = Path(os.getenv(
+    "CORTEX_BINARY_SNAPSHOT_DIR",
+    str(PROJECT_ROOT / "services" / "lightrag" / "state" / "binary_snapshot")
+))
+BINARY_SNAPSHOT_COMPRESSION = os.getenv("CORTEX_BINARY_SNAPSHOT_COMPRESSION", "zstd")  # zstd | none
+
+# Бэкенд графа: networkx — как раньше; csr — степени, рёбра узлов и популярные
+# метки считаются по CSR-массивам NumPy (csr_graph.py), запись и GraphML — прежние
+GRAPH_BACKEND = os.getenv("CORTEX_GRAPH_BACKEND", "networkx")  # networkx | csr
+
+# Векторный поиск: brute — полный перебор NanoVectorDB; ivf — приближённый IVF-индекс
+# (vector_index.py) с векторами в memory-mapped файле рядом с vdb_*.json
+VECTOR_INDEX = os.getenv("CORTEX_VECTOR_INDEX", "brute")  # brute | ivf
+IVF_PARAMS = {
+    "nlist": int(os.getenv("CORTEX_IVF_NLIST", "0")),  # 0 — 4*sqrt(N)
+    "nprobe": int(os.getenv("CORTEX_IVF_NPROBE", "16")),
+    # Меньше min_rows векторов — перебор быстрее, индекс не строится
+    "min_rows": int(os.getenv("CORTEX_IVF_MIN_ROWS", "5000")),
+    "iterations": int(os.getenv("CORTEX_IVF_TRAIN_ITERATIONS", "10")),
+    "rebuild_growth": float(os.getenv("CORTEX_IVF_REBUILD_GROWTH", "0.1")),
+    # Хранение векторов индекса: float32 | float16 (x0.5) | int8 (x0.25, скалярное квантование)
+    "dtype": os.getenv("CORTEX_IVF_DTYPE", "float32"),
+    # Переоценка rescore*top_k кандидатов по полноточным векторам (0 — по квантованным оценкам)
+    "rescore": int(os.getenv("CORTEX_IVF_RESCORE", "4")),
+    # Matryoshka: индекс по первым N измерениям nomic (128/256), вторая стадия — полные 768-d
+    # по rescore*top_k кандидатам; с CORTEX_IVF_NLIST=1 — двухстадийный перебор без кластеров
+    "dims": int(os.getenv("CORTEX_MATRYOSHKA_DIMS", "0"))
+}
+
+# Лексический индекс BM25 по чанкам (lexical_index.py): режим "lexical" без LLM и эмбеддингов
+LEXICAL_INDEX_ENABLED = os.getenv("CORTEX_LEXICAL_INDEX", "1") != "0"
+LEXICAL_TOP_K = int(os.getenv("CORTEX_LEXICAL_TOP_K", "10"))  # чанков в контексте lexical/fusion
+# Hybrid: сначала слияние оценок BM25 и векторного поиска по чанкам (одно обращение к эмбеддингу,
+# без LLM), при пустом результате — прежняя цепочка local → global → naive
+HYBRID_FUSION = os.getenv("CORTEX_HYBRID_FUSION", "0") != "0"
+FUSION_LEXICAL_WEIGHT = float(os.getenv("CORTEX_FUSION_LEXICAL_WEIGHT", "0.5"))
+FUSION_CANDIDATES = int(os.getenv("CORTEX_FUSION_CANDIDATES", "40"))  # кандидатов из каждого поиска
+
 # ============================================================
 # СОЗДАНИЕ ДИРЕКТОРИЙ
 # ============================================================
 
 WORKING_DIR.mkdir(exist_ok=True, parents=True)
 
+GRAPH_STORAGE = "NetworkXStorage"
+if GRAPH_BACKEND == "csr":
+    if register_csr_storage():
+        GRAPH_STORAGE = "CSRGraphStorage"
+    else:
+        logging.warning("[CSR] CSRGraphStorage недоступен в этой версии LightRAG, используется NetworkXStorage")
+
+VECTOR_STORAGE = "NanoVectorDBStorage"
+if VECTOR_INDEX == "ivf":
+    # Явно запрошенный ivf не подменяем перебором: падаем при старте
+    if not register_ivf_storage():
+        raise RuntimeError(
+            f"CORTEX_VECTOR_INDEX=ivf: IVFVectorDBStorage недоступен ({IVF_IMPORT_ERROR}), "
+            "нужен lightrag-hku>=1.5.7"
+        )
+    VECTOR_STORAGE = "IVFVectorDBStorage"
+
 # Сообщение по умолчанию при отсутствии информации
 NO_INFO_MESSAGE = "Информация не найдена в базе знаний."
 
-# Карта технических терминов для расширения запросов (RU/EN)
-TERM_SYNONYMS = [
-    {
-        "keywords_en": ["memory clock", "memoryclock", "vram clock"],
-        "ru_expansions": [
-            "частота памяти", "скорость памяти GPU",
-            "разгон памяти видеокарты", "память видеокарты разгон"
-        ]
-    },
-    {
-        "keywords_en": ["msi afterburner", "afterburner"],
-        "ru_expansions": [
-            "MSI Afterburner настройки", "разгон через MSI Afterburner",
-            "профили MSI Afterburner"
-        ]
-    },
-    {
-        "keywords_en": ["overclock", "gpu overclock"],
-        "ru_expansions": [
-            "разгон видеокарты", "разгон GPU", "профили разгона"
-        ]
-    }
-]
+# Карта технических терминов для расширения запросов (RU/EN): внешний файл,
+# компилируется в автомат Ахо-Корасик и перечитывается при изменении
+term_expander = TermExpander(TERM_SYNONYMS_PATH, TERM_SYNONYMS_RELOAD_SECONDS)
+
+# BM25 по чанкам WORKING_DIR; reader подменяет его вместе с версией индекса
+lexical_index = LexicalIndex(WORKING_DIR) if LEXICAL_INDEX_ENABLED else None
+
+# ============================================================
+# МЕТРИКИ PROMETHEUS (GET /metrics, без API ключа)
+# ============================================================
+
+metrics = MetricsRegistry()
+METRIC_AUGMENTATION = metrics.histogram(
+    "cortex_query_augmentation_seconds", "Query term expansion (build_augmented_query)"
+)
+METRIC_MODE_ATTEMPT = metrics.histogram(
+    "cortex_query_mode_attempt_seconds", "One LightRAG retrieval attempt in the mode chain",
+    ("mode", "outcome")
+)
+METRIC_REWRITE = metrics.histogram(
+    "cortex_query_rewrite_seconds", "LLM rewrite of the condensed context (RERANK_MODEL generate)",
+    ("endpoint",)
+)
+METRIC_LLM_CALL = metrics.histogram(
+    "cortex_llm_call_seconds", "llm_model_func call including scheduler wait", ("workload",)
+)
+METRIC_EMBEDDING_CALL = metrics.histogram(
+    "cortex_embedding_call_seconds", "embedding_func call including cache lookup", ("workload",)
+)
+METRIC_QUERY_FALLBACKS = metrics.counter(
+    "cortex_query_fallbacks", "Fallbacks to the next mode in the chain", ("from_mode", "to_mode")
+)
+METRIC_QUERY_NO_RESULT = metrics.counter(
+    "cortex_query_no_result", "Queries where every mode in the chain came back empty"
+)
+METRIC_INSERTS = metrics.counter(
+    "cortex_inserts", "Documents ingested successfully", ("kind",)
+)
+METRIC_INSERT_FAILURES = metrics.counter(
+    "cortex_insert_failures", "Documents whose ingestion failed", ("kind",)
+)
+
+METRIC_MODEL_LOAD = metrics.histogram(
+    "cortex_ollama_model_load_seconds", "Ollama load_duration per call (cold start vs resident model)",
+    ("model", "source")
+)
+METRIC_COLD_LOADS = metrics.counter(
+    "cortex_ollama_cold_loads", "Ollama calls whose model load exceeded CORTEX_COLD_LOAD_THRESHOLD",
+    ("model", "source")
+)
+
+
+def record_model_load(model: str, seconds: float, source: str):
+    METRIC_MODEL_LOAD.observe(seconds, model=model, source=source)
+    if seconds >= COLD_LOAD_THRESHOLD_SECONDS:
+        METRIC_COLD_LOADS.inc(model=model, source=source)
+
+slow_query_log = SlowQueryLog(
+    SLOW_QUERY_LOG_PATH,
+    SLOW_QUERY_SECONDS,
+    max_bytes=int(SLOW_QUERY_LOG_MAX_MB * 1024 * 1024),
+    backup_count=SLOW_QUERY_LOG_BACKUPS
+)
 
 def detect_language(text: str) -> str:
     """Простое определение языка (русский/английский) по алфавиту."""
@@ -114,16 +331,13 @@ def detect_language(text: str) -> str:
 
 def build_augmented_query(original_query: str):
     """Расширяет запрос техническими синонимами для перекрытия RU/EN терминов."""
+    with METRIC_AUGMENTATION.time(), stage_timer("augmentation"):
+        return _build_augmented_query(original_query)
+
+
+def _build_augmented_query(original_query: str):
     lang = detect_language(original_query)
-    lowered = original_query.lower()
-    additions = []
-    for entry in TERM_SYNONYMS:
-        if any(keyword in lowered for keyword in entry.get("keywords_en", [])):
-            additions.extend(entry.get("ru_expansions", []))
-        if any(keyword in lowered for keyword in entry.get("keywords_ru", [])):
-            additions.extend(entry.get("en_expansions", []))
-    # Удаляем дубликаты, сохраняя порядок
-    additions = list(dict.fromkeys(additions))
+    additions = term_expander.expand(original_query)
 
     if additions:
         prefix = "Helper keywords" if lang == "en" else "Дополнительные ключевые слова"
@@ -134,11 +348,21 @@ def build_augmented_query(original_query: str):
     return augmented, additions, lang
 
 
+def build_lexical_query(original_query: str, additions: list[str]) -> str:
+    """Запрос для BM25: исходный текст и термины расширения без служебной подписи
+    ("Helper keywords:" / "Дополнительные ключевые слова:") — её слова не ранжируют чанки."""
+    return " ".join([original_query, *additions])
+
+
+MODE_LEXICAL = "lexical"
+
+
 def build_mode_chain(primary_mode: str) -> list[str]:
     """Формирует цепочку режимов с учётом fallback (TRIZ: динамичность).
     
     [PLAN C] Изменено: приоритет режима 'local' для стабильности.
-    Hybrid временно исключён из цепочки из-за нестабильности.
+    Hybrid временно исключён из цепочки из-за нестабильности
+    (кроме CORTEX_HYBRID_FUSION: тогда hybrid — слияние BM25 и векторного поиска).
     """
     preferred = primary_mode or "local"  # [PLAN C] Default: local вместо hybrid
     
@@ -151,7 +375,10 @@ def build_mode_chain(primary_mode: str) -> list[str]:
         base_chain = ["global", "local", "naive"]
     elif preferred == "hybrid":
         # [PLAN C] Hybrid → local (более стабильный режим)
-        base_chain = ["local", "global", "naive"]
+        base_chain = ["hybrid", "local", "global", "naive"] if HYBRID_FUSION else ["local", "global", "naive"]
+    elif preferred == MODE_LEXICAL:
+        # BM25 без LLM и эмбеддингов; нет совпадений — обычная цепочка
+        base_chain = [MODE_LEXICAL, "local", "global", "naive"]
     else:
         base_chain = ["local", "global", "naive"]
     
@@ -176,30 +403,349 @@ def has_meaningful_result(result) -> bool:
     return len(text) >= 60
 
 
-async def execute_query_with_fallbacks(query_text: str, primary_mode: str):
+async def chunks_context(chunk_ids: list[str]) -> str:
+    """Контекст из чанков LightRAG в порядке ранжирования."""
+    if not chunk_ids:
+        return ""
+    chunks = await rag.text_chunks.get_by_ids(chunk_ids)
+    return "\n\n".join(chunk["content"] for chunk in chunks if chunk and chunk.get("content"))
+
+
+async def lexical_context(query_text: str) -> str:
+    """Режим lexical: лучшие чанки по BM25, без обращений к LLM и эмбеддингам.
+
+    query_text — запрос без подписи расширения (build_lexical_query)."""
+    index = lexical_index
+    if index is None:
+        return ""
+    hits = await asyncio.to_thread(index.search, query_text, LEXICAL_TOP_K)
+    return await chunks_context([chunk_id for chunk_id, _ in hits])
+
+
+async def fused_context(query_text: str, lexical_query: str = None) -> str:
+    """Hybrid (CORTEX_HYBRID_FUSION): BM25 + векторный поиск по чанкам.
+
+    Оценки каждого списка нормируются на его максимум и складываются с весами
+    FUSION_LEXICAL_WEIGHT / 1 - FUSION_LEXICAL_WEIGHT: чанк, найденный обоими
+    поисками, поднимается выше найденного одним. BM25 ищет по lexical_query
+    (без подписи расширения), векторный поиск — по query_text.
+    """
+    index = lexical_index
+    lexical_hits = (
+        await asyncio.to_thread(index.search, lexical_query or query_text, FUSION_CANDIDATES) if index else []
+    )
+    vector_hits = await rag.chunks_vdb.query(query_text, top_k=FUSION_CANDIDATES)
+    scores = {}
+    for weight, hits in (
+        (FUSION_LEXICAL_WEIGHT, lexical_hits),
+        (1.0 - FUSION_LEXICAL_WEIGHT, [(hit["id"], hit["distance"]) for hit in vector_hits])
+    ):
+        best = max((score for _, score in hits), default=0.0)
+        for chunk_id, score in hits:
+            if best > 0:
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + weight * score / best
+    ranked = sorted(scores, key=scores.get, reverse=True)[:LEXICAL_TOP_K]
+    return await chunks_context(ranked)
+
+
+async def run_query_mode(query_text: str, mode: str, rerank: str = None, lexical_query: str = None):
+    """Один retrieval-проход LightRAG в заданном режиме (только контекст).
+
+    lexical_query — текст для BM25 (lexical, hybrid-fusion); по умолчанию query_text.
+    """
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        if mode == MODE_LEXICAL:
+            result = await lexical_context(lexical_query or query_text)
+        elif mode == "hybrid" and HYBRID_FUSION:
+            result = await fused_context(query_text, lexical_query)
+        else:
+            result = await rag.aquery(
+                query_text,
+                param=QueryParam(
+                    mode=mode,
+                    top_k=35,  # [Plan C — 64GB RAM] увеличено с 20 до 35 для более широкого кандидата-пула
+                    only_need_context=True,
+                    enable_rerank=(rerank or RERANK_MODE) in RERANK_FUNCS  # [FIX] off → без WARNING о ненастроенной модели
+                )
+            )
+        outcome = "hit" if has_meaningful_result(result) else "empty"
+        return result
+    except asyncio.CancelledError:
+        # Проигравшие режимы в strategy=race
+        outcome = "cancelled"
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        METRIC_MODE_ATTEMPT.observe(elapsed, mode=mode, outcome=outcome)
+        record_mode(mode, elapsed)
+
+
+def record_fallbacks(tried_modes: list[str], found: bool):
+    for from_mode, to_mode in zip(tried_modes, tried_modes[1:]):
+        METRIC_QUERY_FALLBACKS.inc(from_mode=from_mode, to_mode=to_mode)
+    if not found:
+        METRIC_QUERY_NO_RESULT.inc()
+
+
+async def race_query_modes(
+    query_text: str, mode_chain: list[str], concurrency: int, rerank: str = None, lexical_query: str = None
+):
+    """Запускает режимы цепочки параллельно (в пределах бюджета concurrency).
+
+    Победитель выбирается строго в порядке приоритета цепочки: ждём режим №1,
+    если его результат пуст — берём уже идущий режим №2 и т.д. Как только
+    найден осмысленный результат, оставшиеся задачи отменяются.
+    Режим, завершившийся ошибкой, считается пустым: цепочка идёт дальше.
+    tried_modes содержит только режимы, результат которых был реально получен.
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def bounded(mode: str):
+        async with semaphore:
+            return await run_query_mode(query_text, mode, rerank, lexical_query)
+
+    tasks = [asyncio.create_task(bounded(mode)) for mode in mode_chain]
+    tried_modes = []
+    try:
+        for mode, task in zip(mode_chain, tasks):
+            try:
+                result = await task
+            except Exception as e:
+                logging.warning(f"[RACE] Mode {mode} failed, falling through: {e}")
+                result = None
+            tried_modes.append(mode)
+            if has_meaningful_result(result):
+                return result, mode, tried_modes
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+        # Забираем исключения всех задач, в том числе уже завершившихся проигравших
+        # (иначе asyncio пишет "Task exception was never retrieved")
+        await asyncio.gather(*tasks, return_exceptions=True)
+    return None, None, tried_modes
+
+
+async def execute_query_with_fallbacks(
+    query_text: str, primary_mode: str, strategy: str = None, rerank: str = None, lexical_query: str = None
+):
     """Пытаемся получить ответ, переключаясь между режимами поиска.
     
     [PLAN C] Изменения для улучшения baseline:
     - top_k увеличен с 10 до 20 (больше кандидатов)
     - Приоритет режима 'local' для стабильности
-    - enable_rerank=False для подавления WARNING (rerank модель не сконфигурирована)
+    - enable_rerank только при CORTEX_RERANK_MODE=embedding|llm (иначе WARNING о ненастроенной модели)
+
+    strategy="race" запускает всю цепочку параллельно (см. race_query_modes),
+    что убирает лишний последовательный раунд при промахе режима local.
+    rerank выбирает реализацию rerank_model_func для этого запроса.
+    lexical_query — запрос для BM25-режимов без подписи расширения (build_lexical_query).
     """
+    workload_class.set(WORKLOAD_INTERACTIVE)
+    mode_chain = build_mode_chain(primary_mode)
+    rerank_mode.set(rerank or RERANK_MODE)
+    if (strategy or QUERY_STRATEGY_DEFAULT) == "race":
+        result, mode, tried_modes = await race_query_modes(
+            query_text, mode_chain, QUERY_RACE_CONCURRENCY, rerank, lexical_query
+        )
+        record_fallbacks(tried_modes, mode is not None)
+        if mode is not None:
+            return result, mode, tried_modes
+        return NO_INFO_MESSAGE, tried_modes[-1] if tried_modes else primary_mode, tried_modes
+
     tried_modes = []
-    for mode in build_mode_chain(primary_mode):
+    for mode in mode_chain:
         tried_modes.append(mode)
-        result = await rag.aquery(
-            query_text,
-            param=QueryParam(
-                mode=mode,
-                top_k=35,  # [Plan C — 64GB RAM] увеличено с 20 до 35 для более широкого кандидата-пула
-                only_need_context=True,
-                enable_rerank=False  # [FIX] Явно отключаем rerank для подавления WARNING
-            )
-        )
+        result = await run_query_mode(query_text, mode, rerank, lexical_query)
         if has_meaningful_result(result):
+            record_fallbacks(tried_modes, True)
             return result, mode, tried_modes
+    record_fallbacks(tried_modes, False)
     return NO_INFO_MESSAGE, tried_modes[-1] if tried_modes else primary_mode, tried_modes
 
+async def condense_context(result, query: str, mode: str = None) -> str:
+    """[PLAN C] Сжатие контекста перед LLM-переформулированием.
+
+    CONDENSE_MODE=relevance: предложения ранжируются по косинусу с эмбеддингом
+    запроса, почти-дубликаты (SimHash) отбрасываются, лучшие упаковываются в
+    CONDENSE_TOKEN_BUDGET. CONDENSE_MODE=legacy: первые 8 уникальных предложений.
+    Режим lexical всегда сжимается как legacy (без эмбеддингов): чанки уже
+    упорядочены по BM25.
+    """
+    sentences = split_sentences(result)
+    if CONDENSE_MODE == "relevance" and sentences and mode != MODE_LEXICAL:
+        candidates = sentences[:CONDENSE_MAX_SENTENCES]
+        try:
+            vectors = await embedding_func([query] + candidates, context="query")
+            scores = cosine_scores(vectors[0], vectors[1:]).tolist()
+            selected = condense_sentences(
+                candidates, scores, CONDENSE_TOKEN_BUDGET, CONDENSE_SIMHASH_DISTANCE
+            )
+            if selected:
+                return '. '.join(selected) + '.'
+        except Exception as e:
+            logging.warning(f"[CONDENSE] Relevance condensation failed, using legacy: {e}")
+
+    # Ограничиваем контекст топ-8 предложений (из ~20 кандидатов)
+    return '. '.join(sentences[:8]) + '.'
+
+
+def build_rewrite_prompt(user_query: str, context: str) -> str:
+    """Промпт POST-PROCESSING переформулирования (RERANK_MODEL)."""
+    return f"""Ты получил ответ от системы поиска по базе знаний.
+Твоя задача: переформулировать ответ, сделав его более точным и релевантным запросу.
+
+Запрос пользователя: {user_query}
+
+Исходный ответ системы:
+{context}
+
+Переформулируй ответ, сохранив все важные факты, но улучшив структуру и ясность:"""
+
+
+def sse_event(event: str, data: dict) -> str:
+    """Форматирует одно событие Server-Sent Events."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+# ============================================================
+# КЭШ РЕЗУЛЬТАТОВ ЗАПРОСОВ (LRU + TTL + версия индекса)
+# ============================================================
+
+def normalize_query_key(augmented_query: str, mode: str, rerank: str = None) -> str:
+    """Нормализованный ключ кэша: регистр и пробелы не влияют на попадание."""
+    normalized = " ".join(augmented_query.lower().split())
+    return f"{mode or 'local'}|{rerank or RERANK_MODE}::{normalized}"
+
+
+class QueryResultCache:
+    """LRU-кэш ответов /query с TTL и ограничением по памяти.
+
+    Каждая запись привязана к версии индекса: любое изменение индекса
+    (insert, reindex, clear_cache) увеличивает версию и очищает кэш,
+    поэтому устаревший ответ не может быть отдан после переиндексации.
+    """
+
+    def __init__(self, ttl_seconds: float, max_entries: int, max_bytes: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.index_version = 0
+        self._entries = OrderedDict()  # key -> (expires_at, size, payload)
+        self._total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _estimate_size(payload: dict) -> int:
+        return sys.getsizeof(json.dumps(payload, ensure_ascii=False))
+
+    def _drop(self, key: str):
+        _, size, _ = self._entries.pop(key)
+        self._total_bytes -= size
+
+    def get(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, _, payload = entry
+        if expires_at < time.monotonic():
+            self._drop(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return payload
+
+    def put(self, key: str, payload: dict, index_version: int):
+        # Ответ, посчитанный до изменения индекса, не кэшируем
+        if index_version != self.index_version or self.max_entries <= 0:
+            return
+        size = self._estimate_size(payload)
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._drop(key)
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, size, payload)
+        self._total_bytes += size
+        while self._entries and (
+            len(self._entries) > self.max_entries or self._total_bytes > self.max_bytes
+        ):
+            oldest_key = next(iter(self._entries))
+            self._drop(oldest_key)
+            self.evictions += 1
+
+    def invalidate(self, reason: str = ""):
+        self.index_version += 1
+        self.invalidations += 1
+        self._entries.clear()
+        self._total_bytes = 0
+        logging.info(f"[QUERY CACHE] Invalidated (index v{self.index_version}): {reason}")
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "size_bytes": self._total_bytes,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+            "index_version": self.index_version,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations
+        }
+
+
+class SingleFlight:
+    """Объединение одинаковых запросов, выполняющихся одновременно.
+
+    Первый запрос с ключом запускает задачу, остальные ждут её же результат.
+    Задача защищена shield: отключение первого клиента не отменяет ответ
+    для остальных.
+    """
+
+    def __init__(self):
+        self._inflight = {}  # key -> [task, число запросов]
+        self.coalesced_total = 0
+
+    async def run(self, key: str, factory):
+        entry = self._inflight.get(key)
+        if entry is None:
+            task = asyncio.create_task(factory())
+            entry = [task, 1]
+            self._inflight[key] = entry
+            task.add_done_callback(lambda _: self._release(key, entry))
+        else:
+            entry[1] += 1
+            self.coalesced_total += 1
+        result = await asyncio.shield(entry[0])
+        return result, entry[1]
+
+    def _release(self, key: str, entry: list):
+        if self._inflight.get(key) is entry:
+            del self._inflight[key]
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._inflight),
+            "coalesced_total": self.coalesced_total
+        }
+
+
+query_singleflight = SingleFlight()
+
+query_cache = QueryResultCache(
+    ttl_seconds=QUERY_CACHE_TTL_SECONDS,
+    max_entries=QUERY_CACHE_MAX_ENTRIES,
+    max_bytes=int(QUERY_CACHE_MAX_MB * 1024 * 1024)
+)
+
 # ============================================================
 # LLM ОБЕРТКИ ДЛЯ OLLAMA
 # ============================================================
@@ -208,6 +754,45 @@ async def execute_query_with_fallbacks(query_text: str, primary_mode: str):
 from ollama import AsyncClient
 ollama_client = AsyncClient(host=OLLAMA_BASE_URL)
 
+model_keeper = ModelKeeper(
+    ollama_client,
+    {
+        LLM_MODEL: MODEL_KIND_LLM,
+        **({RERANK_MODEL: MODEL_KIND_LLM} if RERANK_MODEL else {}),
+        EMBEDDING_MODEL: MODEL_KIND_EMBEDDING
+    },
+    OLLAMA_KEEP_ALIVE,
+    KEEP_WARM_INTERVAL_SECONDS,
+    on_load=record_model_load
+)
+
+
+def observe_model_call(model: str, response):
+    """Латентность загрузки модели из ответа Ollama — холодный старт виден отдельно."""
+    model_keeper.mark_used(model)
+    seconds = load_seconds(response)
+    if seconds is not None:
+        record_model_load(model, seconds, "call")
+
+# Каждый процесс кластера держит свой планировщик — GPU-лимит между ними через ClusterSlots
+llm_scheduler = PriorityScheduler(
+    "llm", LLM_MAX_ASYNC, SCHEDULER_AGING_SECONDS,
+    cluster_slots=ClusterSlots(LLM_SLOTS_DIR, LLM_MAX_ASYNC) if CORTEX_ROLE != ROLE_SINGLE else None
+)
+embedding_scheduler = PriorityScheduler("embedding", EMBEDDING_MAX_ASYNC, SCHEDULER_AGING_SECONDS)
+
+
+def current_workload() -> str:
+    """Класс нагрузки вызова из LightRAG.
+
+    priority_limit_async_func_call исполняет вызов под копией контекста того,
+    кто его поставил в очередь, поэтому workload_class доходит сюда сам:
+    запросы выставляют interactive (execute_query_with_fallbacks, /query/stream),
+    воркер индексации — bulk (process_ingest_document).
+    """
+    return workload_class.get() or WORKLOAD_INTERACTIVE
+
+
 async def llm_model_func(
     prompt, system_prompt=None, history_messages=[], **kwargs
 ) -> str:
@@ -218,37 +803,181 @@ async def llm_model_func(
     messages.extend(history_messages)
     messages.append({"role": "user", "content": prompt})
     
-    response = await ollama_client.chat(model=LLM_MODEL, messages=messages)
+    workload = current_workload()
+    with METRIC_LLM_CALL.time(workload=workload):
+        async with llm_scheduler.slot(workload):
+            response = await ollama_client.chat(
+                model=LLM_MODEL, messages=messages, keep_alive=OLLAMA_KEEP_ALIVE
+            )
+    observe_model_call(LLM_MODEL, response)
     return response['message']['content']
 
-async def embedding_func(texts: list[str]) -> list[list[float]]:
-    """Embedding wrapper для Ollama (nomic-embed-text) - ФИКСИРОВАННЫЙ"""
-    results = []
-    for text in texts:
-        response = await ollama_client.embeddings(model=EMBEDDING_MODEL, prompt=text)
-        results.append(response['embedding'])
-    return results
-
-async def rerank_func(query: str, documents: list[str], **kwargs) -> list[float]:
-    """Rerank wrapper для переранжирования результатов поиска через qwen2.5:14b"""
-    scores = []
-    for doc in documents:
-        # Формируем промпт для оценки релевантности (0-10)
-        prompt = f"""Оцени релевантность документа для запроса по шкале 0-10.
-Запрос: {query}
-
-Документ: {doc[:500]}...
-
-Ответь только числом от 0 до 10:"""
-        
-        response = await ollama_client.generate(model=RERANK_MODEL, prompt=prompt)
+class BatchLatencyStats:
+    """Агрегированные метрики латентности батчей (для /status)."""
+
+    def __init__(self):
+        self.batches = 0
+        self.items = 0
+        self.errors = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.last_seconds = 0.0
+
+    def record(self, items: int, seconds: float):
+        self.batches += 1
+        self.items += items
+        self.total_seconds += seconds
+        self.last_seconds = seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "errors": self.errors,
+            "avg_batch_ms": round(self.total_seconds / self.batches * 1000, 2) if self.batches else 0.0,
+            "last_batch_ms": round(self.last_seconds * 1000, 2),
+            "max_batch_ms": round(self.max_seconds * 1000, 2)
+        }
+
+
+def open_embedding_cache() -> EmbeddingCache | None:
+    """Кэш пишет только владелец индекса; читатели кластера открывают его read_only
+    (иначе их INSERT спорят с индексацией за блокировку SQLite)."""
+    if not EMBEDDING_CACHE_ENABLED:
+        return None
+    if CORTEX_ROLE != ROLE_READER:
+        return EmbeddingCache(EMBEDDING_CACHE_PATH, dtype=EMBEDDING_CACHE_DTYPE)
+    try:
+        return EmbeddingCache(EMBEDDING_CACHE_PATH, dtype=EMBEDDING_CACHE_DTYPE, read_only=True)
+    except Exception as e:
+        # Писатель ещё не создал файл — без кэша до следующей версии индекса (reopen_embedding_cache)
+        logging.warning(f"[CACHE] Embedding cache unavailable on reader: {e}")
+        return None
+
+
+def reopen_embedding_cache():
+    """reader: повторная попытка открыть кэш, если при старте файла ещё не было."""
+    global embedding_cache
+    if embedding_cache is not None or not EMBEDDING_CACHE_ENABLED or not EMBEDDING_CACHE_PATH.exists():
+        return
+    embedding_cache = open_embedding_cache()
+    if embedding_cache is not None:
+        print(f"[CACHE] Embedding cache opened: {EMBEDDING_CACHE_PATH}")
+
+
+embedding_stats = BatchLatencyStats()
+embedding_cache = open_embedding_cache()
+
+
+async def embed_batch(batch: list[str], workload: str) -> list[list[float]]:
+    """Один запрос /api/embed на батч текстов (слот embedding_scheduler)."""
+    async with embedding_scheduler.slot(workload):
+        started = time.perf_counter()
         try:
-            score = float(response['response'].strip())
-            scores.append(min(10.0, max(0.0, score)))  # Ограничение 0-10
-        except:
-            scores.append(5.0)  # Средний скор при ошибке парсинга
-    
-    return scores
+            response = await ollama_client.embed(
+                model=EMBEDDING_MODEL, input=batch, keep_alive=OLLAMA_KEEP_ALIVE
+            )
+        except Exception:
+            embedding_stats.errors += 1
+            raise
+        embedding_stats.record(len(batch), time.perf_counter() - started)
+    observe_model_call(EMBEDDING_MODEL, response)
+    return response['embeddings']
+
+
+async def embed_texts(texts: list[str], workload: str) -> list[list[float]]:
+    """Тексты режутся на батчи по EMBEDDING_BATCH_SIZE, батчи отправляются
+    параллельно (не более EMBEDDING_MAX_ASYNC одновременно), порядок сохраняется.
+    """
+    batches = [
+        texts[i:i + EMBEDDING_BATCH_SIZE]
+        for i in range(0, len(texts), EMBEDDING_BATCH_SIZE)
+    ]
+    batch_results = await asyncio.gather(*(embed_batch(batch, workload) for batch in batches))
+    return [vector for batch_vectors in batch_results for vector in batch_vectors]
+
+
+async def embedding_func(texts: list[str], **kwargs) -> list[list[float]]:
+    """Embedding wrapper для Ollama (nomic-embed-text).
+
+    Сначала смотрим в персистентный кэш (sha256 модели + текста),
+    в Ollama уходят только промахи.
+    """
+    if not texts:
+        return []
+    workload = current_workload()
+    with METRIC_EMBEDDING_CALL.time(workload=workload):
+        return await _cached_embeddings(texts, workload)
+
+
+async def _cached_embeddings(texts: list[str], workload: str) -> list[list[float]]:
+    if embedding_cache is None:
+        return await embed_texts(texts, workload)
+
+    vectors = await asyncio.to_thread(embedding_cache.get_many, EMBEDDING_MODEL, texts)
+    missing = [i for i, vector in enumerate(vectors) if vector is None]
+    if missing:
+        missing_texts = [texts[i] for i in missing]
+        fresh = await embed_texts(missing_texts, workload)
+        for i, vector in zip(missing, fresh):
+            vectors[i] = vector
+        await asyncio.to_thread(embedding_cache.put_many, EMBEDDING_MODEL, missing_texts, fresh)
+    return vectors
+
+async def rerank_func(query: str, documents: list[str], top_n: int = None, **kwargs) -> list[dict]:
+    """Rerank wrapper через RERANK_MODEL: один generate на документ (медленно, N x 22B)"""
+    async def generate(prompt: str) -> str:
+        async with llm_scheduler.slot(WORKLOAD_INTERACTIVE):
+            response = await ollama_client.generate(
+                model=RERANK_MODEL, prompt=prompt, keep_alive=OLLAMA_KEEP_ALIVE
+            )
+        observe_model_call(RERANK_MODEL, response)
+        return response['response']
+
+    return await llm_pointwise_rerank(generate, query, documents, top_n)
+
+
+async def embedding_rerank_func(query: str, documents: list[str], top_n: int = None, **kwargs) -> list[dict]:
+    """Быстрый rerank: косинусное сходство эмбеддингов (nomic-embed-text, через кэш)"""
+    return await embedding_rerank(
+        lambda texts: embedding_func(texts, context="query"), query, documents, top_n
+    )
+
+
+async def listwise_rerank_func(query: str, documents: list[str], top_n: int = None, **kwargs) -> list[dict]:
+    """LLM-судья за один generate: все кандидаты (усечённые) в одном промпте"""
+    async def generate(prompt: str) -> str:
+        async with llm_scheduler.slot(WORKLOAD_INTERACTIVE):
+            response = await ollama_client.generate(
+                model=RERANK_MODEL, prompt=prompt, keep_alive=OLLAMA_KEEP_ALIVE
+            )
+        observe_model_call(RERANK_MODEL, response)
+        return response['response']
+
+    return await llm_listwise_rerank(generate, query, documents, top_n)
+
+
+RERANK_FUNCS = {
+    "embedding": embedding_rerank_func,
+    "llm": rerank_func,
+    "listwise": listwise_rerank_func,
+}
+RERANK_MODES = ("off", *RERANK_FUNCS)
+
+# Режим rerank текущего запроса (выставляет execute_query_with_fallbacks).
+# LightRAG вызывает rerank_model_func через priority_limit_async_func_call
+# под копией контекста вызывающего, поэтому значение доходит до rerank_model_func
+rerank_mode = contextvars.ContextVar("rerank_mode", default=None)
+
+
+async def rerank_model_func(query: str, documents: list[str], top_n: int = None, **kwargs) -> list[dict]:
+    """Точка подключения rerank_model_func LightRAG (режим запроса или RERANK_MODE)."""
+    rerank_func_impl = RERANK_FUNCS.get(rerank_mode.get() or RERANK_MODE)
+    if rerank_func_impl is None:
+        # Исходный порядок кандидатов
+        return [{"index": i, "relevance_score": 1.0} for i in range(len(documents))][:top_n or None]
+    return await rerank_func_impl(query, documents, top_n=top_n, **kwargs)
 
 # ============================================================
 # ИНИЦИАЛИЗАЦИЯ LIGHTRAG
@@ -257,66 +986,561 @@ async def rerank_func(query: str, documents: list[str], **kwargs) -> list[float]
 # ВАЖНО: rag инициализируется в startup event, НЕ на уровне модуля
 rag = None
 
+
+class StartupState:
+    """Фоновый прогрев сервера: фазы, их длительность и готовность.
+
+    uvicorn начинает принимать соединения сразу, а хранилища и граф
+    загружаются в фоне; /ready отвечает 200 только после прогрева.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = {}
+        self.current_phase = None
+        self.ready = False
+        self.error = None
+        self.total_seconds = None
+
+    @contextmanager
+    def phase(self, name: str):
+        self.current_phase = name
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = time.perf_counter() - started
+
+    def mark_ready(self):
+        self.ready = True
+        self.current_phase = None
+        self.total_seconds = time.perf_counter() - self.started
+
+    def breakdown(self) -> dict:
+        return {name: round(seconds * 1000, 1) for name, seconds in self.phases.items()}
+
+    def as_dict(self) -> dict:
+        result = {
+            "ready": self.ready,
+            "phase": self.current_phase,
+            "startup_ms": self.breakdown(),
+            "elapsed_seconds": round(
+                self.total_seconds if self.total_seconds is not None else time.perf_counter() - self.started, 3
+            )
+        }
+        if self.error:
+            result["error"] = self.error
+        return result
+
+
+startup_state = StartupState()
+
+
+def require_ready():
+    """Быстрый 503 вместо ожидания, пока хранилища и граф ещё загружаются."""
+    if startup_state.ready:
+        return
+    detail = (
+        f"CORTEX startup failed: {startup_state.error}" if startup_state.error
+        else f"CORTEX is warming up (phase: {startup_state.current_phase or 'starting'})"
+    )
+    raise HTTPException(status_code=503, detail=detail, headers={"Retry-After": "5"})
+
+
+def require_ingest_available():
+    """Задачи принимаются и во время прогрева (воркер стартует в его конце),
+    но не после сбоя прогрева: выполнить их будет некому."""
+    if startup_state.error:
+        raise HTTPException(status_code=503, detail=f"CORTEX startup failed: {startup_state.error}")
+
+# ============================================================
+# ОЧЕРЕДЬ ИНДЕКСАЦИИ (фоновый воркер, /jobs API)
+# ============================================================
+
+# Манифест инкрементальной индексации (удаляется вместе с индексом в /clear_cache)
+index_manifest = IndexManifest(WORKING_DIR / "index_manifest.json")
+
+
+async def sync_library_file(path: Path, force: bool = False):
+    """Приводит граф в соответствие с файлом на диске по манифесту.
+
+    - файла нет, но он в манифесте → документ удаляется из LightRAG
+    - содержимое не изменилось (sha256) → ничего не делаем (кроме force)
+    - новый/изменённый файл → старая версия удаляется, новая индексируется
+    Операция идемпотентна, поэтому прерванная задача безопасно повторяется.
+    """
+    entry = index_manifest.get(path)
+    if not path.exists():
+        if entry:
+            print(f"[MANIFEST] Removed: {path}")
+            await rag.adelete_by_doc_id(entry["doc_id"])
+            index_manifest.remove(path)
+        return
+
+    stat = path.stat()
+    sha256 = file_sha256(path)
+    if entry and entry["sha256"] == sha256 and not force:
+        index_manifest.put(path, stat.st_size, stat.st_mtime, sha256, entry["doc_id"])
+        return
+
+    with open(path, 'r', encoding='utf-8') as f:
+        content = f.read()
+    # Тот же doc_id, что LightRAG даёт документу без ids: файлы, проиндексированные
+    # до появления манифеста, узнаются, а не вставляются повторно
+    doc_id = compute_mdhash_id(clean_text(content), prefix="doc-")
+    if entry:
+        print(f"[MANIFEST] Changed: {path}")
+        await rag.adelete_by_doc_id(entry["doc_id"])
+    else:
+        print(f"[MANIFEST] Added: {path}")
+    await rag.ainsert(content, ids=doc_id, file_paths=str(path))
+    index_manifest.put(path, stat.st_size, stat.st_mtime, sha256, doc_id)
+
+
+# WORKING_DIR меняется только под этим замком (документ ингеста, BM25, /clear_cache):
+# публикация версии копирует каталог под ним же и не видит половину записи
+index_write_lock = asyncio.Lock()
+
+
+async def process_ingest_document(job: dict, document: dict):
+    """Индексация одного документа задачи (текст из запроса или файл по пути)."""
+    workload_class.set(WORKLOAD_BULK)
+    try:
+        async with index_write_lock:
+            await _ingest_document(job, document)
+    except Exception:
+        METRIC_INSERT_FAILURES.inc(kind=job["kind"])
+        raise
+    METRIC_INSERTS.inc(kind=job["kind"])
+
+
+async def _ingest_document(job: dict, document: dict):
+    text = document["text"]
+    if text is None:
+        await sync_library_file(Path(document["name"]), job["params"].get("force", False))
+        return
+
+    print(f"[JOBS] {job['kind']}: rag.ainsert() {document['name']} ({len(text)} chars)")
+    timeout = job["params"].get("timeout")
+    if timeout:
+        await asyncio.wait_for(rag.ainsert(text), timeout=timeout)
+    else:
+        await rag.ainsert(text)
+
+
+# Публикация версий индекса (writer) / подхват версий (reader)
+snapshot_publisher = (
+    SnapshotPublisher(
+        WORKING_DIR, SNAPSHOT_ROOT,
+        min_interval=SNAPSHOT_PUBLISH_INTERVAL_SECONDS,
+        max_delay=SNAPSHOT_PUBLISH_MAX_DELAY_SECONDS
+    ) if CORTEX_ROLE == ROLE_WRITER else None
+)
+snapshot_follower = (
+    SnapshotFollower(SNAPSHOT_ROOT, SNAPSHOT_ROOT.parent / "replicas" / str(os.getpid()))
+    if CORTEX_ROLE == ROLE_READER else None
+)
+
+
+binary_snapshot = (
+    BinarySnapshot(BINARY_SNAPSHOT_DIR, compression=BINARY_SNAPSHOT_COMPRESSION)
+    if BINARY_SNAPSHOT_ENABLED else None
+)
+
+
+def alias_replica(workspace: str):
+    """reader: файлы реплики — копии WORKING_DIR писателя (mtime сохраняется),
+    поэтому бинарный снимок писателя годится и для них."""
+    if binary_snapshot is not None:
+        binary_snapshot.add_alias(snapshot_follower.replica_root / workspace, WORKING_DIR)
+
+
+async def refresh_binary_snapshot(reason: str):
+    """Перезапись бинарного снимка из WORKING_DIR (только процесс, владеющий индексом)."""
+    if binary_snapshot is None or CORTEX_ROLE == ROLE_READER:
+        return
+    try:
+        await asyncio.to_thread(binary_snapshot.write, WORKING_DIR)
+    except Exception as e:
+        logging.warning(f"[SNAPSHOT] Write failed ({reason}): {e}")
+
+
+async def refresh_lexical_index(reason: str, index: LexicalIndex = None):
+    """Догоняет BM25-индекс до kv_store_text_chunks.json (после ингеста, при старте, для реплики)."""
+    index = index or lexical_index
+    if index is None:
+        return
+    try:
+        async with index_write_lock:
+            added, removed = await asyncio.to_thread(index.refresh)
+    except Exception as e:
+        logging.warning(f"[BM25] Sync failed ({reason}): {e}")
+        return
+    if added or removed:
+        print(f"[BM25] {reason}: +{added}/-{removed} чанков, всего {len(index)} ({index.sync_seconds:.2f}s)")
+
+
+async def publish_snapshot(reason: str):
+    if snapshot_publisher is not None:
+        async with index_write_lock:
+            await asyncio.to_thread(snapshot_publisher.publish, reason)
+
+
+def request_snapshot(reason: str):
+    """Изменение индекса уйдёт читателям со следующей публикацией (publish_snapshots)."""
+    if snapshot_publisher is not None:
+        snapshot_publisher.request(reason)
+
+
+async def publish_snapshots():
+    """writer: публикация накопленных изменений пачкой, а не копия WORKING_DIR на каждую задачу."""
+    while True:
+        await asyncio.sleep(SNAPSHOT_POLL_SECONDS)
+        if not snapshot_publisher.due(idle=job_store.queue_depth() == 0):
+            continue
+        reason = snapshot_publisher.take_pending()
+        try:
+            await publish_snapshot(reason)
+        except Exception as e:
+            snapshot_publisher.request(reason)
+            logging.warning(f"[REPLICA] Publish failed ({reason}): {e}")
+
+
+async def on_ingest_job_finished(job_id: str):
+    query_cache.invalidate(f"job {job_id}")
+    await refresh_lexical_index(f"job {job_id}")
+    await refresh_binary_snapshot(f"job {job_id}")
+    request_snapshot(f"job {job_id}")
+
+
+job_store = JobStore(JOBS_DB_PATH)
+ingest_worker = IngestWorker(
+    job_store,
+    process_ingest_document,
+    on_job_finished=on_ingest_job_finished
+)
+
+
+def job_accepted(job_id: str, kind: str, documents: int) -> dict:
+    return {
+        "status": "accepted",
+        "job_id": job_id,
+        "kind": kind,
+        "documents": documents,
+        "status_url": f"/jobs/{job_id}"
+    }
+
+
+def submit_library_job(kind: str, plan: dict, params: dict, force: bool):
+    """Ставит в очередь только added/changed/removed файлы из плана манифеста."""
+    paths = plan["added"] + plan["changed"] + plan["removed"]
+    if not paths:
+        return None
+    return ingest_worker.submit(
+        kind,
+        [{"name": path} for path in paths],
+        {
+            **params,
+            "force": force,
+            "plan": {
+                "added": plan["added"],
+                "changed": plan["changed"],
+                "removed": plan["removed"],
+                "skipped_count": len(plan["skipped"]),
+                "scan_seconds": plan["scan_seconds"]
+            }
+        }
+    )
+
+
+def manifest_breakdown(plan: dict, job: dict = None) -> dict:
+    """Разбивка added/changed/skipped/removed с временем по каждой категории."""
+    seconds = {}
+    if job and "documents" in job:
+        seconds = {doc["name"]: doc["seconds"] or 0.0 for doc in job["documents"]}
+    breakdown = {}
+    for category in ("added", "changed", "removed"):
+        names = plan.get(category, [])
+        breakdown[category] = {
+            "count": len(names),
+            "seconds": round(sum(seconds.get(name, 0.0) for name in names), 3)
+        }
+    skipped = plan.get("skipped_count", len(plan.get("skipped", [])))
+    breakdown["skipped"] = {"count": skipped, "seconds": plan.get("scan_seconds", 0.0)}
+    return breakdown
+
+
+class DocStatusCounters:
+    """Счётчики статусов документов из kv_store_doc_status.json.
+
+    Файл парсится только при старте и при изменении mtime (не чаще, чем раз
+    в min_refresh_seconds), в отдельном потоке. Между изменениями /status
+    отдаёт счётчики из памяти — O(1) независимо от размера корпуса.
+    """
+
+    def __init__(self, path: Path, min_refresh_seconds: float = 1.0):
+        self.path = path
+        self.min_refresh_seconds = min_refresh_seconds
+        self._counts = Counter()
+        self._mtime_ns = None
+        self._checked_at = float("-inf")
+        self._lock = asyncio.Lock()
+
+    def _parse(self) -> Counter:
+        with open(self.path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return Counter(str(item.get("status", "unknown")).lower() for item in data.values())
+
+    async def snapshot(self) -> Counter:
+        if time.monotonic() - self._checked_at < self.min_refresh_seconds:
+            return self._counts
+        async with self._lock:
+            self._checked_at = time.monotonic()
+            try:
+                mtime_ns = os.stat(self.path).st_mtime_ns
+            except FileNotFoundError:
+                mtime_ns = None
+            if mtime_ns != self._mtime_ns:
+                self._counts = await asyncio.to_thread(self._parse) if mtime_ns else Counter()
+                self._mtime_ns = mtime_ns
+        return self._counts
+
+
+doc_status_counters = DocStatusCounters(WORKING_DIR / "kv_store_doc_status.json")
+
+
+def job_errors(job: dict) -> str:
+    if job["error"]:
+        return job["error"]
+    return "; ".join(
+        f"{doc['name']}: {doc['error']}" for doc in job["documents"] if doc["status"] == DOC_FAILED
+    )
+
 # ============================================================
 # FASTAPI СЕРВЕР С LIFESPAN
 # ============================================================
 
-@asynccontextmanager
-async def lifespan(app: FastAPI):
-    """Lifespan context manager для управления startup/shutdown"""
-    global rag
-    
-    # STARTUP
-    print("=== Создание LightRAG instance ===")
-    rag = LightRAG(
-        working_dir=str(WORKING_DIR),
-        workspace="",
+GRAPH_FILE = "graph_chunk_entity_relation.graphml"
+
+
+def create_rag(working_dir: Path, workspace: str = "") -> LightRAG:
+    return LightRAG(
+        working_dir=str(working_dir),
+        # reader: каждая версия — отдельный workspace, чтобы общие данные
+        # namespace в shared_storage LightRAG не смешивались между версиями
+        workspace=workspace,
+        graph_storage=GRAPH_STORAGE,
+        vector_storage=VECTOR_STORAGE,
+        vector_db_storage_cls_kwargs={"ivf": IVF_PARAMS} if VECTOR_STORAGE == "IVFVectorDBStorage" else {},
         llm_model_func=llm_model_func,
         llm_model_name=LLM_MODEL,
-        llm_model_max_async=LLM_MAX_ASYNC,
+        # GPU-лимит LLM_MAX_ASYNC соблюдает llm_scheduler (с приоритетами)
+        llm_model_max_async=LIGHTRAG_PASSTHROUGH_ASYNC,
+        embedding_batch_num=EMBEDDING_BATCH_SIZE,
+        embedding_func_max_async=LIGHTRAG_PASSTHROUGH_ASYNC,
         embedding_func=EmbeddingFunc(
             embedding_dim=768,
             max_token_size=8192,
             func=embedding_func
         ),
-        # ВРЕМЕННО ОТКЛЮЧЕН: rerank вызывает ошибку 'float' object has no attribute 'copy'
-        # rerank_model_func=rerank_func,
+        # Ошибка 'float' object has no attribute 'copy' была из-за формата ответа:
+        # LightRAG ждёт [{"index", "relevance_score"}], а не список чисел.
+        # Включается через CORTEX_RERANK_MODE (по умолчанию off, как в PLAN C)
+        # или полем rerank конкретного запроса
+        rerank_model_func=rerank_model_func,
     )
-    print("[OK] LightRAG создан")
-    print(f"[INFO] Rerank ОТКЛЮЧЕН (баг v1.4.9.8)")
-    print(f"[INFO] Working dir: {WORKING_DIR}")
-    
-    print("=== Инициализация хранилищ ===")
-    await rag.initialize_storages()
-    print("[OK] Хранилища инициализированы")
-    
+
+
+async def load_graph(instance: LightRAG, graph_path: Path):
     # Явная загрузка графа в память (рекомендация агента qwen2.5)
-    graph_path = WORKING_DIR / "graph_chunk_entity_relation.graphml"
-    if graph_path.exists():
-        print(f"=== Попытка загрузки графа из {graph_path} ===")
-        try:
-            if hasattr(rag, 'load_graph'):
-                await rag.load_graph(str(graph_path))
-                print("[OK] ✅ Граф загружен в память методом load_graph()")
-            elif hasattr(rag, 'graph_storage') and hasattr(rag.graph_storage, 'load_graph'):
-                await rag.graph_storage.load_graph(str(graph_path))
-                print("[OK] ✅ Граф загружен через graph_storage.load_graph()")
-            else:
-                print("[INFO] ⚠️ Метод load_graph() не найден, граф загружается автоматически")
-        except Exception as e:
-            logging.warning(f"Ошибка загрузки графа: {e}")
-    else:
+    if not graph_path.exists():
         logging.warning(f"Файл графа не найден: {graph_path}")
-    
-    from lightrag.kg.shared_storage import initialize_pipeline_status
-    await initialize_pipeline_status()
-    print("[OK] Pipeline status инициализирован")
-    print("")
-    
+        return
+    print(f"=== Попытка загрузки графа из {graph_path} ===")
+    try:
+        if hasattr(instance, 'load_graph'):
+            await instance.load_graph(str(graph_path))
+            print("[OK] ✅ Граф загружен в память методом load_graph()")
+        elif hasattr(instance, 'graph_storage') and hasattr(instance.graph_storage, 'load_graph'):
+            await instance.graph_storage.load_graph(str(graph_path))
+            print("[OK] ✅ Граф загружен через graph_storage.load_graph()")
+        else:
+            print("[INFO] ⚠️ Метод load_graph() не найден, граф загружается автоматически")
+    except Exception as e:
+        logging.warning(f"Ошибка загрузки графа: {e}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Lifespan context manager для управления startup/shutdown
+
+    Прогрев (LightRAG, хранилища, граф) идёт в фоновой задаче, поэтому
+    сервер принимает соединения сразу: /health отвечает, /ready — 503 до готовности.
+    """
+    background_tasks = [asyncio.create_task(warm_up())]
+    # Предзагрузка моделей параллельно с загрузкой хранилищ (на готовность не влияет).
+    # В кластере модели держит писатель — N читателей не пингуют Ollama повторно
+    if CORTEX_ROLE != ROLE_READER and (MODEL_PREWARM or KEEP_WARM_INTERVAL_SECONDS > 0):
+        background_tasks.append(asyncio.create_task(model_keeper.run(prewarm=MODEL_PREWARM)))
+    if snapshot_follower is not None:
+        background_tasks.append(asyncio.create_task(follow_snapshots()))
+    if snapshot_publisher is not None:
+        background_tasks.append(asyncio.create_task(publish_snapshots()))
+
     yield  # Сервер работает
-    
+
     # SHUTDOWN (если нужна очистка)
     print("[INFO] Shutdown - очистка ресурсов...")
+    pending = [task for task in background_tasks if not task.done()]
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+    await ingest_worker.stop()
+    job_store.close()
+    if embedding_cache:
+        embedding_cache.close()
+    if snapshot_follower is not None:
+        await writer_client.aclose()
+        snapshot_follower.discard_all()
+
+
+async def warm_up():
+    """Фоновая инициализация с замером каждой фазы (startup-time breakdown)."""
+    global rag, lexical_index
+
+    try:
+        working_dir, workspace, version = WORKING_DIR, "", None
+        if snapshot_follower is not None:
+            # reader: ждём первую опубликованную версию и копируем её себе
+            with startup_state.phase("snapshot_wait"):
+                while (version := snapshot_follower.newer_version()) is None:
+                    await asyncio.sleep(SNAPSHOT_POLL_SECONDS)
+            with startup_state.phase("replica_copy"):
+                workspace = await asyncio.to_thread(snapshot_follower.materialize, version)
+            working_dir = snapshot_follower.replica_root
+            alias_replica(workspace)
+            if lexical_index is not None:
+                lexical_index = LexicalIndex(working_dir / workspace)
+
+        if binary_snapshot is not None:
+            # Хранилища, совпадающие со снимком, читаются из него, остальные — из JSON/GraphML
+            with startup_state.phase("snapshot_loaders"):
+                installed = install_loaders(binary_snapshot)
+                print(f"[INFO] Binary snapshot loaders: {', '.join(installed) or 'нет'}")
+
+        with startup_state.phase("lightrag_init"):
+            print("=== Создание LightRAG instance ===")
+            rag = create_rag(working_dir, workspace)
+            print("[OK] LightRAG создан")
+            print(f"[INFO] Role: {CORTEX_ROLE}")
+            print(f"[INFO] Rerank: {RERANK_MODE}")
+            print(f"[INFO] Graph storage: {GRAPH_STORAGE}")
+            print(f"[INFO] Vector storage: {VECTOR_STORAGE}")
+            print(f"[INFO] Lexical index: {'BM25' if LEXICAL_INDEX_ENABLED else 'ОТКЛЮЧЕН'}"
+                  f"{' (hybrid fusion)' if HYBRID_FUSION else ''}")
+            print(f"[INFO] Working dir: {working_dir / workspace}")
+            print(f"[INFO] Embedding cache: {EMBEDDING_CACHE_PATH if embedding_cache else 'ОТКЛЮЧЕН'}")
+
+        with startup_state.phase("storages"):
+            print("=== Инициализация хранилищ ===")
+            await rag.initialize_storages()
+            print("[OK] Хранилища инициализированы")
+
+        with startup_state.phase("graph"):
+            await load_graph(rag, working_dir / workspace / GRAPH_FILE)
+
+        with startup_state.phase("pipeline_status"):
+            from lightrag.kg.shared_storage import initialize_pipeline_status
+            await initialize_pipeline_status()
+            print("[OK] Pipeline status инициализирован")
+
+        with startup_state.phase("doc_status"):
+            await doc_status_counters.snapshot()
+
+        if snapshot_follower is not None:
+            snapshot_follower.mark_loaded(version)
+            reopen_embedding_cache()
+        else:
+            if snapshot_publisher is not None:
+                # Читатели стартуют с состояния писателя после его рестарта
+                with startup_state.phase("publish"):
+                    await publish_snapshot("startup")
+            # Задачи, принятые до готовности, уже лежат в очереди и начнут выполняться здесь
+            with startup_state.phase("ingest_worker"):
+                ingest_worker.start()
+                print(f"[OK] Ingest worker запущен (очередь: {job_store.queue_depth()} задач)")
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        startup_state.error = str(e)
+        logging.error(f"[STARTUP] Warm-up failed in phase '{startup_state.current_phase}': {e}")
+        # Воркер не запустится — запросы с ?wait=true не должны ждать вечно
+        ingest_worker.abort_waiters(HTTPException(status_code=503, detail=f"CORTEX startup failed: {e}"))
+        return
+
+    startup_state.mark_ready()
+    # Загрузка/досинхронизация BM25 не задерживает готовность: до неё lexical уходит в fallback
+    asyncio.create_task(refresh_lexical_index("startup"))
+    breakdown = ", ".join(f"{name}={ms:.0f}ms" for name, ms in startup_state.breakdown().items())
+    print(f"[OK] CORTEX ready за {startup_state.total_seconds:.2f}s ({breakdown})")
+    if binary_snapshot is not None:
+        print(f"[INFO] Binary snapshot: {binary_snapshot.hits} из снимка, {binary_snapshot.misses} из исходных файлов")
+        # Снимок устарел (или его нет) — следующий холодный старт возьмёт свежий
+        if CORTEX_ROLE != ROLE_READER and await asyncio.to_thread(binary_snapshot.is_stale, WORKING_DIR):
+            await refresh_binary_snapshot("startup")
+    print("")
+
+
+async def follow_snapshots():
+    """reader: подхват новых версий индекса, опубликованных писателем."""
+    while True:
+        await asyncio.sleep(SNAPSHOT_POLL_SECONDS)
+        if not startup_state.ready:
+            continue
+        version = snapshot_follower.newer_version()
+        if version is None:
+            continue
+        try:
+            await reload_replica(version)
+        except Exception as e:
+            # Версия могла быть удалена при ротации — повторим на следующей
+            logging.warning(f"[REPLICA] Failed to load index v{version}: {e}")
+
+
+async def reload_replica(version: int):
+    """Новая версия грузится рядом со старой, затем атомарно подменяет rag."""
+    global rag, lexical_index
+    started = time.perf_counter()
+    previous, previous_workspace = rag, f"v{snapshot_follower.loaded_version}"
+
+    workspace = await asyncio.to_thread(snapshot_follower.materialize, version)
+    alias_replica(workspace)
+    instance = create_rag(snapshot_follower.replica_root, workspace)
+    await instance.initialize_storages()
+    await load_graph(instance, snapshot_follower.replica_root / workspace / GRAPH_FILE)
+    lexical = None
+    if lexical_index is not None:
+        lexical = LexicalIndex(snapshot_follower.replica_root / workspace)
+        await refresh_lexical_index(f"index v{version}", lexical)
+
+    rag = instance
+    if lexical is not None:
+        lexical_index = lexical
+    snapshot_follower.mark_loaded(version)
+    reopen_embedding_cache()
+    query_cache.invalidate(f"index v{version}")
+    print(f"[REPLICA] Index v{version} loaded in {time.perf_counter() - started:.2f}s")
+    asyncio.create_task(retire_replica(previous, previous_workspace))
+
+
+async def retire_replica(instance: LightRAG, workspace: str):
+    await asyncio.sleep(REPLICA_RETIRE_SECONDS)
+    try:
+        if hasattr(instance, 'finalize_storages'):
+            await instance.finalize_storages()
+    except Exception as e:
+        logging.warning(f"[REPLICA] Finalize {workspace} failed: {e}")
+    await asyncio.to_thread(snapshot_follower.discard, workspace)
 
 app = FastAPI(
     title="AI Librarian - LightRAG Server",
@@ -325,24 +1549,73 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# ============================================================
+# READER → WRITER (многопроцессный режим)
+# ============================================================
+
+# В режиме reader эти эндпоинты проксируются писателю (индекс меняет только он)
+WRITER_PATHS = {"/insert", "/insert_batch", "/index_library", "/api/reindex", "/clear_cache", "/api/git/push"}
+WRITER_PATH_PREFIXES = ("/jobs",)
+
+writer_client = (
+    httpx.AsyncClient(base_url=WRITER_URL, timeout=None) if CORTEX_ROLE == ROLE_READER else None
+)
+
+
+def is_writer_path(path: str) -> bool:
+    return path in WRITER_PATHS or path.startswith(WRITER_PATH_PREFIXES)
+
+
+# Объявлен до verify_api_key: последний добавленный middleware внешний,
+# поэтому ключ проверяется читателем до пересылки
+@app.middleware("http")
+async def forward_writes(request: Request, call_next):
+    if writer_client is None or not is_writer_path(request.url.path):
+        return await call_next(request)
+    headers = {
+        name: value for name, value in request.headers.items()
+        if name.lower() in ("x-api-key", "content-type")
+    }
+    try:
+        response = await writer_client.request(
+            request.method,
+            request.url.path,
+            params=request.query_params,
+            content=await request.body(),
+            headers=headers
+        )
+    except httpx.HTTPError as e:
+        return JSONResponse(
+            status_code=status.HTTP_502_BAD_GATEWAY,
+            content={"detail": f"CORTEX writer unavailable at {WRITER_URL}: {e}"}
+        )
+    return Response(
+        content=response.content,
+        status_code=response.status_code,
+        media_type=response.headers.get("content-type")
+    )
+
 # ============================================================
 # SECURITY MIDDLEWARE (ТРИЗ Принцип №11 "Заблаговременная амортизация")
 # ============================================================
 
+# Эндпоинты мониторинга без X-API-KEY (метрики не содержат текстов запросов)
+PUBLIC_PATHS = {"/health", "/ready", "/metrics"}
+
 @app.middleware("http")
 async def verify_api_key(request: Request, call_next):
     """
-    Проверка API ключа для всех запросов (кроме /health).
+    Проверка API ключа для всех запросов (кроме /health, /ready и /metrics).
     
     АРХИТЕКТУРНАЯ ИЗОЛЯЦИЯ:
-    - /health — доступен без ключа (для мониторинга)
+    - /health, /ready, /metrics — доступны без ключа (мониторинг, пробы, Prometheus)
     - Все остальные эндпоинты — требуют заголовок X-API-KEY
     
     ТРИЗ Принцип №2 (Вынесение): Отделяем чувствительную часть барьером авторизации
     ТРИЗ Принцип №11 (Амортизация): Защита встроена ДО обработки запроса
     """
-    # Разрешаем health check без авторизации (для мониторинга)
-    if request.url.path == "/health":
+    # Разрешаем health check и метрики без авторизации (для мониторинга)
+    if request.url.path in PUBLIC_PATHS:
         return await call_next(request)
     
     # Извлекаем API ключ из заголовков
@@ -371,7 +1644,36 @@ async def verify_api_key(request: Request, call_next):
 # Модели запросов
 class QueryRequest(BaseModel):
     query: str
-    mode: str = "hybrid"  # naive, local, global, hybrid
+    mode: str = "hybrid"  # naive, local, global, hybrid, lexical
+    strategy: str | None = None  # sequential, race (None → CORTEX_QUERY_STRATEGY)
+    rerank: str | None = None  # off, embedding, llm, listwise (None → CORTEX_RERANK_MODE)
+    timings: bool = False  # разбивка времени по этапам в ответе
+
+def validate_query_request(request: QueryRequest):
+    if request.rerank and request.rerank not in RERANK_MODES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown rerank mode '{request.rerank}'. Use one of: {', '.join(RERANK_MODES)}"
+        )
+
+def finish_query(
+    request: QueryRequest, timings: StageTimings, response: dict,
+    endpoint: str, tried_modes: list[str], cache: str
+) -> dict:
+    """Запись в журнал медленных запросов и (если запрошено) timings в ответе."""
+    slow_query_log.maybe_log(timings, {
+        "endpoint": endpoint,
+        "query": request.query,
+        "mode": request.mode,
+        "mode_chain": build_mode_chain(request.mode),
+        "tried_modes": tried_modes,
+        "strategy": request.strategy or QUERY_STRATEGY_DEFAULT,
+        "rerank": request.rerank or RERANK_MODE,
+        "cache": cache
+    })
+    if request.timings:
+        response["timings"] = timings.as_dict()
+    return response
 
 class InsertRequest(BaseModel):
     text: str
@@ -405,32 +1707,66 @@ async def health_check():
         "library_dir_exists": LIBRARY_DIR.exists()
     }
 
+@app.get("/ready")
+async def readiness_check():
+    """Готовность к запросам (в отличие от /health, который отвечает сразу):
+    200 после загрузки хранилищ и графа, иначе 503 с текущей фазой прогрева."""
+    body = {**startup_state.as_dict(), "role": CORTEX_ROLE}
+    if snapshot_follower is not None:
+        body["index_version"] = snapshot_follower.loaded_version
+    if not startup_state.ready:
+        return JSONResponse(status_code=503, content=body, headers={"Retry-After": "5"})
+    return body
+
+@app.get("/metrics")
+async def get_metrics():
+    """Метрики в формате Prometheus: гистограммы этапов запроса, LLM/embedding вызовов,
+    счётчики вставок, ошибок и fallback-переходов между режимами."""
+    return Response(content=metrics.render(), media_type=METRICS_CONTENT_TYPE)
+
+def graph_storage_stats() -> dict:
+    graph = getattr(rag, "chunk_entity_relation_graph", None)
+    stats = {"backend": GRAPH_STORAGE}
+    if hasattr(graph, "csr_stats"):
+        stats["csr"] = graph.csr_stats()
+    return stats
+
+def vector_storage_stats() -> dict:
+    stats = {"backend": VECTOR_STORAGE}
+    for name in ("entities_vdb", "relationships_vdb", "chunks_vdb"):
+        storage = getattr(rag, name, None)
+        if hasattr(storage, "ivf_stats"):
+            stats[name] = storage.ivf_stats()
+    return stats
+
 @app.get("/status")
 async def get_status():
-    """Получить статус индексации из kv_store"""
+    """Получить статус индексации из kv_store (счётчики кэшируются в памяти)"""
     try:
-        kv_store_path = WORKING_DIR / "kv_store_doc_status.json"
-        if not kv_store_path.exists():
-            return {
-                "processed_count": 0,
-                "processing_count": 0,
-                "failed_count": 0,
-                "total_count": 0
-            }
-        
-        import json
-        with open(kv_store_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        
-        processed = sum(1 for item in data.values() if item.get("status") == "processed")
-        processing = sum(1 for item in data.values() if item.get("status") == "processing")
-        failed = sum(1 for item in data.values() if item.get("status") == "failed")
-        
+        counts = await doc_status_counters.snapshot()
         return {
-            "processed_count": processed,
-            "processing_count": processing,
-            "failed_count": failed,
-            "total_count": len(data)
+            "processed_count": counts.get("processed", 0),
+            "processing_count": counts.get("processing", 0),
+            "failed_count": counts.get("failed", 0),
+            "total_count": sum(counts.values()),
+            "query_cache": query_cache.stats(),
+            "query_singleflight": query_singleflight.stats(),
+            "scheduler": {"llm": llm_scheduler.stats(), "embedding": embedding_scheduler.stats()},
+            "embedding": embedding_stats.stats(),
+            "embedding_cache": embedding_cache.stats() if embedding_cache else None,
+            "term_expansion": term_expander.stats(),
+            "slow_query_log": slow_query_log.stats(),
+            "models": model_keeper.stats(),
+            "binary_snapshot": binary_snapshot.stats() if binary_snapshot else None,
+            "graph_storage": graph_storage_stats(),
+            "vector_storage": vector_storage_stats(),
+            "lexical_index": lexical_index.stats() if lexical_index else None,
+            "replication": {
+                "role": CORTEX_ROLE,
+                "publisher": snapshot_publisher.stats() if snapshot_publisher else None,
+                "follower": snapshot_follower.stats() if snapshot_follower else None
+            },
+            "ingest_queue": {"depth": job_store.queue_depth(), "current_job": ingest_worker.current_job_id}
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -444,140 +1780,336 @@ async def query_graph(request: QueryRequest):
     - naive: Простой векторный поиск
     - local: Поиск с учетом локального контекста
     - global: Глобальный граф знаний
-    - hybrid: Комбинированный (рекомендуется)
+    - hybrid: Комбинированный (рекомендуется); с CORTEX_HYBRID_FUSION —
+      слияние BM25 и векторного поиска по чанкам
+    - lexical: BM25 по чанкам без LLM и эмбеддингов (миллисекунды), без
+      переформулирования; нет совпадений — fallback на local → global → naive
+
+    Повторный запрос (тот же нормализованный augmented query + mode)
+    отдаётся из кэша до изменения индекса; поле "cache" = hit/miss.
+    Одновременные одинаковые запросы объединяются: "coalesced_requests" —
+    сколько запросов получили ответ от одного общего вычисления.
+    timings=true добавляет в ответ разбивку времени по этапам; запросы дольше
+    CORTEX_SLOW_QUERY_SECONDS пишутся в журнал медленных запросов.
+    До готовности (/ready) — сразу 503.
     """
+    require_ready()
+    validate_query_request(request)
+    timings = StageTimings()
+    request_timings.set(timings)
     try:
         augmented_query, augmented_terms, detected_lang = build_augmented_query(request.query)
-        result, effective_mode, tried_modes = await execute_query_with_fallbacks(
-            augmented_query,
-            request.mode
-        )
 
-        # [PLAN C] POST-PROCESSING: Улучшение контекста перед LLM
-        # 1. Дедупликация по содержимому (убираем повторяющиеся фрагменты)
-        # 2. Фильтрация слишком коротких чанков (шум)
-        # 3. Переформулирование через LLM для улучшения читаемости
-        if has_meaningful_result(result):
-            # Простая дедупликация: разбиваем на предложения, убираем дубликаты
-            sentences = re.split(r'[.!?]+\s+', str(result))
-            unique_sentences = []
-            seen = set()
-            for sent in sentences:
-                normalized = sent.strip().lower()
-                if len(normalized) > 30 and normalized not in seen:  # Фильтр коротких и дубликатов
-                    unique_sentences.append(sent.strip())
-                    seen.add(normalized)
-            
-            # Ограничиваем контекст топ-8 предложений (из ~20 кандидатов)
-            result = '. '.join(unique_sentences[:8]) + '.'
-            
-            # POST-PROCESSING rerank для улучшения читаемости (НЕ для retrieval!)
-            if RERANK_MODEL:
-                rerank_prompt = f"""Ты получил ответ от системы поиска по базе знаний.
-Твоя задача: переформулировать ответ, сделав его более точным и релевантным запросу.
+        cache_key = normalize_query_key(augmented_query, request.mode, request.rerank)
+        cached = query_cache.get(cache_key)
+        if cached is not None:
+            response = {**cached, "query": request.query, "cache": "hit"}
+            return finish_query(request, timings, response, "query", cached["tried_modes"], "hit")
+        index_version = query_cache.index_version
+
+        async def compute_response():
+            # Общее вычисление single-flight собирает собственные timings
+            compute_timings = StageTimings()
+            request_timings.set(compute_timings)
+            result, effective_mode, tried_modes = await execute_query_with_fallbacks(
+                augmented_query,
+                request.mode,
+                request.strategy,
+                request.rerank,
+                lexical_query=build_lexical_query(request.query, augmented_terms)
+            )
 
-Запрос пользователя: {request.query}
+            # [PLAN C] POST-PROCESSING: Улучшение контекста перед LLM
+            # 1. Отбор релевантных предложений без почти-дубликатов (в бюджет токенов)
+            # 2. Фильтрация слишком коротких чанков (шум)
+            # 3. Переформулирование через LLM для улучшения читаемости
+            if has_meaningful_result(result):
+                with stage_timer("condensation"):
+                    result = await condense_context(result, request.query, effective_mode)
+            
+                # POST-PROCESSING rerank для улучшения читаемости (НЕ для retrieval!)
+                # lexical отвечает без LLM — переформулирование пропускается
+                if RERANK_MODEL and effective_mode != MODE_LEXICAL:
+                    with METRIC_REWRITE.time(endpoint="query"), stage_timer("rewrite"):
+                        async with llm_scheduler.slot(WORKLOAD_INTERACTIVE):
+                            reranked_response = await ollama_client.generate(
+                                model=RERANK_MODEL,
+                                prompt=build_rewrite_prompt(request.query, result),
+                                keep_alive=OLLAMA_KEEP_ALIVE
+                            )
+                        observe_model_call(RERANK_MODEL, reranked_response)
+                    result = reranked_response['response']
+
+            payload = {
+                "query": request.query,
+                "mode": request.mode,
+                "effective_mode": effective_mode,
+                "tried_modes": tried_modes,
+                "strategy": request.strategy or QUERY_STRATEGY_DEFAULT,
+                "rerank": request.rerank or RERANK_MODE,
+                "detected_language": detected_lang,
+                "augmented_terms": augmented_terms,
+                "response": result
+            }
+            query_cache.put(cache_key, payload, index_version)
+            return payload, compute_timings
+
+        # Одинаковые одновременные запросы ждут одну общую задачу (single-flight)
+        (payload, compute_timings), coalesced = await query_singleflight.run(cache_key, compute_response)
+        timings.merge(compute_timings)
+        response = {**payload, "query": request.query, "cache": "miss", "coalesced_requests": coalesced}
+        return finish_query(request, timings, response, "query", payload["tried_modes"], "miss")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Query error: {str(e)}")
 
-Исходный ответ системы:
-{result}
+async def stream_rewrite(prompt: str):
+    """Токены потокового переформулирования (RERANK_MODEL).
 
-Переформулируй ответ, сохранив все важные факты, но улучшив структуру и ясность:"""
+    Ollama читает задача-производитель: слот llm_scheduler она держит только
+    до конца генерации и складывает токены в очередь. Генератор отдаёт их
+    клиенту уже вне слота — медленный SSE-клиент не занимает GPU.
+    """
+    tokens = asyncio.Queue()
 
-                reranked_response = await ollama_client.generate(
-                    model=RERANK_MODEL,
-                    prompt=rerank_prompt
+    async def produce():
+        try:
+            async with llm_scheduler.slot(WORKLOAD_INTERACTIVE):
+                stream = await ollama_client.generate(
+                    model=RERANK_MODEL, prompt=prompt, stream=True, keep_alive=OLLAMA_KEEP_ALIVE
                 )
-                result = reranked_response['response']
+                async for part in stream:
+                    if part.get('done'):
+                        # Статистика (load_duration) приходит в последнем фрагменте
+                        observe_model_call(RERANK_MODEL, part)
+                    token = part.get('response', '')
+                    if token:
+                        tokens.put_nowait(token)
+        except Exception as e:
+            tokens.put_nowait(e)
+            return
+        tokens.put_nowait(None)
 
-        return {
-            "query": request.query,
-            "mode": request.mode,
-            "effective_mode": effective_mode,
-            "tried_modes": tried_modes,
-            "detected_language": detected_lang,
-            "augmented_terms": augmented_terms,
-            "response": result
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Query error: {str(e)}")
+    producer = asyncio.create_task(produce())
+    try:
+        while True:
+            item = await tokens.get()
+            if item is None:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        # Клиент отключился — генерацию останавливаем вместе с потоком
+        if not producer.done():
+            producer.cancel()
+        await asyncio.gather(producer, return_exceptions=True)
+
+
+@app.post("/query/stream")
+async def query_graph_stream(request: QueryRequest):
+    """
+    Потоковый вариант /query (Server-Sent Events)
+
+    События:
+    - metadata: effective_mode, tried_modes, augmented_terms — сразу после retrieval
+    - token: очередной фрагмент переформулированного ответа (RERANK_MODEL)
+    - done: полный ответ (тот же, что вернул бы /query) + timings при timings=true
+    - error: ошибка на любом этапе
+    """
+    require_ready()
+    validate_query_request(request)
+
+    async def event_stream():
+        timings = StageTimings()
+        request_timings.set(timings)
+        workload_class.set(WORKLOAD_INTERACTIVE)
+        try:
+            augmented_query, augmented_terms, detected_lang = build_augmented_query(request.query)
+
+            cache_key = normalize_query_key(augmented_query, request.mode, request.rerank)
+            cached = query_cache.get(cache_key)
+            if cached is not None:
+                metadata = {k: v for k, v in cached.items() if k != "response"}
+                yield sse_event("metadata", {**metadata, "query": request.query, "cache": "hit"})
+                yield sse_event("token", {"text": cached["response"]})
+                done = {"response": cached["response"]}
+                yield sse_event("done", finish_query(
+                    request, timings, done, "query_stream", cached["tried_modes"], "hit"
+                ))
+                return
+            index_version = query_cache.index_version
+
+            result, effective_mode, tried_modes = await execute_query_with_fallbacks(
+                augmented_query,
+                request.mode,
+                request.strategy,
+                request.rerank,
+                lexical_query=build_lexical_query(request.query, augmented_terms)
+            )
+            metadata = {
+                "query": request.query,
+                "mode": request.mode,
+                "effective_mode": effective_mode,
+                "tried_modes": tried_modes,
+                "strategy": request.strategy or QUERY_STRATEGY_DEFAULT,
+                "rerank": request.rerank or RERANK_MODE,
+                "detected_language": detected_lang,
+                "augmented_terms": augmented_terms
+            }
+            yield sse_event("metadata", {**metadata, "cache": "miss"})
+
+            if has_meaningful_result(result):
+                with stage_timer("condensation"):
+                    result = await condense_context(result, request.query, effective_mode)
+                if RERANK_MODEL and effective_mode != MODE_LEXICAL:
+                    chunks = []
+                    with METRIC_REWRITE.time(endpoint="query_stream"), stage_timer("rewrite"):
+                        async for token in stream_rewrite(build_rewrite_prompt(request.query, result)):
+                            chunks.append(token)
+                            yield sse_event("token", {"text": token})
+                    result = "".join(chunks)
+                else:
+                    yield sse_event("token", {"text": result})
+            else:
+                yield sse_event("token", {"text": result})
+
+            query_cache.put(cache_key, {**metadata, "response": result}, index_version)
+            yield sse_event("done", finish_query(
+                request, timings, {"response": result}, "query_stream", tried_modes, "miss"
+            ))
+        except Exception as e:
+            yield sse_event("error", {"detail": f"Query error: {str(e)}"})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @app.post("/insert")
-async def insert_document(request: InsertRequest):
-    """Добавить один документ в граф с обработкой"""
+async def insert_document(request: InsertRequest, wait: bool = False, timings: bool = False):
+    """Добавить один документ в граф с обработкой
+
+    По умолчанию задача ставится в очередь и сразу возвращается job_id
+    (прогресс — GET /jobs/{job_id}). wait=true — старое блокирующее поведение.
+    timings=true — разбивка времени: постановка в очередь, ожидание воркера, индексация.
+    """
+    require_ingest_available()
     print(f"\n[INSERT] Received text: {len(request.text)} chars")
     print(f"[INSERT] Description: {request.description}")
-    
-    try:
-        print("[INSERT] Calling rag.ainsert()...")
-        # Таймаут 120 секунд для 700-символьного чанка
-        await asyncio.wait_for(rag.ainsert(request.text), timeout=120.0)
-        print("[INSERT] Success!")
-        
-        return {
-            "status": "success",
-            "message": "Document inserted and processed",
-            "description": request.description
-        }
-    except Exception as e:
-        import traceback
-        error_msg = f"Insert error: {str(e)}"
-        stack_trace = traceback.format_exc()
+
+    insert_timings = StageTimings()
+    with insert_timings.stage("submit"):
+        job_id = ingest_worker.submit(
+            "insert",
+            [{"name": request.description or "document", "text": request.text}],
+            # Таймаут 120 секунд для 700-символьного чанка
+            {"description": request.description, "timeout": INSERT_TIMEOUT_SECONDS}
+        )
+    if not wait:
+        response = job_accepted(job_id, "insert", 1)
+        if timings:
+            response["timings"] = insert_timings.as_dict()
+        return response
+
+    job = await ingest_worker.wait_for(job_id)
+    if job["status"] == JOB_FAILED:
+        error_msg = f"Insert error: {job['error'] or job['documents'][0]['error']}"
         print(f"\n[ERROR] {error_msg}")
-        print(f"[ERROR] Stack trace:\n{stack_trace}")
-        raise HTTPException(status_code=500, detail=f"{error_msg}\n{stack_trace}")
+        raise HTTPException(status_code=500, detail=error_msg)
+    print("[INSERT] Success!")
+    response = {
+        "status": "success",
+        "message": "Document inserted and processed",
+        "description": request.description,
+        "job_id": job_id
+    }
+    if timings:
+        if job["started_at"]:
+            insert_timings.record("queue_wait", max(0.0, job["started_at"] - job["created_at"]))
+        insert_timings.record("ingest", job["documents"][0]["seconds"] or 0.0)
+        response["timings"] = insert_timings.as_dict()
+    return response
 
 @app.post("/insert_batch")
-async def insert_batch(request: BatchInsertRequest):
-    """Массовая вставка документов"""
-    try:
-        for text in request.texts:
-            await rag.ainsert(text)
-        return {
-            "status": "success",
-            "message": f"Inserted {len(request.texts)} documents"
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Batch insert error: {str(e)}")
+async def insert_batch(request: BatchInsertRequest, wait: bool = False):
+    """Массовая вставка документов (через очередь задач)"""
+    require_ingest_available()
+    job_id = ingest_worker.submit(
+        "insert_batch",
+        [{"name": f"text_{i + 1}", "text": text} for i, text in enumerate(request.texts)]
+    )
+    if not wait:
+        return job_accepted(job_id, "insert_batch", len(request.texts))
+
+    job = await ingest_worker.wait_for(job_id)
+    if job["status"] == JOB_FAILED:
+        raise HTTPException(status_code=500, detail=f"Batch insert error: {job_errors(job)}")
+    return {
+        "status": "success",
+        "message": f"Inserted {len(request.texts)} documents",
+        "job_id": job_id
+    }
 
 @app.post("/index_library")
-async def index_library():
+async def index_library(wait: bool = False, full: bool = False):
     """
     Индексация всей библиотеки (CONSOLIDATED_LIBRARY)
-    ВНИМАНИЕ: Может занять 10-15 минут для больших библиотек
+    Инкрементально по манифесту: индексируются только новые и изменённые
+    файлы, удалённые убираются из графа. full=true — принудительно всё.
+    ВНИМАНИЕ: Полная индексация может занять 10-15 минут для больших библиотек —
+    поэтому по умолчанию выполняется фоновой задачей (GET /jobs/{job_id})
     """
+    require_ingest_available()
     if not LIBRARY_DIR.exists():
         raise HTTPException(status_code=404, detail="Library directory not found")
-    
-    try:
-        indexed_files = []
-        md_files = list(LIBRARY_DIR.glob("*.md"))
-        
-        for md_file in md_files:
-            with open(md_file, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            await rag.ainsert(content)
-            indexed_files.append(md_file.name)
-        
+
+    md_files = list(LIBRARY_DIR.glob("*.md"))
+    # Подкаталоги библиотеки индексирует /api/reindex (rglob) — их записи не трогаем
+    plan = await asyncio.to_thread(index_manifest.plan, LIBRARY_DIR, md_files, full, False)
+    job_id = submit_library_job("index_library", plan, {"library_dir": str(LIBRARY_DIR)}, full)
+    if job_id is None:
         return {
             "status": "success",
-            "message": f"Indexed {len(indexed_files)} files",
-            "files": indexed_files
+            "message": "Library is up to date",
+            "files": [],
+            "job_id": None,
+            "breakdown": manifest_breakdown(plan)
         }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Indexing error: {str(e)}")
+    if not wait:
+        return {
+            **job_accepted(job_id, "index_library", len(md_files) - len(plan["skipped"])),
+            "breakdown": manifest_breakdown(plan)
+        }
+
+    job = await ingest_worker.wait_for(job_id)
+    if job["status"] == JOB_FAILED:
+        raise HTTPException(status_code=500, detail=f"Indexing error: {job_errors(job)}")
+    indexed_files = [
+        Path(doc["name"]).name for doc in job["documents"]
+        if doc["status"] == DOC_DONE and doc["name"] not in plan["removed"]
+    ]
+    return {
+        "status": "success",
+        "message": f"Indexed {len(indexed_files)} files",
+        "files": indexed_files,
+        "job_id": job_id,
+        "breakdown": manifest_breakdown(job["params"]["plan"], job)
+    }
 
 @app.delete("/clear_cache")
 async def clear_cache():
     """Очистить кэш LightRAG (удалить все индексы)"""
+    require_ready()
     try:
         # Удаление файлов кэша
-        for item in WORKING_DIR.glob("*"):
-            if item.is_file():
-                item.unlink()
-            elif item.is_dir():
-                import shutil
-                shutil.rmtree(item)
+        async with index_write_lock:
+            for item in WORKING_DIR.glob("*"):
+                if item.is_file():
+                    item.unlink()
+                elif item.is_dir():
+                    import shutil
+                    shutil.rmtree(item)
         
         return {
             "status": "success",
@@ -585,21 +2117,26 @@ async def clear_cache():
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Clear cache error: {str(e)}")
+    finally:
+        query_cache.invalidate("/clear_cache")
+        await refresh_lexical_index("/clear_cache")
+        request_snapshot("/clear_cache")
 
 @app.post("/api/reindex")
-async def trigger_reindex(watch_dir: str = None):
+async def trigger_reindex(watch_dir: str = None, wait: bool = False, full: bool = False):
     r"""
     Триггер ручной переиндексации документов из указанной директории
     
     Args:
         watch_dir: Путь к директории с документами (по умолчанию E:\AGENTS\Documents_cleaned)
+        wait: Дождаться завершения (по умолчанию — фоновая задача, см. GET /jobs/{job_id})
+        full: Переиндексировать все файлы, игнорируя манифест
     
     Returns:
         Статус индексации с количеством обработанных файлов
+        и разбивкой added/changed/skipped/removed (breakdown)
     """
-    import os
-    from pathlib import Path
-    
+    require_ingest_available()
     if watch_dir is None:
         watch_dir = r"E:\AGENTS\Documents_cleaned"
     
@@ -607,38 +2144,63 @@ async def trigger_reindex(watch_dir: str = None):
     if not watch_path.exists():
         raise HTTPException(status_code=404, detail=f"Directory not found: {watch_dir}")
     
-    try:
-        indexed_files = []
-        skipped_files = []
-        
-        # Сканируем все MD файлы в директории
-        md_files = list(watch_path.rglob("*.md"))
-        
-        for md_file in md_files:
-            try:
-                with open(md_file, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                
-                # Индексируем через LightRAG
-                await rag.ainsert(content)
-                indexed_files.append(str(md_file.relative_to(watch_path)))
-            except Exception as file_error:
-                skipped_files.append({
-                    "file": str(md_file.relative_to(watch_path)),
-                    "error": str(file_error)
-                })
-        
+    # Сканируем все MD файлы в директории
+    md_files = list(watch_path.rglob("*.md"))
+    plan = await asyncio.to_thread(index_manifest.plan, watch_path, md_files, full)
+    job_id = submit_library_job("reindex", plan, {"watch_dir": watch_dir}, full)
+    if job_id is not None and not wait:
         return {
-            "status": "success",
+            **job_accepted(job_id, "reindex", len(md_files) - len(plan["skipped"])),
             "watch_dir": watch_dir,
-            "total_files": len(md_files),
-            "indexed": len(indexed_files),
-            "skipped": len(skipped_files),
-            "indexed_files": indexed_files[:10],  # Первые 10 для обзора
-            "skipped_files": skipped_files
+            "breakdown": manifest_breakdown(plan)
         }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Reindex error: {str(e)}")
+
+    job = await ingest_worker.wait_for(job_id) if job_id else None
+    if job and job["error"]:
+        raise HTTPException(status_code=500, detail=f"Reindex error: {job['error']}")
+
+    def relative(name: str) -> str:
+        return str(Path(name).relative_to(watch_path.resolve()))
+
+    documents = job["documents"] if job else []
+    indexed_files = [
+        relative(doc["name"]) for doc in documents
+        if doc["status"] == DOC_DONE and doc["name"] not in plan["removed"]
+    ]
+    skipped_files = [
+        {"file": relative(doc["name"]), "error": doc["error"]}
+        for doc in documents if doc["status"] == DOC_FAILED
+    ]
+    return {
+        "status": "success",
+        "watch_dir": watch_dir,
+        "total_files": len(md_files),
+        "indexed": len(indexed_files),
+        "skipped": len(skipped_files),
+        "indexed_files": indexed_files[:10],  # Первые 10 для обзора
+        "skipped_files": skipped_files,
+        "job_id": job_id,
+        "breakdown": manifest_breakdown(job["params"]["plan"] if job else plan, job)
+    }
+
+@app.get("/jobs")
+async def list_jobs(limit: int = 50, status: str = None):
+    """Список задач индексации (новые первыми)"""
+    return {
+        "queue_depth": job_store.queue_depth(),
+        "current_job": ingest_worker.current_job_id,
+        "jobs": job_store.list(limit=limit, status=status)
+    }
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Статус задачи: прогресс, время и ошибка по каждому документу"""
+    job = job_store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+    if "plan" in job["params"]:
+        job["breakdown"] = manifest_breakdown(job["params"]["plan"], job)
+    return job
 
 @app.post("/api/git/push")
 async def push_to_github(commit_message: str, branch: str = "main"):
@@ -742,14 +2304,18 @@ if __name__ == "__main__":
     print(f"LLM Model: {LLM_MODEL}")
     print(f"Embedding: {EMBEDDING_MODEL}")
     print(f"Max Async: {LLM_MAX_ASYNC} (optimized for 16GB VRAM)")
+    print(f"Embedding batch: {EMBEDDING_BATCH_SIZE} x {EMBEDDING_MAX_ASYNC} parallel")
+    print(f"Scheduler: interactive > bulk (aging {SCHEDULER_AGING_SECONDS}s)")
+    print(f"Ollama keep_alive: {OLLAMA_KEEP_ALIVE}, keep-warm every {KEEP_WARM_INTERVAL_SECONDS}s (0 = off)")
+    print(f"Role: {CORTEX_ROLE}")
     print("=" * 50)
-    print(f"\nAPI: http://localhost:8004")
-    print(f"Docs: http://localhost:8004/docs\n")
+    print(f"\nAPI: http://localhost:{CORTEX_PORT}")
+    print(f"Docs: http://localhost:{CORTEX_PORT}/docs\n")
     
     uvicorn.run(
         app,
-        host="127.0.0.1",  # Windows-compatible bind address
-        port=8004,
+        host=CORTEX_HOST,  # Windows-compatible bind address (127.0.0.1)
+        port=CORTEX_PORT,
         log_level="info"
     )
 
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Model Warm-up для CORTEX
+Предзагрузка моделей Ollama и удержание их в памяти (keep_alive)
+
+Первый запрос после простоя платил многосекундную загрузку mistral-small
+и nomic-embed-text. ModelKeeper загружает модели при старте, а фоновая
+задача периодически "пингует" простаивающие модели, чтобы Ollama их не выгрузил.
+Пинг — пустой generate / короткий embed: модель загружается, генерации нет.
+"""
+
+import asyncio
+import logging
+import time
+
+MODEL_KIND_LLM = "llm"
+MODEL_KIND_EMBEDDING = "embedding"
+
+
+def parse_keep_alive(value: str):
+    """Ollama принимает длительность ("30m", "1h") или число секунд (-1 — навсегда)."""
+    value = (value or "").strip()
+    if not value:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        return value
+
+
+def load_seconds(response) -> float | None:
+    """load_duration из ответа Ollama (наносекунды) → секунды."""
+    try:
+        duration = response.get("load_duration")
+    except AttributeError:
+        return None
+    return duration / 1e9 if duration else None
+
+
+class ModelKeeper:
+    """Предзагрузка и keep-warm для набора моделей {имя: llm | embedding}.
+
+    on_load(model, seconds, source) вызывается после каждого пинга,
+    source = "prewarm" | "keep_warm" (для метрик).
+    """
+
+    def __init__(self, client, models: dict[str, str], keep_alive, interval_seconds: float, on_load=None):
+        self.client = client
+        self.models = models
+        self.keep_alive = keep_alive
+        self.interval_seconds = interval_seconds
+        self.on_load = on_load
+        self._last_used = {}
+        self._status = {
+            model: {"kind": kind, "loaded": False, "last_ping": None, "last_load_ms": None, "errors": 0}
+            for model, kind in models.items()
+        }
+
+    def mark_used(self, model: str):
+        """Реальный вызов модели тоже продлевает keep_alive — пинг не нужен."""
+        self._last_used[model] = time.monotonic()
+
+    async def ping(self, model: str, source: str) -> float | None:
+        kind = self.models[model]
+        started = time.perf_counter()
+        try:
+            if kind == MODEL_KIND_EMBEDDING:
+                response = await self.client.embed(model=model, input=["warmup"], keep_alive=self.keep_alive)
+            else:
+                # Пустой prompt: Ollama только загружает модель
+                response = await self.client.generate(model=model, prompt="", keep_alive=self.keep_alive)
+        except Exception as e:
+            self._status[model]["errors"] += 1
+            logging.warning(f"[WARMUP] {source} {model} failed: {e}")
+            return None
+        elapsed = time.perf_counter() - started
+        loaded = load_seconds(response)
+        status = self._status[model]
+        status.update(loaded=True, last_ping=time.time(), last_load_ms=round((loaded or 0.0) * 1000, 1))
+        self.mark_used(model)
+        if self.on_load:
+            self.on_load(model, loaded or 0.0, source)
+        return elapsed
+
+    async def prewarm(self):
+        results = await asyncio.gather(*(self.ping(model, "prewarm") for model in self.models))
+        for model, elapsed in zip(self.models, results):
+            if elapsed is not None:
+                print(f"[OK] Модель {model} загружена за {elapsed:.2f}s (keep_alive={self.keep_alive})")
+
+    async def run(self, prewarm: bool = True):
+        """Предзагрузка, затем keep-warm цикл (interval_seconds <= 0 — без цикла)."""
+        if prewarm:
+            await self.prewarm()
+        if self.interval_seconds <= 0:
+            return
+        while True:
+            await asyncio.sleep(self.interval_seconds)
+            now = time.monotonic()
+            for model in self.models:
+                idle = now - self._last_used.get(model, float("-inf"))
+                if idle >= self.interval_seconds:
+                    await self.ping(model, "keep_warm")
+
+    def stats(self) -> dict:
+        return {
+            "keep_alive": self.keep_alive,
+            "keep_warm_interval_seconds": self.interval_seconds,
+            "models": self._status
+        }
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Priority Scheduler для CORTEX
+Приоритетное распределение GPU-слотов между интерактивными запросами и индексацией
+
+LightRAG работает с llm_model_max_async=1, поэтому длинный /index_library
+забивал очередь LLM и /query ждал минутами. Планировщик держит собственную
+очередь ожидающих вызовов с классами приоритета: interactive обслуживается
+первым, bulk — последним. Старение (aging) постепенно повышает приоритет
+ожидающих bulk-вызовов, поэтому индексация всё равно завершается.
+
+В кластере (cluster.py) у каждого процесса свой планировщик, и лимит
+max_concurrent действовал бы на процесс, а не на GPU. ClusterSlots добавляет
+общий для процессов лимит: слот — эксклюзивная блокировка файла slot-<i>.lock
+в общем каталоге (ОС снимает её и при падении процесса).
+"""
+
+import asyncio
+import contextvars
+import itertools
+import time
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+WORKLOAD_INTERACTIVE = "interactive"
+WORKLOAD_BULK = "bulk"
+
+# Меньше = важнее
+WORKLOAD_PRIORITIES = {
+    WORKLOAD_INTERACTIVE: 0,
+    WORKLOAD_BULK: 10,
+}
+
+# Класс нагрузки текущего контекста (выставляется обработчиками запросов и воркером)
+workload_class = contextvars.ContextVar("workload_class", default=None)
+
+
+class _ClassStats:
+    def __init__(self):
+        self.waiting = 0
+        self.running = 0
+        self.completed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.last_wait = 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "queue_depth": self.waiting,
+            "running": self.running,
+            "completed": self.completed,
+            "avg_wait_ms": round(self.total_wait / self.completed * 1000, 2) if self.completed else 0.0,
+            "last_wait_ms": round(self.last_wait * 1000, 2),
+            "max_wait_ms": round(self.max_wait * 1000, 2)
+        }
+
+
+class ClusterSlots:
+    """Межпроцессный семафор на файловых блокировках (flock / msvcrt.locking)."""
+
+    def __init__(self, directory: Path, slots: int, poll_seconds: float = 0.05):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.slots = max(1, slots)
+        self.poll_seconds = poll_seconds
+        self.contended = 0
+
+    def _try_lock(self, index: int):
+        handle = open(self.directory / f"slot-{index}.lock", "a+b")
+        try:
+            if fcntl is not None:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                handle.seek(0)
+                msvcrt.locking(handle.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            handle.close()
+            return None
+        return handle
+
+    async def acquire(self):
+        """Ждёт свободный слот (опрос раз в poll_seconds); возвращает handle для release."""
+        while True:
+            for index in range(self.slots):
+                handle = self._try_lock(index)
+                if handle is not None:
+                    return handle
+            self.contended += 1
+            await asyncio.sleep(self.poll_seconds)
+
+    def release(self, handle):
+        try:
+            if fcntl is not None:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+            else:
+                handle.seek(0)
+                msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            handle.close()
+
+    def stats(self) -> dict:
+        return {"directory": str(self.directory), "slots": self.slots, "contended_polls": self.contended}
+
+
+class PriorityScheduler:
+    """Ограничивает параллелизм max_concurrent и выдаёт слоты по приоритету.
+
+    Эффективный приоритет ожидающего = базовый - время_ожидания / aging_seconds;
+    при равенстве побеждает тот, кто ждёт дольше. С cluster_slots получивший
+    локальный слот дополнительно ждёт общий слот кластера.
+    """
+
+    def __init__(self, name: str, max_concurrent: int, aging_seconds: float = 30.0,
+                 cluster_slots: ClusterSlots = None):
+        self.name = name
+        self.cluster_slots = cluster_slots
+        self.max_concurrent = max(1, max_concurrent)
+        self.aging_seconds = aging_seconds
+        self._running = 0
+        self._waiters = []  # [enqueued_at, seq, workload, future]
+        self._seq = itertools.count()
+        self._stats = {workload: _ClassStats() for workload in WORKLOAD_PRIORITIES}
+
+    def _effective_priority(self, waiter, now: float) -> tuple:
+        enqueued_at, seq, workload, _ = waiter
+        aging = (now - enqueued_at) / self.aging_seconds if self.aging_seconds > 0 else 0.0
+        return (WORKLOAD_PRIORITIES[workload] - aging, seq)
+
+    def _dispatch(self):
+        while self._running < self.max_concurrent and self._waiters:
+            now = time.monotonic()
+            waiter = min(self._waiters, key=lambda w: self._effective_priority(w, now))
+            self._waiters.remove(waiter)
+            if waiter[3].done():
+                # Ожидающий отменён (разрыв соединения, проигравший race, таймаут),
+                # а его acquire ещё не успел убрать себя из очереди — слот не выдаём
+                continue
+            self._running += 1
+            waiter[3].set_result(None)
+
+    async def acquire(self, workload: str):
+        stats = self._stats[workload]
+        enqueued_at = time.monotonic()
+        if self._running < self.max_concurrent and not self._waiters:
+            self._running += 1
+        else:
+            future = asyncio.get_running_loop().create_future()
+            waiter = [enqueued_at, next(self._seq), workload, future]
+            self._waiters.append(waiter)
+            stats.waiting += 1
+            try:
+                self._dispatch()
+                await future
+            except asyncio.CancelledError:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                elif future.done() and not future.cancelled():
+                    # Слот уже выдан, но ожидающий отменён — возвращаем слот
+                    self._running -= 1
+                    self._dispatch()
+                else:
+                    # Будущее отменено до выдачи: очередь могла продвинуться без нас
+                    self._dispatch()
+                raise
+            finally:
+                stats.waiting -= 1
+        waited = time.monotonic() - enqueued_at
+        stats.running += 1
+        stats.total_wait += waited
+        stats.last_wait = waited
+        stats.max_wait = max(stats.max_wait, waited)
+
+    def release(self, workload: str):
+        stats = self._stats[workload]
+        stats.running -= 1
+        stats.completed += 1
+        self._running -= 1
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, workload: str = None):
+        workload = workload or workload_class.get() or WORKLOAD_INTERACTIVE
+        await self.acquire(workload)
+        handle = None
+        try:
+            if self.cluster_slots is not None:
+                handle = await self.cluster_slots.acquire()
+            yield
+        finally:
+            if handle is not None:
+                self.cluster_slots.release(handle)
+            self.release(workload)
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrent": self.max_concurrent,
+            "running": self._running,
+            "aging_seconds": self.aging_seconds,
+            "cluster": self.cluster_slots.stats() if self.cluster_slots else None,
+            "classes": {workload: stats.as_dict() for workload, stats in self._stats.items()}
+        }
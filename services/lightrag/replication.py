@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Index Replication для CORTEX
+Публикация версий индекса писателем и подхват их читающими воркерами
+
+Многопроцессный режим (см. cluster.py): один процесс-писатель владеет
+индексацией и публикует снимок WORKING_DIR как новую версию; N процессов-
+читателей обслуживают /query и перечитывают индекс, когда видят новую версию.
+
+Публикация — полная копия WORKING_DIR (и ещё по копии у каждого читателя),
+поэтому она не идёт после каждой задачи: задачи отмечают изменения через
+request(), а писатель публикует их пачкой, когда очередь ингеста опустела
+(или изменения ждут дольше max_delay), но не чаще раза в min_interval.
+
+Раскладка (snapshot_root):
+    CURRENT          {"version": N, "published_at": ...} — атомарная замена
+    v<N>/            неизменяемая копия WORKING_DIR версии N
+
+Читатель не работает со снимком напрямую: LightRAG при запросах пишет свой
+LLM-кэш, поэтому каждый процесс копирует версию в собственный каталог
+replica_root/v<N> (workspace LightRAG = "v<N>").
+"""
+
+import json
+import logging
+import os
+import shutil
+import time
+from pathlib import Path
+
+CURRENT_FILE = "CURRENT"
+
+
+def _copy_tree(source: Path, target: Path):
+    """Копия каталога через временное имя + rename (читатель не увидит половину)."""
+    tmp = target.with_name(f".tmp-{target.name}-{os.getpid()}")
+    if tmp.exists():
+        shutil.rmtree(tmp)
+    shutil.copytree(source, tmp)
+    if target.exists():
+        shutil.rmtree(target)
+    os.replace(tmp, target)
+
+
+def read_current(snapshot_root: Path) -> dict | None:
+    try:
+        with open(Path(snapshot_root) / CURRENT_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+class SnapshotPublisher:
+    """Сторона писателя: WORKING_DIR → snapshot_root/v<N> + CURRENT."""
+
+    def __init__(self, working_dir: Path, snapshot_root: Path, keep: int = 3,
+                 min_interval: float = 10.0, max_delay: float = 300.0):
+        self.working_dir = Path(working_dir)
+        self.snapshot_root = Path(snapshot_root)
+        self.keep = max(2, keep)
+        self.min_interval = min_interval
+        self.max_delay = max_delay
+        self.snapshot_root.mkdir(parents=True, exist_ok=True)
+        self.last_publish_seconds = None
+        self.publishes = 0
+        self.coalesced = 0
+        self._pending = []  # причины изменений, ещё не попавших в версию
+        self._pending_since = None
+        self._last_published_at = None
+
+    def current_version(self) -> int:
+        current = read_current(self.snapshot_root)
+        return current["version"] if current else 0
+
+    def request(self, reason: str):
+        """Отметить изменение индекса; опубликует его ближайший publish."""
+        if not self._pending:
+            self._pending_since = time.monotonic()
+        self._pending.append(reason)
+
+    def due(self, idle: bool) -> bool:
+        """Пора ли публиковать: есть изменения, выдержан min_interval и
+        очередь пуста (idle) либо изменения ждут дольше max_delay."""
+        if not self._pending:
+            return False
+        now = time.monotonic()
+        if self._last_published_at is not None and now - self._last_published_at < self.min_interval:
+            return False
+        return idle or now - self._pending_since >= self.max_delay
+
+    def take_pending(self) -> str:
+        """Забирает накопленные изменения; возвращает reason для publish."""
+        reasons, self._pending = self._pending, []
+        self.coalesced += max(len(reasons) - 1, 0)
+        if len(reasons) == 1:
+            return reasons[0]
+        return f"{len(reasons)} changes: {reasons[0]} .. {reasons[-1]}"
+
+    def publish(self, reason: str = "") -> int:
+        """Синхронная операция (копирование файлов) — вызывать через to_thread."""
+        started = time.perf_counter()
+        version = self.current_version() + 1
+        _copy_tree(self.working_dir, self.snapshot_root / f"v{version}")
+
+        current = {"version": version, "published_at": time.time(), "reason": reason}
+        tmp = self.snapshot_root / f"{CURRENT_FILE}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(current, f)
+        os.replace(tmp, self.snapshot_root / CURRENT_FILE)
+
+        self._prune(version)
+        self.last_publish_seconds = time.perf_counter() - started
+        self._last_published_at = time.monotonic()
+        self.publishes += 1
+        logging.info(f"[REPLICA] Published index v{version} ({reason}) in {self.last_publish_seconds:.2f}s")
+        return version
+
+    def _prune(self, version: int):
+        # Старые версии оставляем с запасом: читатель может ещё копировать предыдущую
+        for path in self.snapshot_root.glob("v*"):
+            try:
+                old = int(path.name[1:])
+            except ValueError:
+                continue
+            if old <= version - self.keep:
+                shutil.rmtree(path, ignore_errors=True)
+
+    def stats(self) -> dict:
+        return {
+            "snapshot_root": str(self.snapshot_root),
+            "version": self.current_version(),
+            "last_publish_seconds": round(self.last_publish_seconds, 3) if self.last_publish_seconds else None,
+            "publishes": self.publishes,
+            "coalesced": self.coalesced,
+            "pending": len(self._pending),
+            "min_interval_seconds": self.min_interval,
+            "max_delay_seconds": self.max_delay
+        }
+
+
+class SnapshotFollower:
+    """Сторона читателя: отслеживает CURRENT и готовит локальную копию версии."""
+
+    def __init__(self, snapshot_root: Path, replica_root: Path):
+        self.snapshot_root = Path(snapshot_root)
+        self.replica_root = Path(replica_root)
+        self.replica_root.mkdir(parents=True, exist_ok=True)
+        self.loaded_version = 0
+        self.loaded_at = None
+        self.reloads = 0
+
+    def newer_version(self) -> int | None:
+        current = read_current(self.snapshot_root)
+        if current and current["version"] > self.loaded_version:
+            return current["version"]
+        return None
+
+    def materialize(self, version: int) -> str:
+        """Копирует версию в replica_root/v<N>; возвращает workspace для LightRAG."""
+        workspace = f"v{version}"
+        _copy_tree(self.snapshot_root / workspace, self.replica_root / workspace)
+        return workspace
+
+    def mark_loaded(self, version: int):
+        self.loaded_version = version
+        self.loaded_at = time.time()
+        self.reloads += 1
+
+    def discard(self, workspace: str):
+        shutil.rmtree(self.replica_root / workspace, ignore_errors=True)
+
+    def discard_all(self):
+        shutil.rmtree(self.replica_root, ignore_errors=True)
+
+    def stats(self) -> dict:
+        return {
+            "snapshot_root": str(self.snapshot_root),
+            "replica_root": str(self.replica_root),
+            "loaded_version": self.loaded_version,
+            "loaded_at": self.loaded_at,
+            "reloads": self.reloads
+        }
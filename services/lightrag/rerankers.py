@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Rerankers для CORTEX
+Реализации rerank_model_func в формате LightRAG: [{"index": i, "relevance_score": s}, ...]
+
+- embedding_rerank: запрос эмбеддится один раз, кандидаты оцениваются
+  векторизованным косинусным сходством (батч эмбеддингов, кэш переиспользуется)
+- llm_pointwise_rerank: прежний вариант — один generate на документ (0-10)
+- llm_listwise_rerank: все кандидаты в одном промпте, ответ — ранжированный список
+
+Функции не зависят от сервера: embed/generate передаются параметрами,
+поэтому их же использует bench_rerank.py.
+"""
+
+import re
+
+import numpy as np
+
+# Ограничение длины документа для оценки (символы)
+RERANK_DOC_MAX_CHARS = 2000
+
+
+def rank_results(scores, top_n: int = None) -> list[dict]:
+    """Сортирует оценки по убыванию и возвращает index-формат LightRAG."""
+    scores = np.asarray(scores, dtype=np.float32)
+    order = np.argsort(-scores, kind="stable")
+    if top_n:
+        order = order[:top_n]
+    return [{"index": int(i), "relevance_score": float(scores[i])} for i in order]
+
+
+def cosine_scores(query_vector, doc_vectors) -> np.ndarray:
+    """Косинусное сходство запроса со всеми документами одной матричной операцией."""
+    query = np.asarray(query_vector, dtype=np.float32)
+    docs = np.asarray(doc_vectors, dtype=np.float32)
+    if docs.ndim != 2 or docs.shape[0] == 0:
+        return np.zeros(0, dtype=np.float32)
+    doc_norms = np.linalg.norm(docs, axis=1)
+    query_norm = np.linalg.norm(query)
+    denominator = np.maximum(doc_norms * query_norm, 1e-12)
+    return (docs @ query) / denominator
+
+
+async def embedding_rerank(embed, query: str, documents: list[str], top_n: int = None) -> list[dict]:
+    """embed(texts) -> list[vector]. Один вызов на запрос + все кандидаты."""
+    if not documents:
+        return []
+    texts = [query] + [doc[:RERANK_DOC_MAX_CHARS] for doc in documents]
+    vectors = await embed(texts)
+    return rank_results(cosine_scores(vectors[0], vectors[1:]), top_n)
+
+
+def build_pointwise_prompt(query: str, document: str) -> str:
+    # Формируем промпт для оценки релевантности (0-10)
+    return f"""Оцени релевантность документа для запроса по шкале 0-10.
+Запрос: {query}
+
+Документ: {document[:500]}...
+
+Ответь только числом от 0 до 10:"""
+
+
+async def llm_pointwise_rerank(generate, query: str, documents: list[str], top_n: int = None) -> list[dict]:
+    """generate(prompt) -> str. N документов = N последовательных генераций."""
+    scores = []
+    for doc in documents:
+        answer = await generate(build_pointwise_prompt(query, doc))
+        try:
+            score = float(answer.strip())
+            scores.append(min(10.0, max(0.0, score)) / 10.0)  # Ограничение 0-10 → 0-1
+        except ValueError:
+            scores.append(0.5)  # Средний скор при ошибке парсинга
+    return rank_results(scores, top_n)
+
+
+def build_listwise_prompt(query: str, documents: list[str], max_chars: int = 400) -> str:
+    """Все кандидаты (усечённые) в одном промпте — одна генерация вместо N."""
+    numbered = "\n\n".join(
+        f"[{i}] {doc[:max_chars].strip()}" for i, doc in enumerate(documents, 1)
+    )
+    return f"""Отранжируй документы по релевантности запросу.
+Запрос: {query}
+
+Документы:
+{numbered}
+
+Ответь только JSON-списком номеров документов от самого релевантного к наименее релевантному, например: [3, 1, 2]"""
+
+
+def parse_listwise_ranking(text: str, count: int) -> list[float]:
+    """Разбирает ответ listwise-ранжирования в вектор оценок (0-1) длины count.
+
+    Понимает оба варианта ответа:
+    - ранжированный список номеров: "[3, 1, 2]", "[3] > [1] > [2]", "1. док 3\n2. док 1"
+    - вектор оценок: "[0.2, 0.9, 0.5]" или {"scores": [2, 9, 5]} (длина = count)
+    Устойчив к мусору вокруг ответа: номера вне диапазона и повторы игнорируются,
+    не упомянутые документы идут после упомянутых в исходном порядке.
+    Если ничего не распознано — исходный порядок.
+    """
+    text = text or ""
+    groups = re.findall(r"\[([^\[\]]*)\]", text)
+    numeric_groups = [group for group in groups if re.search(r"\d", group)]
+
+    # Вектор оценок: явный ключ scores или дробные значения по числу документов
+    for group in numeric_groups:
+        values = re.findall(r"-?\d+(?:\.\d+)?", group)
+        if len(values) == count and ("scores" in text.lower() or any("." in value for value in values)):
+            scores = [max(0.0, float(value)) for value in values]
+            top = max(scores) or 1.0
+            return [score / top for score in scores]
+
+    if numeric_groups and len(re.findall(r"\d+", numeric_groups[0])) > 1:
+        tokens = re.findall(r"\d+", numeric_groups[0])
+    elif numeric_groups:
+        # "[3] > [1] > [2]" — по одному номеру в каждых скобках
+        tokens = [token for group in numeric_groups for token in re.findall(r"\d+", group)]
+    else:
+        # Нумерованный список строк: отбрасываем "1." / "2)" в начале строки
+        stripped = re.sub(r"(?m)^\s*\d+[.)]\s+", "", text)
+        tokens = re.findall(r"\d+", stripped)
+
+    ranking = []
+    for token in tokens:
+        position = int(token) - 1
+        if 0 <= position < count and position not in ranking:
+            ranking.append(position)
+    ranking.extend(i for i in range(count) if i not in ranking)
+    scores = [0.0] * count
+    for rank, index in enumerate(ranking):
+        scores[index] = 1.0 - rank / max(1, count)
+    return scores
+
+
+async def llm_listwise_rerank(generate, query: str, documents: list[str], top_n: int = None) -> list[dict]:
+    """generate(prompt) -> str. Один вызов LLM на весь список кандидатов."""
+    if not documents:
+        return []
+    answer = await generate(build_listwise_prompt(query, documents))
+    return rank_results(parse_listwise_ranking(answer, len(documents)), top_n)
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Term Expansion Engine для CORTEX
+Расширение запросов RU/EN техническими синонимами за один проход
+
+Карта синонимов загружается из JSON-файла (term_synonyms.json), компилируется
+в автомат Ахо-Корасик и перечитывается при изменении файла без рестарта сервера.
+Время сопоставления зависит от длины запроса, а не от числа терминов.
+
+Формат файла:
+{
+  "entries": [
+    {"keywords_en": [...], "ru_expansions": [...],
+     "keywords_ru": [...], "en_expansions": [...]}
+  ]
+}
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from pathlib import Path
+
+
+class AhoCorasick:
+    """Мульти-паттерн поиск подстрок: все вхождения всех ключей за один проход."""
+
+    def __init__(self, patterns: dict[str, object]):
+        # Узел: переходы, fail-ссылка, выходы (значения паттернов)
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        for pattern, value in patterns.items():
+            if pattern:
+                self._add(pattern, value)
+        self._build()
+
+    def _add(self, pattern: str, value):
+        node = 0
+        for char in pattern:
+            nxt = self._goto[node].get(char)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][char] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = nxt
+        self._out[node].append(value)
+
+    def _build(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, nxt in self._goto[node].items():
+                queue.append(nxt)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(char, 0)
+                self._out[nxt].extend(self._out[self._fail[nxt]])
+
+    def find_all(self, text: str) -> list:
+        """Значения всех паттернов, встретившихся в text (с повторами)."""
+        found = []
+        node = 0
+        for char in text:
+            while node and char not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(char, 0)
+            if self._out[node]:
+                found.extend(self._out[node])
+        return found
+
+    @property
+    def size(self) -> int:
+        return len(self._goto)
+
+
+class TermExpander:
+    """Компилированная карта синонимов с горячей перезагрузкой по mtime."""
+
+    def __init__(self, path: Path, reload_check_seconds: float = 2.0):
+        self.path = Path(path)
+        self.reload_check_seconds = reload_check_seconds
+        self._lock = threading.Lock()
+        self._entries = []
+        self._matcher = AhoCorasick({})
+        self._mtime_ns = None
+        self._checked_at = float("-inf")
+        self.reloads = 0
+        self.maybe_reload(force=True)
+
+    def _compile(self, entries: list[dict]) -> AhoCorasick:
+        # Ключ → список (индекс записи, направление); "en" — найден EN-ключ → RU-расширения
+        patterns = {}
+        for index, entry in enumerate(entries):
+            for direction, field in (("en", "keywords_en"), ("ru", "keywords_ru")):
+                for keyword in entry.get(field, []):
+                    patterns.setdefault(keyword.lower(), []).append((index, direction))
+        return AhoCorasick(patterns)
+
+    def maybe_reload(self, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self._checked_at < self.reload_check_seconds:
+            return
+        self._checked_at = now
+        try:
+            mtime_ns = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            if force:
+                logging.warning(f"[TERMS] Synonym file not found: {self.path}")
+            return
+        if mtime_ns == self._mtime_ns:
+            return
+        with self._lock:
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    entries = json.load(f).get("entries", [])
+                matcher = self._compile(entries)
+            except Exception as e:
+                # Битый файл не должен ронять запросы — остаётся предыдущая карта
+                logging.warning(f"[TERMS] Failed to load {self.path}: {e}")
+                self._mtime_ns = mtime_ns
+                return
+            self._entries, self._matcher, self._mtime_ns = entries, matcher, mtime_ns
+            self.reloads += 1
+        logging.info(f"[TERMS] Loaded {len(entries)} synonym entries ({matcher.size} automaton states)")
+
+    def expand(self, text: str) -> list[str]:
+        """Расширения для запроса в порядке записей карты, без дубликатов."""
+        self.maybe_reload()
+        entries, matcher = self._entries, self._matcher
+        matched = {}
+        for values in matcher.find_all(text.lower()):
+            for index, direction in values:
+                matched.setdefault(index, set()).add(direction)
+
+        additions = []
+        for index in sorted(matched):
+            entry = entries[index]
+            if "en" in matched[index]:
+                additions.extend(entry.get("ru_expansions", []))
+            if "ru" in matched[index]:
+                additions.extend(entry.get("en_expansions", []))
+        # Удаляем дубликаты, сохраняя порядок
+        return list(dict.fromkeys(additions))
+
+    def stats(self) -> dict:
+        return {
+            "path": str(self.path),
+            "entries": len(self._entries),
+            "automaton_states": self._matcher.size,
+            "reloads": self.reloads
+        }
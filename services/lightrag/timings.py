@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Request Timings для CORTEX
+Разбивка времени одного запроса по этапам + журнал медленных запросов
+
+Текущий StageTimings лежит в contextvar: обработчик /query создаёт его,
+а этапы (аугментация, retrieval-режимы, сжатие, переформулирование) пишут
+в него через stage_timer/record_mode без протаскивания параметра.
+Задачи asyncio наследуют контекст, поэтому параллельные режимы strategy=race
+записываются в тот же объект.
+"""
+
+import contextvars
+import json
+import logging
+import time
+from contextlib import contextmanager
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+
+request_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+def _ms(seconds: float) -> float:
+    return round(seconds * 1000, 2)
+
+
+class StageTimings:
+    """Длительности этапов одного запроса (повторные этапы суммируются)."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.retrieval = {}
+
+    def record(self, stage: str, seconds: float):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def record_mode(self, mode: str, seconds: float):
+        self.retrieval[mode] = self.retrieval.get(mode, 0.0) + seconds
+
+    @contextmanager
+    def stage(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    def merge(self, other: "StageTimings"):
+        for stage, seconds in other.stages.items():
+            self.record(stage, seconds)
+        for mode, seconds in other.retrieval.items():
+            self.record_mode(mode, seconds)
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def as_dict(self) -> dict:
+        result = {f"{stage}_ms": _ms(seconds) for stage, seconds in self.stages.items()}
+        if self.retrieval:
+            result["retrieval_ms"] = {mode: _ms(seconds) for mode, seconds in self.retrieval.items()}
+        result["total_ms"] = _ms(self.elapsed())
+        return result
+
+
+@contextmanager
+def stage_timer(stage: str):
+    """Замер этапа в текущий StageTimings (если запрос его собирает)."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings = request_timings.get()
+        if timings is not None:
+            timings.record(stage, time.perf_counter() - started)
+
+
+def record_mode(mode: str, seconds: float):
+    timings = request_timings.get()
+    if timings is not None:
+        timings.record_mode(mode, seconds)
+
+
+class SlowQueryLog:
+    """JSON Lines журнал запросов дольше порога, с ротацией по размеру."""
+
+    def __init__(self, path: Path, threshold_seconds: float, max_bytes: int, backup_count: int):
+        self.path = Path(path)
+        self.threshold_seconds = threshold_seconds
+        self.logged = 0
+        self._logger = logging.getLogger("cortex.slow_queries")
+        self._logger.propagate = False
+        self._logger.setLevel(logging.INFO)
+        if threshold_seconds > 0 and not self._logger.handlers:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            handler = RotatingFileHandler(
+                self.path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8"
+            )
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            self._logger.addHandler(handler)
+
+    @property
+    def enabled(self) -> bool:
+        return self.threshold_seconds > 0
+
+    def maybe_log(self, timings: StageTimings, record: dict) -> bool:
+        if not self.enabled or timings.elapsed() < self.threshold_seconds:
+            return False
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            **record,
+            "timings": timings.as_dict()
+        }
+        self._logger.info(json.dumps(entry, ensure_ascii=False))
+        self.logged += 1
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "threshold_seconds": self.threshold_seconds,
+            "path": str(self.path),
+            "logged": self.logged
+        }
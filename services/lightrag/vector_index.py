@@ -0,0 +1,470 @@
+#!/usr/bin/env python3
+"""
+Vector Index для CORTEX
+Приближённый поиск ближайших соседей (IVF) для векторных хранилищ LightRAG
+
+NanoVectorDB ищет полным перебором: скалярное произведение запроса со всей
+матрицей 768-d векторов nomic-embed-text — стоимость растёт линейно с
+библиотекой. IVF (inverted file):
+
+- векторы кластеризуются сферическим k-means на nlist списков (центроидов)
+- запрос сравнивается с центроидами, просматриваются nprobe ближайших списков
+- векторы лежат на диске в порядке списков (vectors.npy, memory-map): список —
+  непрерывный участок файла, в память попадают только просмотренные списки
+- векторы индекса можно хранить квантованными: float16 (2 байта на измерение)
+  или int8 (1 байт, скалярное квантование с масштабом по каждому измерению);
+  поиск идёт по квантованным векторам, лучшие кандидаты при желании
+  переоцениваются полноточными векторами (rescore)
+- Matryoshka: nomic-embed-text обучен так, что первые 128/256 измерений сами
+  по себе — осмысленный эмбеддинг. Индекс может хранить только первые dims
+  измерений (перенормированные): первая стадия отбирает rescore*top_k
+  кандидатов по усечённым векторам, вторая — переоценивает их полными 768-d
+
+Раскладка индекса (каталог рядом с vdb_<namespace>.json):
+    meta.json       формат, число строк, nlist, отпечаток id строк
+    centroids.npy   float32 [nlist, dim]
+    offsets.npy     int64 [nlist + 1] — границы списков
+    rows.npy        int32 — номер строки NanoVectorDB для каждой позиции
+    vectors.npy     float32 | float16 | int8 [count, dims] — нормированные векторы по спискам
+    scale.npy       float32 [dim] — только int8: x ≈ code * scale + base
+    base.npy        float32 [dim]
+
+IVFVectorDBStorage — векторное хранилище LightRAG (vector_storage="IVFVectorDBStorage"):
+NanoVectorDB остаётся источником истины (запись, JSON-файл), а query идёт через
+IVF-индекс, если он построен для текущего содержимого; строки, добавленные
+после построения, досматриваются перебором, итоговые оценки (rescore) — по
+живой полноточной матрице.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import os
+import shutil
+import time
+from pathlib import Path
+
+import numpy as np
+
+try:
+    # write_seq и DEFAULT_QUERY_PRIORITY есть только в LightRAG 1.5.7+ (см. requirements.txt)
+    from lightrag.kg.nano_vector_db_impl import NanoVectorDBStorage
+    from lightrag.kg.write_seq import WRITE_SEQ_FIELD
+    from lightrag.constants import DEFAULT_QUERY_PRIORITY
+    IMPORT_ERROR = None
+except ImportError as e:  # бенчмарк и IVFIndex работают и без LightRAG
+    NanoVectorDBStorage = None
+    IMPORT_ERROR = e
+
+STORAGE_NAME = "IVFVectorDBStorage"
+INDEX_FORMAT = 3
+VECTOR_DTYPES = ("float32", "float16", "int8")
+META_FILE = "meta.json"
+
+
+def normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+def ids_fingerprint(ids) -> str:
+    """Отпечаток набора и порядка строк: индекс годится, только если он совпадает."""
+    digest = hashlib.md5()
+    for row_id in ids:
+        digest.update(row_id.encode("utf-8"))
+        digest.update(b"\n")
+    return digest.hexdigest()
+
+
+def quantize(vectors: np.ndarray, dtype: str) -> tuple[np.ndarray, dict]:
+    """Кодирование векторов для хранения: (коды, параметры декодирования)."""
+    if dtype == "float32":
+        return vectors.astype(np.float32), {}
+    if dtype == "float16":
+        return vectors.astype(np.float16), {}
+    if dtype == "int8":
+        # 256 уровней на измерение между его минимумом и максимумом по всем векторам
+        lo = vectors.min(axis=0)
+        scale = np.maximum(vectors.max(axis=0) - lo, 1e-12) / 255.0
+        codes = np.clip(np.round((vectors - lo) / scale) - 128, -128, 127).astype(np.int8)
+        return codes, {"scale": scale.astype(np.float32), "base": (lo + 128 * scale).astype(np.float32)}
+    raise ValueError(f"Unknown vector dtype: {dtype} (expected one of {', '.join(VECTOR_DTYPES)})")
+
+
+def auto_nlist(count: int) -> int:
+    return max(1, min(count, int(4 * math.sqrt(count))))
+
+
+def assign_lists(vectors: np.ndarray, centroids: np.ndarray, batch: int = 8192) -> np.ndarray:
+    """Номер ближайшего центроида (по косинусу) для каждого вектора, пачками."""
+    assignments = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), batch):
+        assignments[start:start + batch] = np.argmax(vectors[start:start + batch] @ centroids.T, axis=1)
+    return assignments
+
+
+def train_centroids(vectors: np.ndarray, nlist: int, iterations: int = 10, seed: int = 0,
+                    sample_per_list: int = 32) -> np.ndarray:
+    """Сферический k-means на подвыборке (nlist * sample_per_list векторов)."""
+    rng = np.random.default_rng(seed)
+    sample_size = min(len(vectors), nlist * sample_per_list)
+    sample = vectors[np.sort(rng.choice(len(vectors), sample_size, replace=False))]
+    centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = assign_lists(sample, centroids)
+        order = np.argsort(assignments, kind="stable")
+        counts = np.bincount(assignments, minlength=nlist)
+        sums = np.zeros_like(centroids)
+        present = counts > 0
+        starts = (np.cumsum(counts) - counts)[present]
+        sums[present] = np.add.reduceat(sample[order], starts, axis=0)
+        # Пустой список получает случайную точку выборки, чтобы не терять центроид
+        empty = np.flatnonzero(~present)
+        sums[empty] = sample[rng.choice(sample_size, len(empty))]
+        centroids = normalize(sums).astype(np.float32)
+    return centroids
+
+
+class IVFIndex:
+    """IVF-индекс, загруженный с диска (векторы и номера строк — memory-map)."""
+
+    def __init__(self, directory: Path, meta: dict, centroids: np.ndarray, offsets: np.ndarray,
+                 rows: np.ndarray, vectors: np.ndarray, quantization: dict | None = None):
+        self.directory = Path(directory)
+        self.meta = meta
+        self.centroids = centroids
+        self.offsets = offsets
+        self.rows = rows
+        self.vectors = vectors
+        self.quantization = quantization or {}
+
+    @property
+    def count(self) -> int:
+        return self.meta["count"]
+
+    @property
+    def nlist(self) -> int:
+        return len(self.centroids)
+
+    @property
+    def fingerprint(self) -> str:
+        return self.meta["fingerprint"]
+
+    @property
+    def dtype(self) -> str:
+        return self.meta["dtype"]
+
+    @property
+    def dims(self) -> int:
+        return self.meta["dim"]
+
+    @classmethod
+    def build(cls, directory: Path, matrix: np.ndarray, ids: list[str], nlist: int = 0,
+              iterations: int = 10, seed: int = 0, dtype: str = "float32", dims: int = 0) -> "IVFIndex":
+        """Синхронная операция (k-means + запись файлов) — вызывать через to_thread.
+
+        dims > 0 — хранить только первые dims измерений (Matryoshka).
+        """
+        directory = Path(directory)
+        vectors = np.asarray(matrix, dtype=np.float32)
+        if dims:
+            vectors = vectors[:, :dims]
+        vectors = normalize(vectors).astype(np.float32)
+        nlist = min(nlist or auto_nlist(len(vectors)), len(vectors))
+        centroids = train_centroids(vectors, nlist, iterations=iterations, seed=seed)
+        assignments = assign_lists(vectors, centroids)
+        order = np.argsort(assignments, kind="stable").astype(np.int32)
+        offsets = np.zeros(nlist + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignments, minlength=nlist), out=offsets[1:])
+
+        tmp = directory.with_name(f".tmp-{directory.name}-{os.getpid()}")
+        if tmp.exists():
+            shutil.rmtree(tmp)
+        tmp.mkdir(parents=True)
+        np.save(tmp / "centroids.npy", centroids)
+        np.save(tmp / "offsets.npy", offsets)
+        np.save(tmp / "rows.npy", order)
+        codes, quantization = quantize(vectors[order], dtype)
+        np.save(tmp / "vectors.npy", codes)
+        for name, values in quantization.items():
+            np.save(tmp / f"{name}.npy", values)
+        meta = {
+            "format": INDEX_FORMAT,
+            "count": len(vectors),
+            "dim": vectors.shape[1] if vectors.ndim == 2 else 0,
+            "nlist": nlist,
+            "dtype": dtype,
+            "fingerprint": ids_fingerprint(ids),
+            "built_at": time.time()
+        }
+        with open(tmp / META_FILE, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        if directory.exists():
+            shutil.rmtree(directory)
+        os.replace(tmp, directory)
+        return cls.load(directory)
+
+    @classmethod
+    def load(cls, directory: Path) -> "IVFIndex | None":
+        directory = Path(directory)
+        try:
+            with open(directory / META_FILE, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            if meta.get("format") != INDEX_FORMAT:
+                return None
+            quantization = {}
+            if meta["dtype"] == "int8":
+                quantization = {name: np.load(directory / f"{name}.npy") for name in ("scale", "base")}
+            return cls(
+                directory,
+                meta,
+                np.load(directory / "centroids.npy"),
+                np.load(directory / "offsets.npy"),
+                np.load(directory / "rows.npy", mmap_mode="r"),
+                np.load(directory / "vectors.npy", mmap_mode="r"),
+                quantization
+            )
+        except (FileNotFoundError, json.JSONDecodeError, ValueError) as e:
+            if not isinstance(e, FileNotFoundError):
+                logging.warning(f"[IVF] Index {directory} unreadable: {e}")
+            return None
+
+    def probe_lists(self, query: np.ndarray, nprobe: int) -> np.ndarray:
+        scores = self.centroids @ np.asarray(query, dtype=np.float32)[:self.dims]
+        if nprobe >= len(scores):
+            return np.argsort(-scores)
+        probe = np.argpartition(-scores, nprobe - 1)[:nprobe]
+        return probe[np.argsort(-scores[probe])]
+
+    def search(self, query: np.ndarray, top_k: int, nprobe: int) -> tuple[np.ndarray, np.ndarray]:
+        """(номера строк, косинусы) top_k кандидатов из nprobe ближайших списков.
+
+        Для float16/int8 и усечённых dims косинусы приближённые. Запрос можно
+        передавать полной размерности — он усекается до dims индекса.
+        """
+        query = normalize(np.asarray(query, dtype=np.float32)[:self.dims])
+        # int8: code·(scale*q) + base·q — декодировать сами векторы не нужно
+        weights, bias = query, 0.0
+        if self.quantization:
+            weights, bias = self.quantization["scale"] * query, float(self.quantization["base"] @ query)
+        rows, scores = [], []
+        for lst in self.probe_lists(query, nprobe).tolist():
+            start, end = self.offsets[lst], self.offsets[lst + 1]
+            if start == end:
+                continue
+            # Непрерывный участок memory-map: читаются только страницы этого списка
+            scores.append(np.asarray(self.vectors[start:end], dtype=np.float32) @ weights + bias)
+            rows.append(self.rows[start:end])
+        if not scores:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        rows = np.concatenate(rows)
+        scores = np.concatenate(scores)
+        k = min(top_k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return rows[top].astype(np.int64), scores[top]
+
+    def disk_bytes(self) -> int:
+        return sum(path.stat().st_size for path in self.directory.iterdir() if path.is_file())
+
+    def stats(self) -> dict:
+        return {
+            "count": self.count,
+            "nlist": self.nlist,
+            "dtype": self.dtype,
+            "dims": self.dims,
+            "disk_mb": round(self.disk_bytes() / 2**20, 2),
+            "built_at": self.meta.get("built_at")
+        }
+
+
+def brute_force(matrix: np.ndarray, query: np.ndarray, top_k: int) -> tuple[np.ndarray, np.ndarray]:
+    """Эталон: полный перебор, как NanoVectorDB._cosine_query."""
+    scores = matrix @ normalize(np.asarray(query, dtype=np.float32))
+    k = min(top_k, len(scores))
+    top = np.argpartition(-scores, k - 1)[:k]
+    top = top[np.argsort(-scores[top])]
+    return top, scores[top]
+
+
+# ============================================================
+# ВЕКТОРНОЕ ХРАНИЛИЩЕ ДЛЯ LIGHTRAG
+# ============================================================
+
+if NanoVectorDBStorage is not None:
+
+    class IVFVectorDBStorage(NanoVectorDBStorage):
+        """NanoVectorDBStorage с IVF-индексом для query.
+
+        Параметры — vector_db_storage_cls_kwargs["ivf"]: nlist (0 — 4*sqrt(N)),
+        nprobe, min_rows (меньше — полный перебор быстрее), iterations,
+        rebuild_growth (доля строк, добавленных после построения, для перестройки),
+        dtype (float32 | float16 | int8 — хранение векторов индекса), dims
+        (Matryoshka: первые dims измерений в индексе, 0 — все), rescore
+        (кандидатов на top_k для переоценки по полноточной матрице, 0 — без неё).
+        """
+
+        def __post_init__(self):
+            super().__post_init__()
+            params = self.global_config.get("vector_db_storage_cls_kwargs", {}).get("ivf", {})
+            self.ivf_nlist = params.get("nlist", 0)
+            self.ivf_nprobe = params.get("nprobe", 16)
+            self.ivf_min_rows = params.get("min_rows", 5000)
+            self.ivf_iterations = params.get("iterations", 10)
+            self.ivf_rebuild_growth = params.get("rebuild_growth", 0.1)
+            self.ivf_dtype = params.get("dtype", "float32")
+            self.ivf_rescore = params.get("rescore", 4)
+            full_dims = self.embedding_func.embedding_dim
+            self.ivf_dims = min(params.get("dims", 0) or full_dims, full_dims)
+            self._index_dir = Path(self._client_file_name).with_suffix(".ivf")
+            self._index = None
+            self._index_client = None
+            self._index_data = None
+            self._checked = (None, None)
+            self._build_task = None
+            self.ivf_searches = 0
+            self.brute_searches = 0
+            self.last_build_seconds = None
+
+        @staticmethod
+        def _storage(client) -> dict:
+            return getattr(client, "_NanoVectorDB__storage")
+
+        def _attach(self, client) -> IVFIndex | None:
+            """Индекс для текущего клиента NanoVectorDB или None (тогда — полный перебор).
+
+            Индекс валиден, пока клиент и список строк те же: NanoVectorDB
+            дописывает новые строки в конец и обновляет существующие на месте,
+            а удаление и перечитывание с диска создают новые объекты.
+            """
+            data = self._storage(client)["data"]
+            if self._index is not None and self._index_client is client and self._index_data is data:
+                return self._index
+            if self._checked != (client, data):
+                # Первый запрос после (пере)загрузки: индекс с диска, если он про эти же строки
+                self._checked = (client, data)
+                index = IVFIndex.load(self._index_dir)
+                if (
+                    index is not None
+                    and index.dtype == self.ivf_dtype
+                    and index.dims == self.ivf_dims
+                    and index.count <= len(data)
+                    and index.fingerprint == ids_fingerprint(row["__id__"] for row in data[:index.count])
+                ):
+                    self._index, self._index_client, self._index_data = index, client, data
+                    return index
+                self._index = None
+                self._schedule_build(client)
+            return None
+
+        def _schedule_build(self, client):
+            if self._build_task is not None and not self._build_task.done():
+                return
+            storage = self._storage(client)
+            data = storage["data"]
+            if len(data) < self.ivf_min_rows:
+                return
+            # Копия: пока индекс строится в потоке, клиент продолжает обновляться
+            matrix = np.array(storage["matrix"], dtype=np.float32)
+            ids = [row["__id__"] for row in data]
+            self._build_task = asyncio.create_task(self._build(client, data, matrix, ids))
+
+        async def _build(self, client, data: list, matrix: np.ndarray, ids: list[str]):
+            started = time.perf_counter()
+            try:
+                index = await asyncio.to_thread(
+                    IVFIndex.build, self._index_dir, matrix, ids,
+                    nlist=self.ivf_nlist, iterations=self.ivf_iterations,
+                    dtype=self.ivf_dtype, dims=self.ivf_dims
+                )
+            except Exception as e:
+                logging.warning(f"[IVF] {self.namespace}: index build failed: {e}")
+                return
+            self.last_build_seconds = time.perf_counter() - started
+            if self._client is client and self._storage(client)["data"] is data:
+                self._index, self._index_client, self._index_data = index, client, data
+                self._checked = (client, data)
+            logging.info(
+                f"[IVF] {self.namespace}: index built for {index.count} vectors, nlist={index.nlist}, "
+                f"{index.dtype} x {index.dims}d in {self.last_build_seconds:.2f}s"
+            )
+
+        async def query(self, query: str, top_k: int, query_embedding: list[float] = None) -> list[dict]:
+            if query_embedding is None:
+                embedding = await self.embedding_func([query], context="query", _priority=DEFAULT_QUERY_PRIORITY)
+                query_embedding = embedding[0]
+
+            client = await self._get_client()
+            index = self._attach(client)
+            if index is None:
+                self.brute_searches += 1
+                return await super().query(query, top_k, query_embedding=query_embedding)
+
+            self.ivf_searches += 1
+            storage = self._storage(client)
+            matrix, data = storage["matrix"], storage["data"]
+            vector = normalize(np.asarray(query_embedding, dtype=np.float32))
+            pool = top_k * self.ivf_rescore if self.ivf_rescore > 0 else top_k
+            rows, approx = index.search(vector, pool, self.ivf_nprobe)
+            # Строки, добавленные после построения индекса, — перебором
+            tail = np.arange(index.count, len(data))
+            candidates = np.concatenate([rows, tail])
+            if self.ivf_rescore > 0:
+                # Оценки по живой полноточной матрице: исправляют ошибку квантования
+                # и учитывают векторы, обновлённые на месте после построения
+                scores = matrix[candidates] @ vector
+            else:
+                scores = np.concatenate([approx, matrix[tail] @ vector])
+            order = np.argsort(-scores)[:top_k]
+
+            results = []
+            for row, score in zip(candidates[order].tolist(), scores[order].tolist()):
+                if score < self.cosine_better_than_threshold:
+                    break
+                dp = data[row]
+                results.append({
+                    **{k: v for k, v in dp.items() if k not in ("vector", WRITE_SEQ_FIELD)},
+                    "id": dp["__id__"],
+                    "distance": score,
+                    "created_at": dp.get("__created_at__")
+                })
+            return results
+
+        async def index_done_callback(self) -> bool:
+            result = await super().index_done_callback()
+            # Индекса нет (хранилище доросло до min_rows), он устарел или в хвосте
+            # (перебор) слишком много строк — перестраиваем в фоне
+            data = self._storage(self._client)["data"]
+            index = self._attach(self._client)
+            if index is None or len(data) - index.count > self.ivf_rebuild_growth * index.count:
+                self._schedule_build(self._client)
+            return result
+
+        def ivf_stats(self) -> dict:
+            return {
+                "index": self._index.stats() if self._index is not None else None,
+                "nprobe": self.ivf_nprobe,
+                "rescore": self.ivf_rescore,
+                "ivf_searches": self.ivf_searches,
+                "brute_searches": self.brute_searches,
+                "building": self._build_task is not None and not self._build_task.done(),
+                "last_build_seconds": round(self.last_build_seconds, 2) if self.last_build_seconds else None
+            }
+
+
+def register_storage() -> bool:
+    """Регистрирует IVFVectorDBStorage в реестре хранилищ LightRAG (как csr_graph)."""
+    if NanoVectorDBStorage is None:
+        return False
+    try:
+        from lightrag import kg
+    except ImportError:
+        return False
+    implementations = kg.STORAGE_IMPLEMENTATIONS["VECTOR_STORAGE"]["implementations"]
+    if STORAGE_NAME not in implementations:
+        implementations.append(STORAGE_NAME)
+    kg.STORAGE_ENV_REQUIREMENTS.setdefault(STORAGE_NAME, [])
+    kg.STORAGES[STORAGE_NAME] = "vector_index"
+    return True